@@ -0,0 +1,253 @@
+"""
+Adaptive resolution and frame rate for the UDP camera streams.
+
+The base measures what the link actually delivers (LinkMonitor) and a
+RateController picks a rung from a ladder of resolution/fps settings. Rate
+changes are sent to the robot as small control datagrams, which the capture
+loops pick up on their next frame, so nothing has to be relaunched.
+
+The controller steps down quickly when queueing delay or frame drops grow and
+steps up slowly once the link has been clean for a while. Each step down
+doubles the time it must wait before trying the same step up again, which
+keeps it from oscillating around a rung the link cannot sustain.
+"""
+import collections
+import multiprocessing
+import socket
+import struct
+import threading
+import time
+
+from latency import PING, PING_MAGIC, answer_ping
+
+Rung = collections.namedtuple("Rung", "width height fps")
+
+# Highest quality first
+DEFAULT_LADDER = [
+    Rung(1440, 1440, 30),
+    Rung(1440, 1440, 20),
+    Rung(1080, 1080, 30),
+    Rung(1080, 1080, 20),
+    Rung(720, 720, 20),
+    Rung(720, 720, 10),
+    Rung(480, 480, 10),
+]
+
+# Offset from the frame port of the robot's rate control port
+CONTROL_PORT_OFFSET = 1
+
+CONTROL = struct.Struct("!4sHHf")
+CONTROL_MAGIC = b"RATE"
+
+
+class LinkMonitor(object):
+    """
+    Frame observer for FrameReceiver that summarises the link once per
+    sample() call: delivered bytes/s, frame drop ratio and queueing delay.
+
+    Queueing delay is the one way delay of each frame minus the smallest one
+    way delay seen so far. The clock offset between robot and base cancels
+    out, so no clock synchronisation is needed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._base_delay = None
+        self._reset(time.monotonic())
+
+    def _reset(self, now):
+        self._started = now
+        self._bytes = 0
+        self._frames = 0
+        self._drops = 0
+        self._max_queue = 0.0
+
+    def delivered(self, stream, nbytes, stamps):
+        delay = stamps.received - stamps.sent
+        with self._lock:
+            if self._base_delay is None or delay < self._base_delay:
+                self._base_delay = delay
+            self._bytes += nbytes
+            self._frames += 1
+            self._max_queue = max(self._max_queue, delay - self._base_delay)
+
+    def dropped(self, stream):
+        with self._lock:
+            self._drops += 1
+
+    def sample(self):
+        '''Return the stats since the last sample and start a new window'''
+        now = time.monotonic()
+        with self._lock:
+            elapsed = max(now - self._started, 1e-6)
+            total = self._frames + self._drops
+            stats = {
+                "throughput": self._bytes / elapsed,
+                "fps": self._frames / elapsed,
+                "drop_ratio": float(self._drops) / total if total else 0.0,
+                "queue_delay": self._max_queue,
+                "frames": self._frames,
+            }
+            self._reset(now)
+        return stats
+
+
+class RateController(object):
+    """
+    Chooses a rung of the ladder from successive LinkMonitor samples.
+
+    The controller steps down after down_after consecutive congested samples
+    (queueing delay above high_delay and not shrinking, or drop ratio above
+    high_drops), and up after a clean streak (delay below low_delay, drops
+    below low_drops) of up_after samples times the current backoff for that
+    rung. After a step down, frames of the faster rung are still queued on
+    the link for as long as the queueing delay was, so congestion is not
+    counted for that long. clock gives the time of a sample, time.monotonic
+    by default.
+    """
+
+    def __init__(self, ladder=DEFAULT_LADDER, apply=None, start=0,
+                 high_delay=0.15, low_delay=0.04, high_drops=0.1, low_drops=0.01,
+                 down_after=2, up_after=5, clock=time.monotonic):
+        self.ladder = ladder
+        self.apply = apply
+        self.index = start
+        self.high_delay = high_delay
+        self.low_delay = low_delay
+        self.high_drops = high_drops
+        self.low_drops = low_drops
+        self.down_after = down_after
+        self.up_after = up_after
+        self.clock = clock
+        self._bad = 0
+        self._good = 0
+        self._last_delay = 0.0
+        self._hold_until = None
+        # Multiplier on up_after for stepping back up into each rung
+        self._backoff = [1] * len(ladder)
+
+    @property
+    def rung(self):
+        return self.ladder[self.index]
+
+    def update(self, stats):
+        '''Feed one sample; returns the new Rung if it changed, else None'''
+        if stats["frames"] == 0 and stats["drop_ratio"] == 0.0:
+            # Nothing was sent, so there is nothing to judge the link by.
+            return None
+        # A queue that is shrinking is what a faster rung left behind draining
+        # away; judging this rung by it would step down one rung too many.
+        draining = stats["queue_delay"] < self._last_delay
+        self._last_delay = stats["queue_delay"]
+        now = self.clock()
+        holding = self._hold_until is not None and now < self._hold_until
+        congested = not holding and (
+                (stats["queue_delay"] > self.high_delay and not draining)
+                or stats["drop_ratio"] > self.high_drops)
+        clean = (stats["queue_delay"] < self.low_delay
+                 and stats["drop_ratio"] < self.low_drops)
+        if congested:
+            self._bad += 1
+            self._good = 0
+        elif clean:
+            self._good += 1
+            self._bad = 0
+        else:
+            self._bad = self._good = 0
+
+        if self._bad >= self.down_after and self.index < len(self.ladder) - 1:
+            # The rung we are leaving could not be sustained; be slower to
+            # come back to it next time.
+            self._backoff[self.index] = min(self._backoff[self.index] * 2, 32)
+            self._hold_until = now + stats["queue_delay"]
+            return self._move(self.index + 1)
+        if self.index > 0 and self._good >= self.up_after * self._backoff[self.index - 1]:
+            return self._move(self.index - 1)
+        return None
+
+    def _move(self, index):
+        self.index = index
+        self._bad = self._good = 0
+        if self.apply is not None:
+            self.apply(self.rung)
+        return self.rung
+
+
+#######################################
+# Control channel
+#######################################
+def send_rate(sock, address, rung):
+    sock.sendto(CONTROL.pack(CONTROL_MAGIC, rung.width, rung.height, rung.fps), address)
+
+
+class StreamSettings(object):
+    """
+    Resolution and fps the robot's capture loops should currently use. A
+    width or height of 0 means the camera's native size. The same port also
+    answers the base's clock sync pings (see latency.ClockSync).
+    """
+
+    def __init__(self, width=0, height=0, fps=30):
+        self.rung = Rung(width, height, fps)
+
+    def listen(self, port):
+        '''Apply rate changes arriving on port; runs on a daemon thread'''
+        thread = threading.Thread(target=self._listen, args=(port,), daemon=True)
+        thread.start()
+        return thread
+
+    def _listen(self, port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("0.0.0.0", port))
+        while True:
+            data, address = sock.recvfrom(max(CONTROL.size, PING.size))
+            if len(data) == PING.size and data.startswith(PING_MAGIC):
+                answer_ping(sock, data, address)
+                continue
+            if len(data) != CONTROL.size:
+                continue
+            magic, width, height, fps = CONTROL.unpack(data)
+            rung = Rung(width, height, fps)
+            if magic == CONTROL_MAGIC and fps > 0 and rung != self.rung:
+                # Replacing the tuple is atomic, so readers need no lock.
+                self.rung = rung
+                print("Stream rate set to {}x{} @ {:g} fps".format(width, height, fps))
+
+
+class SharedStreamSettings(StreamSettings):
+    """
+    StreamSettings whose rung lives in shared memory, so capture loops in
+    processes forked after it was made follow the rate the parent receives.
+    """
+
+    def __init__(self, width=0, height=0, fps=30):
+        self._shared = multiprocessing.Array("d", 3)
+        StreamSettings.__init__(self, width, height, fps)
+
+    @property
+    def rung(self):
+        with self._shared.get_lock():
+            width, height, fps = self._shared[:]
+        return Rung(int(width), int(height), fps)
+
+    @rung.setter
+    def rung(self, rung):
+        with self._shared.get_lock():
+            self._shared[:] = [rung.width, rung.height, rung.fps]
+
+
+def control_loop(receiver, monitor, controller, control_port, interval=1.0):
+    '''
+    Sample the link every interval seconds and tell whichever robot the
+    frames are coming from which rate to use. The current rate is resent
+    every time, so a lost control datagram is corrected a second later.
+    Blocks forever.
+    '''
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    while True:
+        time.sleep(interval)
+        rung = controller.update(monitor.sample())
+        if rung is not None:
+            print("Link changed, asking for {}x{} @ {:g} fps".format(*rung))
+        if receiver.peer is not None:
+            send_rate(sock, (receiver.peer[0], control_port), controller.rung)
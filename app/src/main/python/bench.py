@@ -0,0 +1,297 @@
+"""
+Measurements of the camera path and the tools around it, kept apart from
+the commands in cli.py that run the system. Run from app/src/main/python:
+
+    python bench.py pipeline --bandwidth 50 --rtt 80 --loss 1
+    python bench.py pipeline --scaling
+    python bench.py sync --jitter 15 --loss 2
+    python bench.py shared-frames
+    python bench.py replay
+    python bench.py sched-profile
+    python bench.py display-layout
+    python bench.py robot-ssh --host robot
+    python bench.py remap
+    python bench.py find-cameras
+    python bench.py supervise
+    python bench.py health
+    python bench.py config
+
+Each prints what the module's benchmark() returns; see there for what is
+measured and how.
+"""
+import argparse
+import os
+import sys
+
+from cli import positive_int
+
+
+def pipeline(args):
+    import pipeline_bench
+
+    config = {name: getattr(args, name) for name in pipeline_bench.DEFAULT_CONFIG}
+    if args.scaling:
+        del config["cameras"], config["camera_processes"]
+        results = pipeline_bench.scaling(**config)
+        print("{} cores".format(results.pop("cores")))
+        for mode, runs in sorted(results.items()):
+            for cameras, result in sorted(runs.items()):
+                print("{:<9} {} camera(s): {}".format(mode, cameras, result))
+        return 0
+    pipeline_bench.main(config, output=args.output)
+    return 0
+
+
+def sync(args):
+    import frame_sync
+
+    result = frame_sync.simulate(fps=args.fps, duration=args.duration,
+                                 jitter=args.jitter / 1000.0, loss=args.loss / 100.0,
+                                 seed=args.seed)
+    for name, value in result.items():
+        print("{:<18} {}".format(name, value))
+    return 0
+
+
+def shared_frames(args):
+    import frame_share
+
+    results = frame_share.benchmark(consumers=args.consumers, duration=args.duration)
+    for mode in ("shared", "copies"):
+        for consumers, result in sorted(results[mode].items()):
+            print("{:<7} {} consumer(s): {}".format(mode, consumers, result))
+    print("shared with one consumer at 200 ms a frame: {}".format(results["slow"]))
+    return 0
+
+
+def replay(args):
+    import recording
+
+    results = recording.benchmark(args.directory, duration=args.duration)
+    for name, value in results.items():
+        print("{:<20} {}".format(name, value))
+    return 0
+
+
+def sched_profile(args):
+    import sched_profile
+
+    results = sched_profile.benchmark(cameras=args.cameras, load=args.load,
+                                      duration=args.duration, hot_cores=args.hot_cores)
+    for profile, result in results.items():
+        print("{:<9} {}".format(profile, result))
+    return 0
+
+
+def display_layout(args):
+    import display_layout
+
+    results = display_layout.benchmark(headsets=args.headsets)
+    for count, result in sorted(results.items()):
+        print("{} headset(s): {}".format(count, result))
+    return 0
+
+
+def robot_ssh(args):
+    import config_store
+    import getpass
+    import ssh_pool
+
+    user = args.user or config_store.get("ROBOT_USERNAME") or getpass.getuser()
+    host = args.host or config_store.get("ROBOT_HOSTNAME") or "localhost"
+    results = ssh_pool.benchmark(user, host, repeats=args.repeats)
+    print("master channel opened in {} ms".format(results.pop("open_ms")))
+    for mode, result in sorted(results.items()):
+        print("{:<7} launch and kill: {}".format(mode, result))
+    return 0
+
+
+def remap(args):
+    import fisheye_remap
+
+    threads = args.threads or sorted({1, 2, os.cpu_count() or 1})
+    results = fisheye_remap.benchmark((args.width, args.height), threads=threads,
+                                      duration=args.duration)
+    print("table: built in {}s, mapped from the cache in {}s".format(
+        results.pop("build_s"), results.pop("load_s")))
+    for count, fps in sorted(results.items()):
+        print("{} thread(s): {} frames/s".format(count, fps))
+    return 0
+
+
+def find_cameras(args):
+    import camera_discovery
+
+    for cameras, others in ((2, 8), (8, 32)):
+        result = camera_discovery.benchmark(cameras, others)
+        print("{} cameras, {} other devices (us): {}".format(cameras, others, result))
+    return 0
+
+
+def supervise(args):
+    import supervisor
+
+    result = supervisor.benchmark()
+    print("respawn: first {:.1f} ms, then {} ms plus backoff".format(
+        result["first_respawn"] * 1000,
+        " ".join("{:.1f}".format(t * 1000) for t in result["respawn"])))
+    print("teardown: {:.3f}s, {:.3f}s if SIGTERM is ignored".format(
+        result["teardown"], result["teardown_ignoring_term"]))
+    return 0
+
+
+def health(args):
+    import health
+
+    for processes in (10, 50, 200):
+        print("{} processes: {:.2f} ms per reading".format(
+            processes, health.benchmark(processes) * 1000))
+    return 0
+
+
+def config(args):
+    import config_store
+
+    if not config_store.load(args.file):
+        print("No configuration at {}".format(args.file))
+        return 1
+    first, cached = config_store.benchmark(args.file)
+    print("read: first {:.1f} us, cached {:.2f} us".format(first, cached))
+    return 0
+
+
+def main(argv):
+    import config_store
+
+    parser = argparse.ArgumentParser(prog="bench.py")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    bench = commands.add_parser(
+            "pipeline",
+            help="measure the camera path on this machine with synthetic cameras "
+                 "and an emulated link")
+    bench.add_argument("--cameras", type=int, default=2)
+    bench.add_argument("--width", type=int, default=1440)
+    bench.add_argument("--height", type=int, default=1440)
+    bench.add_argument("--fps", type=float, default=30)
+    bench.add_argument("--codec", choices=["zlib", "jpeg"], default="zlib",
+                       help="frame encoding; jpeg needs OpenCV")
+    bench.add_argument("--quality", type=int, default=80, help="JPEG quality")
+    bench.add_argument("--duration", type=float, default=10, help="seconds")
+    bench.add_argument("--bandwidth", type=float, default=0,
+                       help="link bandwidth in Mbit/s (0 for unlimited)")
+    bench.add_argument("--rtt", type=float, default=0, help="link round trip in ms")
+    bench.add_argument("--jitter", type=float, default=0, help="one way jitter in ms")
+    bench.add_argument("--loss", type=float, default=0, help="datagram loss in percent")
+    bench.add_argument("--adaptive", action="store_true",
+                       help="let the base adapt resolution and fps to the link")
+    bench.add_argument("--capture-mode", choices=["freshest", "queue"], default="freshest")
+    bench.add_argument("--queue-size", type=int, default=100,
+                       help="frames buffered per camera in queue mode")
+    bench.add_argument("--camera-threads", dest="camera_processes", action="store_false",
+                       help="capture every camera on a thread of one robot process "
+                            "instead of a process each")
+    bench.add_argument("--scaling", action="store_true",
+                       help="run with 1, 2, 4 and 8 cameras, as processes and as threads")
+    bench.add_argument("--stall", type=float, default=0,
+                       help="ms the robot's encoder stalls once a second")
+    bench.add_argument("--port", type=int, default=5700,
+                       help="first of three local UDP ports to use")
+    bench.add_argument("--seed", type=int, default=1)
+    bench.add_argument("--output", help="write the JSON results here")
+    bench.set_defaults(func=pipeline)
+
+    pairing = commands.add_parser(
+            "sync",
+            help="simulate pairing the front and rear streams under network jitter "
+                 "and loss")
+    pairing.add_argument("--fps", type=float, default=30)
+    pairing.add_argument("--duration", type=float, default=60, help="simulated seconds")
+    pairing.add_argument("--jitter", type=float, default=5, help="mean jitter in ms")
+    pairing.add_argument("--loss", type=float, default=0, help="frame loss in percent")
+    pairing.add_argument("--seed", type=int, default=1)
+    pairing.set_defaults(func=sync)
+
+    shared = commands.add_parser(
+            "shared-frames",
+            help="time handing synthetic 1440x1440 frames to local consumers "
+                 "through a shared ring and as copies")
+    shared.add_argument("--consumers", type=int, nargs="+", default=[1, 2, 4],
+                        help="consumer counts to benchmark")
+    shared.add_argument("--duration", type=float, default=5.0,
+                        help="seconds of frames per run")
+    shared.set_defaults(func=shared_frames)
+
+    play = commands.add_parser(
+            "replay",
+            help="time recording and replaying synthetic 1440x1440 streams")
+    play.add_argument("directory", nargs="?",
+                      help="where to record (default a temporary directory)")
+    play.add_argument("--duration", type=float, default=10.0,
+                      help="seconds of streams to record")
+    play.set_defaults(func=replay)
+
+    profile = commands.add_parser(
+            "sched-profile",
+            help="compare the frame interval jitter of synthetic cameras under load "
+                 "with each scheduling profile")
+    profile.add_argument("--cameras", type=int, default=2)
+    profile.add_argument("--load", type=int,
+                         help="busy processes (default twice the cores)")
+    profile.add_argument("--duration", type=float, default=10.0,
+                         help="seconds per profile")
+    profile.add_argument("--hot-cores", type=int,
+                         help="cores for capture and streaming (default half of them)")
+    profile.set_defaults(func=sched_profile)
+
+    layout = commands.add_parser(
+            "display-layout",
+            help="time laying out dummy HMD windows, e.g. on an Xvfb")
+    layout.add_argument("--headsets", type=positive_int, nargs="+", default=[1, 2, 4, 8],
+                        help="headset counts to benchmark")
+    layout.set_defaults(func=display_layout)
+
+    robot = commands.add_parser(
+            "robot-ssh",
+            help="compare launch and kill round trips over new ssh connections and "
+                 "the shared channel, e.g. against a local sshd")
+    robot.add_argument("--host", help="default ROBOT_HOSTNAME, or localhost")
+    robot.add_argument("--user", help="default ROBOT_USERNAME, or you")
+    robot.add_argument("--repeats", type=int, default=10, help="round trips per mode")
+    robot.set_defaults(func=robot_ssh)
+
+    stitch = commands.add_parser(
+            "remap",
+            help="time remapping synthetic fisheye pairs with 1 and more threads")
+    stitch.add_argument("--width", type=int, default=1440, help="fisheye frame width")
+    stitch.add_argument("--height", type=int, default=1440, help="fisheye frame height")
+    stitch.add_argument("--threads", type=positive_int, nargs="+",
+                        help="thread counts (default 1, 2 and every core)")
+    stitch.add_argument("--duration", type=float, default=3.0,
+                        help="seconds per thread count")
+    stitch.set_defaults(func=remap)
+
+    cameras = commands.add_parser(
+            "find-cameras", help="time camera discovery on a fake sysfs")
+    cameras.set_defaults(func=find_cameras)
+
+    watch = commands.add_parser(
+            "supervise", help="time respawn and teardown with fake processes")
+    watch.set_defaults(func=supervise)
+
+    sample = commands.add_parser(
+            "health", help="time a health reading with fake processes")
+    sample.set_defaults(func=health)
+
+    settings = commands.add_parser(
+            "config", help="time reading the configuration the installer wrote")
+    settings.add_argument("--file", default=config_store.CONFIG_FILE)
+    settings.set_defaults(func=config)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
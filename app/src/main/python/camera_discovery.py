@@ -0,0 +1,245 @@
+"""
+Camera discovery from sysfs.
+
+Scans /sys/class/video4linux once, reads the vendor, product and serial of
+the USB device behind every capture node, and keeps the cameras that match
+the configured rules. The result is cached; watch() then applies hotplug
+events incrementally instead of rescanning.
+"""
+import collections
+import os
+import re
+import shutil
+import tempfile
+import time
+
+from uevent import UeventMonitor
+
+Camera = collections.namedtuple(
+        "Camera", "devnode index vendor product serial name usb_path")
+
+# The 360 cameras we ship with are Kodak PIXPRO units. Kodak's USB vendor id
+# is 040a; the serial match keeps working if the cameras come up through a
+# different vendor id.
+DEFAULT_RULES = [
+    {"vendor": "040a"},
+    {"serial": "KODAK"},
+]
+
+VIDEO_NODE = re.compile(r"^video(\d+)$")
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def parse_rule(text):
+    '''
+    Parse a command line rule such as "vendor=040a,serial=KODAK" into the
+    dict form used by CameraDiscovery.
+    '''
+    rule = {}
+    for part in text.split(","):
+        key, sep, value = part.partition("=")
+        if not sep or key not in ("vendor", "product", "serial", "name"):
+            raise ValueError("Bad camera rule: {}".format(text))
+        rule[key] = value
+    return rule
+
+
+class CameraDiscovery(object):
+    """
+    Finds capture devices whose USB identity matches one of the rules.
+
+    A rule is a dict with any of the keys vendor, product (exact USB ids,
+    hex), serial and name (case-insensitive substrings). A camera matches a
+    rule when every key in it matches, and is kept when any rule matches.
+    """
+
+    def __init__(self, rules=None, sysfs_root="/sys", dev_root="/dev"):
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.sysfs_root = sysfs_root
+        self.dev_root = dev_root
+        self._cameras = None
+
+    def cameras(self):
+        '''Return the matching cameras ordered by USB port, scanning once'''
+        if self._cameras is None:
+            self._cameras = {}
+            class_dir = os.path.join(self.sysfs_root, "class", "video4linux")
+            try:
+                nodes = os.listdir(class_dir)
+            except OSError:
+                nodes = []
+            for node in nodes:
+                camera = self._probe(node)
+                if camera is not None:
+                    self._cameras[node] = camera
+        return sorted(self._cameras.values(), key=lambda c: (c.usb_path, c.index))
+
+    def rescan(self):
+        self._cameras = None
+        return self.cameras()
+
+    def _probe(self, node):
+        match = VIDEO_NODE.match(node)
+        if match is None:
+            return None
+        node_dir = os.path.join(self.sysfs_root, "class", "video4linux", node)
+        # UVC cameras expose a metadata node next to the capture node; only
+        # the first node (index 0) delivers frames.
+        if _read(os.path.join(node_dir, "index")) not in ("", "0"):
+            return None
+        usb_dir = self._usb_device(os.path.realpath(os.path.join(node_dir, "device")))
+        if usb_dir is None:
+            return None
+        camera = Camera(
+                devnode=os.path.join(self.dev_root, node),
+                index=int(match.group(1)),
+                vendor=_read(os.path.join(usb_dir, "idVendor")),
+                product=_read(os.path.join(usb_dir, "idProduct")),
+                serial="_".join(filter(None, [
+                    _read(os.path.join(usb_dir, "manufacturer")),
+                    _read(os.path.join(usb_dir, "product")),
+                    _read(os.path.join(usb_dir, "serial"))])).replace(" ", "_"),
+                name=_read(os.path.join(node_dir, "name")),
+                usb_path=os.path.basename(usb_dir))
+        return camera if self.matches(camera) else None
+
+    def _usb_device(self, path):
+        '''Walk up from an interface to the USB device that owns it'''
+        while path and path != os.path.dirname(path):
+            if os.path.isfile(os.path.join(path, "idVendor")):
+                return path
+            path = os.path.dirname(path)
+        return None
+
+    def matches(self, camera):
+        for rule in self.rules:
+            if "vendor" in rule and rule["vendor"].lower() != camera.vendor.lower():
+                continue
+            if "product" in rule and rule["product"].lower() != camera.product.lower():
+                continue
+            if "serial" in rule and rule["serial"].lower() not in camera.serial.lower():
+                continue
+            if "name" in rule and rule["name"].lower() not in camera.name.lower():
+                continue
+            return True
+        return False
+
+    def handle_uevent(self, event):
+        '''
+        Apply one video4linux uevent to the cache. Returns ("add", camera)
+        or ("remove", camera) when the camera list changed, otherwise None.
+        '''
+        if event.get("SUBSYSTEM") != "video4linux":
+            return None
+        self.cameras()
+        node = os.path.basename(event["DEVPATH"])
+        if event["ACTION"] == "add":
+            camera = self._probe(node)
+            if camera is not None:
+                self._cameras[node] = camera
+                return ("add", camera)
+        elif event["ACTION"] == "remove":
+            camera = self._cameras.pop(node, None)
+            if camera is not None:
+                return ("remove", camera)
+        return None
+
+    def watch(self, callback, monitor=None):
+        '''
+        Call callback(action, camera) for every camera that comes or goes.
+        Blocks forever; run it on its own thread.
+        '''
+        if monitor is None:
+            monitor = UeventMonitor(subsystems=["video4linux"])
+        self.cameras()
+        for event in monitor:
+            change = self.handle_uevent(event)
+            if change is not None:
+                callback(*change)
+
+
+#######################################
+# Benchmark
+#######################################
+def fake_sysfs(root, cameras=2, others=8):
+    '''
+    Lay out a sysfs under root with cameras Kodak cameras and others other
+    USB video devices, each with a capture and a metadata node, as UVC
+    devices have. Returns the DEVPATHs of the camera capture nodes.
+    '''
+    class_dir = os.path.join(root, "class", "video4linux")
+    os.makedirs(class_dir, exist_ok=True)
+    devpaths = []
+    for port in range(cameras + others):
+        kodak = port < cameras
+        usb = os.path.join("devices", "pci0000:00", "usb1", "1-{}".format(port + 1))
+        ids = {
+            "idVendor": "040a" if kodak else "046d",
+            "idProduct": "0e01" if kodak else "0825",
+            "manufacturer": "Kodak" if kodak else "Logitech",
+            "product": "PIXPRO SP360 4K" if kodak else "Webcam C270",
+            "serial": "SN{:04d}".format(port),
+        }
+        os.makedirs(os.path.join(root, usb), exist_ok=True)
+        for name, value in ids.items():
+            with open(os.path.join(root, usb, name), "w") as f:
+                f.write(value + "\n")
+        interface = os.path.join(usb, "1-{}:1.0".format(port + 1))
+        for index in range(2):
+            node = "video{}".format(2 * port + index)
+            node_dir = os.path.join(interface, "video4linux", node)
+            os.makedirs(os.path.join(root, node_dir), exist_ok=True)
+            with open(os.path.join(root, node_dir, "index"), "w") as f:
+                f.write("{}\n".format(index))
+            with open(os.path.join(root, node_dir, "name"), "w") as f:
+                f.write(ids["product"] + "\n")
+            os.symlink(os.path.join("..", ".."), os.path.join(root, node_dir, "device"))
+            os.symlink(os.path.join("..", "..", node_dir), os.path.join(class_dir, node))
+            if kodak and index == 0:
+                devpaths.append("/" + node_dir)
+    return devpaths
+
+
+def benchmark(cameras=2, others=8, repeats=200):
+    '''
+    Time discovery on a fake sysfs with cameras matching and others
+    non-matching USB video devices. Returns a dict in microseconds: "scan",
+    the first full scan; "cached", cameras() afterwards; "uevent", applying
+    one camera's remove and add uevents. "found" is the number of cameras
+    the scan found.
+    '''
+    root = tempfile.mkdtemp(prefix="crunch-sysfs-")
+    try:
+        devpaths = fake_sysfs(root, cameras, others)
+        discovery = CameraDiscovery(sysfs_root=root)
+        start = time.perf_counter()
+        found = discovery.cameras()
+        scan = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            discovery.cameras()
+        cached = (time.perf_counter() - start) / repeats
+
+        events = [{"ACTION": action, "SUBSYSTEM": "video4linux", "DEVPATH": devpaths[0]}
+                  for action in ("remove", "add")]
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for event in events:
+                discovery.handle_uevent(event)
+        uevent = (time.perf_counter() - start) / repeats / len(events)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return {
+        "found": len(found),
+        "scan": round(scan * 1e6, 1),
+        "cached": round(cached * 1e6, 2),
+        "uevent": round(uevent * 1e6, 1),
+    }
@@ -0,0 +1,144 @@
+"""
+Capture configuration for however many cameras the robot has.
+
+robot_launch.sh used to pick between a hand written one and two camera
+launch file. Now it asks `Project-Crunch camera-launch` for a launch file
+generated for the cameras find-cameras found:
+
+    Project-Crunch camera-launch --output ~/.cache/project-crunch/cameras.launch 3 5 7
+
+Every camera gets a video_stream_opencv node of its own, so a process of
+its own, in the namespace cameraN (N counting from 1, as the topics rviz
+subscribes to do), with the parameters single-cam.launch gives its one
+camera.
+
+Settings apply to every camera unless the configuration overrides them for
+one camera by number, e.g.
+
+    export CRUNCH_CAMERA2_WIDTH=1920
+    export CRUNCH_CAMERA2_FLIP_VERTICAL=true
+
+The UDP transport runs every camera in a process of its own in the same
+way (see camera_stream.stream_cameras) and takes each camera's capture mode
+and queue size from camera_configs(); its resolution and fps follow the
+adaptive rate, for all cameras at once.
+"""
+import collections
+import os
+from xml.sax.saxutils import quoteattr
+
+import config_store
+from frame_ring import FRESHEST
+
+LAUNCH_FILE = os.path.join(os.path.expanduser("~"), ".cache", "project-crunch",
+                           "cameras.launch")
+
+# One camera's settings; width and height 0 mean the camera's native size.
+CameraConfig = collections.namedtuple(
+        "CameraConfig",
+        "name device width height fps capture_mode queue_size "
+        "flip_horizontal flip_vertical camera_info_url")
+
+# Settings that can be overridden per camera, with the type of their value
+OVERRIDES = collections.OrderedDict([
+    ("width", int),
+    ("height", int),
+    ("fps", float),
+    ("capture_mode", str),
+    ("queue_size", int),
+    ("flip_horizontal", lambda value: value.lower() in ("1", "true", "yes")),
+    ("flip_vertical", lambda value: value.lower() in ("1", "true", "yes")),
+    ("camera_info_url", str),
+])
+
+
+def override_key(number, setting):
+    '''Configuration key overriding setting for camera number, e.g. CRUNCH_CAMERA2_WIDTH'''
+    return "CRUNCH_CAMERA{}_{}".format(number, setting.upper())
+
+
+def camera_configs(devices, width=0, height=0, fps=30.0, capture_mode=FRESHEST,
+                   queue_size=100, config_path=None):
+    '''
+    A CameraConfig for each of devices (video device numbers or stream
+    URLs), with the given settings and any per camera overrides from the
+    configuration
+    '''
+    configs = []
+    for number, device in enumerate(devices, 1):
+        settings = {
+            "width": width,
+            "height": height,
+            "fps": fps,
+            "capture_mode": capture_mode,
+            "queue_size": queue_size,
+            "flip_horizontal": False,
+            "flip_vertical": False,
+            "camera_info_url": "",
+        }
+        for setting, parse in OVERRIDES.items():
+            value = config_store.get(override_key(number, setting), path=config_path)
+            if value is not None:
+                try:
+                    settings[setting] = parse(value)
+                except ValueError:
+                    print("Ignoring {}={!r}".format(override_key(number, setting), value))
+        configs.append(CameraConfig(name="camera{}".format(number), device=str(device),
+                                    **settings))
+    return configs
+
+
+def _camera_group(camera, visualize):
+    # Freshest mode keeps one frame in the driver's queue, as in single-cam.launch.
+    queue_size = 1 if camera.capture_mode == FRESHEST else camera.queue_size
+    params = [
+        ("camera_name", "string", camera.name),
+        ("video_stream_provider", "string", camera.device),
+        ("set_camera_fps", "double", camera.fps),
+        ("buffer_queue_size", "int", queue_size),
+        ("fps", "double", camera.fps),
+        ("frame_id", "string", camera.name),
+        ("camera_info_url", "string", camera.camera_info_url),
+        ("flip_horizontal", "bool", str(camera.flip_horizontal).lower()),
+        ("flip_vertical", "bool", str(camera.flip_vertical).lower()),
+        ("width", "int", camera.width),
+        ("height", "int", camera.height),
+    ]
+    lines = ['    <group ns={}>'.format(quoteattr(camera.name)),
+             '        <node pkg="video_stream_opencv" type="video_stream" name={} '
+             'output="screen">'.format(quoteattr(camera.name + "_stream")),
+             '            <remap from="camera" to="image_raw" />']
+    for name, kind, value in params:
+        lines.append('            <param name="{}" type="{}" value={} />'.format(
+            name, kind, quoteattr(str(value))))
+    lines.append('        </node>')
+    if visualize:
+        lines.append('        <node name={} pkg="image_view" type="image_view">'.format(
+            quoteattr(camera.name + "_image_view")))
+        lines.append('            <remap from="image" to="image_raw" />')
+        lines.append('        </node>')
+    lines.append('    </group>')
+    return lines
+
+
+def launch_xml(configs, visualize=True):
+    '''roslaunch XML starting a video_stream_opencv node for each of configs'''
+    lines = ['<?xml version="1.0"?>',
+             '<!-- Generated by Project-Crunch camera-launch; changes are overwritten. -->',
+             '<launch>']
+    for camera in configs:
+        lines.extend(_camera_group(camera, visualize))
+    lines.append('</launch>')
+    return "\n".join(lines) + "\n"
+
+
+def write_launch(configs, path=LAUNCH_FILE, visualize=True):
+    '''Write launch_xml(configs) to path, all at once; returns path'''
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "w") as f:
+        f.write(launch_xml(configs, visualize))
+    os.replace(tmp, path)
+    return path
@@ -0,0 +1,285 @@
+"""
+Camera streaming over the UDP frame transport.
+
+stream_cameras() runs on the robot: it captures every camera with OpenCV in
+a process of its own, JPEG encodes the frames and sends each camera as its
+own stream.
+receive_cameras() runs on the base: it reassembles the frames and publishes
+them to ROS as /cameraN/image_raw/compressed for rviz. Unless disabled, the
+base also adapts the robot's resolution and fps to the measured link (see
+adaptive_rate). Every frame's end-to-end latency is recorded (see latency),
+and both sides count frames and bytes per stream for the health panel (see
+health).
+
+OpenCV and rospy are only needed on the side that uses them, so they are
+imported when the stream starts.
+"""
+import threading
+import time
+
+from adaptive_rate import (CONTROL_PORT_OFFSET, LinkMonitor, RateController,
+                           SharedStreamSettings, control_loop)
+from frame_ring import FRESHEST, frame_buffer
+from frame_transport import FrameReceiver, FrameSender
+from health import SAMPLE_INTERVAL, STREAM_STATS_FILE, StreamCounters
+from latency import LATENCY_FILE, ClockSync, LatencyRecorder
+from sched_profile import set_name
+
+DEFAULT_PORT = 5600
+# Seconds between capture statistics printouts
+STATS_INTERVAL = 10.0
+
+
+def _capture(capture, frames, device):
+    '''Read the camera as fast as it delivers into frames until it stops'''
+    while True:
+        ok, image = capture.read()
+        captured = time.time()
+        if not ok:
+            print("Camera {} stopped delivering frames".format(device))
+            frames.close()
+            return
+        frames.put(image, captured)
+
+
+def _capture_loop(device, sender, settings, quality, capture_mode, queue_size):
+    import cv2
+
+    rung = settings.rung
+    capture = cv2.VideoCapture(device)
+    if rung.width and rung.height:
+        capture.set(cv2.CAP_PROP_FRAME_WIDTH, rung.width)
+        capture.set(cv2.CAP_PROP_FRAME_HEIGHT, rung.height)
+    capture.set(cv2.CAP_PROP_FPS, rung.fps)
+    # Reading the camera on its own thread keeps the driver's buffers empty;
+    # the capture mode decides what happens to frames the encoder is too
+    # slow for.
+    frames = frame_buffer(capture_mode, queue_size)
+    threading.Thread(target=_capture, args=(capture, frames, device), daemon=True).start()
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+    next_frame = time.monotonic()
+    next_report = next_frame + STATS_INTERVAL
+    while True:
+        frame = frames.get()
+        if frame is None:
+            return
+        # The base may change the rate at any time; follow it by scaling
+        # and pacing here rather than reopening the camera.
+        rung = settings.rung
+        image = frame.image
+        if rung.width and rung.height and image.shape[:2] != (rung.height, rung.width):
+            image = cv2.resize(image, (rung.width, rung.height),
+                               interpolation=cv2.INTER_AREA)
+        ok, jpeg = cv2.imencode(".jpg", image, params)
+        if ok:
+            sender.send(jpeg.tobytes(), frame.captured)
+        now = time.monotonic()
+        if now > next_report:
+            print("Camera {}: {put} captured, {taken} sent, {dropped} dropped".format(
+                device, **frames.stats))
+            next_report = now + STATS_INTERVAL
+        next_frame += 1.0 / rung.fps
+        delay = next_frame - now
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_frame = now
+
+
+def _equirect_loop(devices, sender, settings, width, height, quality, threads):
+    import cv2
+    from fisheye_remap import FisheyeRemapper
+
+    captures = []
+    for device in devices:
+        capture = cv2.VideoCapture(device)
+        capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        capture.set(cv2.CAP_PROP_FPS, settings.rung.fps)
+        captures.append(capture)
+    remapper = FisheyeRemapper((width, height), threads=threads)
+    frames = remapper.input_buffer()
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+    next_frame = time.monotonic()
+    while True:
+        # Grab both first so the two exposures are as close as possible.
+        if not all(capture.grab() for capture in captures):
+            print("Cameras {} stopped delivering frames".format(devices))
+            return
+        captured = time.time()
+        for capture, frame in zip(captures, frames):
+            capture.retrieve(image=frame)
+        # The remap table is tied to the capture size, so only the rate
+        # follows the base here.
+        ok, jpeg = cv2.imencode(".jpg", remapper.remap(), params)
+        if ok:
+            sender.send(jpeg.tobytes(), captured)
+        next_frame += 1.0 / settings.rung.fps
+        delay = next_frame - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_frame = time.monotonic()
+
+
+class _SharedCounts(object):
+    """
+    Frame observer for a camera's FrameSender in a capture process: counts
+    frames and bytes in counts, a shared array the parent writes out.
+    """
+
+    def __init__(self, counts):
+        self.counts = counts
+
+    def sent(self, stream, nbytes):
+        with self.counts.get_lock():
+            self.counts[0] += 1
+            self.counts[1] += nbytes
+
+
+def _camera_process(host, port, stream, camera, settings, quality, counts):
+    set_name("crunch-" + camera.name)
+    sender = FrameSender(host, port, stream=stream, observers=[_SharedCounts(counts)])
+    device = int(camera.device) if camera.device.isdigit() else camera.device
+    _capture_loop(device, sender, settings, quality, camera.capture_mode, camera.queue_size)
+
+
+def stream_cameras(host, devices, port=DEFAULT_PORT, fps=30, width=0, height=0,
+                   quality=80, equirect=False, threads=1, capture_mode=FRESHEST,
+                   queue_size=100, stats_file=STREAM_STATS_FILE):
+    '''
+    Send every camera in devices to the base; blocks until they all stop.
+    Every camera is captured and encoded in a process of its own, with its
+    capture mode and queue size from camera_launch.camera_configs(). With
+    equirect, the front and rear cameras (devices[0] and devices[1]) are
+    stitched on the robot and sent as one equirectangular stream.
+    capture_mode is one of frame_ring.MODES: "freshest" always sends the
+    newest frame, "queue" sends every frame, up to queue_size behind.
+    '''
+    import multiprocessing
+    from camera_launch import camera_configs
+
+    set_name("crunch-stream")
+    # The control port is this process's; the capture processes follow the
+    # rate it receives through shared memory.
+    settings = SharedStreamSettings(width, height, fps)
+    settings.listen(port + CONTROL_PORT_OFFSET)
+    counters = StreamCounters(stats_file)
+    if equirect:
+        sender = FrameSender(host, port, stream=0, observers=[counters])
+        _equirect_loop(devices[:2], sender, settings, width or 1440, height or 1440,
+                       quality, threads)
+        return
+    cameras = camera_configs(devices, width, height, fps, capture_mode, queue_size)
+    counts = []
+    workers = []
+    for stream, camera in enumerate(cameras):
+        counts.append(multiprocessing.Array("q", 2))
+        process = multiprocessing.Process(target=_camera_process,
+                                          args=(host, port, stream, camera, settings,
+                                                quality, counts[-1]),
+                                          name=camera.name, daemon=True)
+        process.start()
+        workers.append(process)
+    while any(process.is_alive() for process in workers):
+        time.sleep(SAMPLE_INTERVAL)
+        for stream, shared in enumerate(counts):
+            with shared.get_lock():
+                counters.counts[stream] = [shared[0], shared[1], 0]
+        counters.write()
+
+
+class RosPublisher(object):
+    '''Publishes received JPEG frames as sensor_msgs/CompressedImage'''
+
+    def __init__(self):
+        import rospy
+        from sensor_msgs.msg import CompressedImage
+
+        self.rospy = rospy
+        self.message = CompressedImage
+        rospy.init_node("crunch_receiver", anonymous=True, disable_signals=True)
+        self.publishers = {}
+
+    def __call__(self, stream, frame_id, data):
+        publisher = self.publishers.get(stream)
+        if publisher is None:
+            topic = "/camera{}/image_raw/compressed".format(stream + 1)
+            publisher = self.publishers[stream] = self.rospy.Publisher(
+                    topic, self.message, queue_size=1)
+        msg = self.message()
+        msg.header.stamp = self.rospy.Time.now()
+        msg.header.seq = frame_id
+        msg.header.frame_id = "camera{}".format(stream + 1)
+        msg.format = "jpeg"
+        msg.data = data
+        publisher.publish(msg)
+
+
+def receive_cameras(port=DEFAULT_PORT, sink=None, adaptive=True,
+                    latency_file=LATENCY_FILE, stats_file=STREAM_STATS_FILE, record=None,
+                    share=False, sync=True, sync_tolerance=None):
+    '''
+    Receive camera streams and hand them to sink; blocks forever. With
+    record, every frame is also recorded to that directory (see recording).
+    With share, every frame is also decoded once into a shared ring for
+    local consumers (see frame_share). With sync, the front and rear
+    streams are handed on in pairs captured within sync_tolerance seconds
+    of each other (see frame_sync); the recording still gets every frame.
+    '''
+    set_name("crunch-receive")
+    if sink is None:
+        sink = RosPublisher()
+    if share:
+        from frame_share import FrameSharer
+
+        sharer = FrameSharer()
+        publish_shared = sink
+
+        def sink(stream, frame_id, data):
+            publish_shared(stream, frame_id, data)
+            sharer(stream, frame_id, data)
+    publish = sink
+
+    # Latency is recorded as frames are published rather than as the
+    # receiver hands them on, so the display stage includes the wait for a
+    # partner frame.
+    def display(stream, frame_id, data, stamps):
+        publish(stream, frame_id, data)
+        latency.delivered(stream, len(data), stamps._replace(displayed=time.time()))
+
+    if sync:
+        from frame_sync import FrameSynchronizer
+
+        # The stamps travel with the frame while it waits for its partner.
+        synchronizer = FrameSynchronizer(
+                lambda stream, frame_id, held, captured: display(stream, frame_id, *held),
+                tolerance=sync_tolerance)
+
+        def deliver(stream, frame_id, data, captured):
+            synchronizer.push(stream, frame_id, (data, receiver.stamps), captured)
+    else:
+        def deliver(stream, frame_id, data, captured):
+            display(stream, frame_id, data, receiver.stamps)
+    if record is not None:
+        from recording import Recorder
+
+        recorder = Recorder(record)
+        synchronized = deliver
+
+        def deliver(stream, frame_id, data, captured):
+            recorder(stream, frame_id, data)
+            synchronized(stream, frame_id, data, captured)
+    receiver = FrameReceiver(port, deliver, stamped=True)
+    clock = ClockSync(receiver, port + CONTROL_PORT_OFFSET)
+    clock.start()
+    latency = LatencyRecorder(latency_file, clock)
+    receiver.observers.append(StreamCounters(stats_file))
+    if adaptive:
+        monitor = LinkMonitor()
+        receiver.observers.append(monitor)
+        controller = RateController()
+        threading.Thread(target=control_loop,
+                         args=(receiver, monitor, controller, port + CONTROL_PORT_OFFSET),
+                         daemon=True).start()
+    receiver.run()
@@ -0,0 +1,408 @@
+"""
+Command line tools that run without the GUI, e.g. from robot_launch.sh:
+
+    Project-Crunch find-cameras
+    Project-Crunch stream-cameras --host base 0 1
+    Project-Crunch camera-launch --output cameras.launch 0 1 2
+    Project-Crunch receive-cameras --record ~/missions/today --share
+    Project-Crunch replay ~/missions/today --speed 2
+    Project-Crunch latency-report
+    Project-Crunch config
+    Project-Crunch launch --headsets 2
+    Project-Crunch supervise --name cameras -- roslaunch ...
+    Project-Crunch health
+    Project-Crunch shared-frames
+    Project-Crunch sched-profile --profile realtime --watch
+    Project-Crunch display-layout
+    Project-Crunch robot-ssh
+    Project-Crunch remap
+
+Measurements of these, e.g. how fast a camera is found or how long the
+supervisor takes to respawn a process, are in bench.py.
+"""
+import argparse
+import os
+import sys
+
+
+def resource(name):
+    '''
+    Path of one of the launcher's resource files. A frozen release keeps
+    them next to the executable; the repository keeps them in resources/base.
+    '''
+    if getattr(sys, "frozen", False):
+        return os.path.join(os.path.dirname(sys.executable), name)
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        os.pardir, "resources", "base", name)
+
+
+def positive_int(value):
+    '''argparse type for a count of at least one'''
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, not {}".format(number))
+    return number
+
+
+def launch(args):
+    from launcher import launch
+
+    return launch(resource("base_launch.sh"), headsets=args.headsets,
+                  check_headsets=not args.no_headset_check)
+
+
+def supervise(args):
+    from supervisor import supervise
+
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        print("Nothing to supervise")
+        return 1
+    return supervise(command, name=args.name)
+
+
+def health(args):
+    from health import report
+
+    report(interval=args.interval, count=args.count, session_file=args.session_file)
+    return 0
+
+
+def find_cameras(args):
+    from camera_discovery import CameraDiscovery, DEFAULT_RULES, parse_rule
+
+    rules = [parse_rule(rule) for rule in args.match] if args.match else DEFAULT_RULES
+    discovery = CameraDiscovery(rules)
+    for camera in discovery.cameras():
+        print(camera.devnode if args.paths else camera.index)
+    if args.watch:
+        def report(action, camera):
+            print("{} {}".format(action, camera.devnode), flush=True)
+        discovery.watch(report)
+    return 0
+
+
+def stream_cameras(args):
+    from camera_stream import stream_cameras
+
+    stream_cameras(args.host, args.devices, port=args.port, fps=args.fps,
+                   width=args.width, height=args.height, quality=args.quality,
+                   equirect=args.equirect, threads=args.threads,
+                   capture_mode=args.capture_mode, queue_size=args.queue_size)
+    return 0
+
+
+def camera_launch(args):
+    from camera_launch import camera_configs, write_launch
+
+    configs = camera_configs(args.devices, width=args.width, height=args.height, fps=args.fps,
+                             capture_mode=args.capture_mode, queue_size=args.queue_size)
+    if args.output is None:
+        from camera_launch import launch_xml
+
+        sys.stdout.write(launch_xml(configs, visualize=not args.no_view))
+        return 0
+    print(write_launch(configs, args.output, visualize=not args.no_view))
+    return 0
+
+
+def receive_cameras(args):
+    from camera_stream import receive_cameras
+
+    receive_cameras(port=args.port, adaptive=not args.fixed_rate,
+                    latency_file=args.latency_file, record=args.record, share=args.share,
+                    sync=not args.no_sync,
+                    sync_tolerance=args.sync_tolerance and args.sync_tolerance / 1000.0)
+    return 0
+
+
+def shared_frames(args):
+    import frame_share
+
+    rings = frame_share.rings()
+    if not rings:
+        print("No shared frame rings in {}".format(frame_share.SHARE_DIR))
+    for ring in rings:
+        print("{name:<12} {shape} frame {newest}, {readers} reader(s)".format(**ring))
+    return 0
+
+
+def replay(args):
+    import recording
+
+    if args.info:
+        try:
+            replayer = recording.Replayer(args.directory)
+        except ValueError as e:
+            print(e)
+            return 1
+        print("{} frames of streams {} in {} segments, {:.1f}s long".format(
+            len(replayer), replayer.streams(), len(replayer.segments),
+            replayer.end - replayer.start))
+        replayer.close()
+        return 0
+    try:
+        recording.replay_to(args.host, args.port, args.directory, speed=args.speed,
+                            start=args.start, loop=args.loop)
+    except ValueError as e:
+        print(e)
+        return 1
+    return 0
+
+
+def latency_report(args):
+    import time
+    from latency import read_stats, summary
+
+    try:
+        written, offset, histograms = read_stats(args.file)
+    except (OSError, ValueError) as e:
+        print("Could not read latency file: {}".format(e))
+        return 1
+    print("Written {:.0f}s ago, robot clock offset {:+.1f} ms".format(
+        time.time() - written, offset * 1000))
+    for line in summary(histograms):
+        print(line)
+    return 0
+
+
+def sched_profile(args):
+    import sched_profile
+
+    watcher = sched_profile.ProfileWatcher(args.profile, session_file=args.session_file,
+                                           hot_cores=args.hot_cores)
+    if not args.watch:
+        watcher.apply()
+        return 0
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def display_layout(args):
+    import display_layout
+
+    layout = display_layout.DisplayLayout()
+    try:
+        for monitor in layout.monitors():
+            print("{name:<10} {width}x{height}+{x}+{y}".format(**monitor._asdict()))
+        print("HMD windows: {}".format(", ".join(sorted(layout.hmd_windows())) or "none"))
+    finally:
+        layout.close()
+    return 0
+
+
+def robot_ssh(args):
+    import config_store
+    import getpass
+    import ssh_pool
+
+    user = args.user or config_store.get("ROBOT_USERNAME") or getpass.getuser()
+    host = args.host or config_store.get("ROBOT_HOSTNAME") or "localhost"
+    conn = ssh_pool.connection(user, host)
+    try:
+        print("{}@{}: {:.1f} ms".format(user, host, conn.round_trip() * 1000))
+    finally:
+        ssh_pool.close_all()
+    return 0
+
+
+def remap(args):
+    import time
+
+    import fisheye_remap
+
+    start = time.monotonic()
+    fisheye_remap.FisheyeRemapper((args.width, args.height)).close()
+    print("Remap table for {}x{} fisheye pairs ready in {:.2f}s".format(
+        args.width, args.height, time.monotonic() - start))
+    return 0
+
+
+def show_config(args):
+    import config_store
+
+    settings = config_store.load(args.file)
+    if not settings:
+        print("No configuration at {}".format(args.file))
+        return 1
+    for name, value in sorted(settings.items()):
+        print("{}={}".format(name, value))
+    return 0
+
+
+def main(argv):
+    import config_store
+    from health import SESSION_FILE
+    from latency import LATENCY_FILE
+
+    parser = argparse.ArgumentParser(prog="Project-Crunch")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    cameras = commands.add_parser(
+            "find-cameras",
+            help="print the video device number of every matching camera")
+    cameras.add_argument("--match", action="append", metavar="RULE",
+                         help="camera rule, e.g. vendor=040a or serial=KODAK "
+                              "(may be repeated)")
+    cameras.add_argument("--paths", action="store_true",
+                         help="print /dev paths instead of device numbers")
+    cameras.add_argument("--watch", action="store_true",
+                         help="keep running and print cameras as they come and go")
+    cameras.set_defaults(func=find_cameras)
+
+    stream = commands.add_parser(
+            "stream-cameras",
+            help="send cameras to the base over the UDP frame transport")
+    stream.add_argument("--host", required=True, help="base hostname or IP")
+    stream.add_argument("--port", type=int, default=5600)
+    stream.add_argument("--fps", type=float, default=30)
+    stream.add_argument("--width", type=int, default=0)
+    stream.add_argument("--height", type=int, default=0)
+    stream.add_argument("--quality", type=int, default=80, help="JPEG quality")
+    stream.add_argument("--equirect", action="store_true",
+                        help="stitch the front and rear fisheye cameras into one "
+                             "equirectangular stream on the robot")
+    stream.add_argument("--threads", type=int, default=1,
+                        help="cores to use for the equirectangular remap")
+    stream.add_argument("--capture-mode", choices=["freshest", "queue"], default="freshest",
+                        help="send the newest frame (dropping any the encoder is too "
+                             "slow for) or queue every frame")
+    stream.add_argument("--queue-size", type=int, default=100,
+                        help="frames buffered per camera in queue mode")
+    stream.add_argument("devices", nargs="+", type=int,
+                        help="video device numbers, as printed by find-cameras")
+    stream.set_defaults(func=stream_cameras)
+
+    generate = commands.add_parser(
+            "camera-launch",
+            help="write a roslaunch file with a capture node for each camera")
+    generate.add_argument("--output", help="launch file to write (default: print it)")
+    generate.add_argument("--width", type=int, default=0, help="0 for the native width")
+    generate.add_argument("--height", type=int, default=0, help="0 for the native height")
+    generate.add_argument("--fps", type=float, default=30)
+    generate.add_argument("--capture-mode", choices=["freshest", "queue"], default="freshest")
+    generate.add_argument("--queue-size", type=int, default=100,
+                          help="frames buffered per camera in queue mode")
+    generate.add_argument("--no-view", action="store_true",
+                          help="do not open an image_view window per camera")
+    generate.add_argument("devices", nargs="+",
+                          help="video device numbers, as printed by find-cameras, or "
+                               "stream URLs")
+    generate.set_defaults(func=camera_launch)
+
+    receive = commands.add_parser(
+            "receive-cameras",
+            help="receive UDP camera streams and publish them to ROS")
+    receive.add_argument("--port", type=int, default=5600)
+    receive.add_argument("--fixed-rate", action="store_true",
+                         help="do not adapt the robot's resolution and fps to the link")
+    receive.add_argument("--latency-file", default=LATENCY_FILE,
+                         help="where to write the latency histograms")
+    receive.add_argument("--record", metavar="DIRECTORY",
+                         help="also record every frame to this directory")
+    receive.add_argument("--no-sync", action="store_true",
+                         help="publish the front and rear cameras as they come "
+                              "instead of in pairs captured together")
+    receive.add_argument("--sync-tolerance", type=float, metavar="MS",
+                         help="most the capture times of a front and rear pair may "
+                              "differ (default half a frame interval)")
+    receive.add_argument("--share", action="store_true",
+                         help="also decode every frame once into shared memory for "
+                              "local consumers")
+    receive.set_defaults(func=receive_cameras)
+
+    shared = commands.add_parser(
+            "shared-frames",
+            help="list the shared frame rings of receive-cameras --share")
+    shared.set_defaults(func=shared_frames)
+
+    play = commands.add_parser(
+            "replay",
+            help="send a recording made with receive-cameras --record to "
+                 "receive-cameras, as if it came from the robot")
+    play.add_argument("directory")
+    play.add_argument("--host", default="127.0.0.1", help="where receive-cameras runs")
+    play.add_argument("--port", type=int, default=5600)
+    play.add_argument("--speed", type=float, default=1.0,
+                      help="replay speed, 1 for real time, 0 for as fast as possible")
+    play.add_argument("--start", type=float, help="seconds into the recording to start at")
+    play.add_argument("--loop", action="store_true", help="start over at the end")
+    play.add_argument("--info", action="store_true",
+                      help="print what is in the recording instead")
+    play.set_defaults(func=replay)
+
+    report = commands.add_parser(
+            "latency-report",
+            help="print the frame latency percentiles written by receive-cameras")
+    report.add_argument("--file", default=LATENCY_FILE)
+    report.set_defaults(func=latency_report)
+
+    start = commands.add_parser(
+            "launch", help="launch the whole system without the GUI")
+    start.add_argument("--headsets", type=positive_int, default=1)
+    start.add_argument("--no-headset-check", action="store_true",
+                       help="launch even if fewer headsets are plugged in")
+    start.set_defaults(func=launch)
+
+    watch = commands.add_parser(
+            "supervise", help="run a command, restarting it whenever it crashes")
+    watch.add_argument("--name", help="name to report restarts under")
+    watch.add_argument("command", nargs=argparse.REMAINDER)
+    watch.set_defaults(func=supervise)
+
+    sample = commands.add_parser(
+            "health",
+            help="print the CPU, memory and threads of the robot launch's processes "
+                 "and the camera stream rates as JSON, once a second")
+    sample.add_argument("--interval", type=float, default=1.0, help="seconds")
+    sample.add_argument("--count", type=int, default=0,
+                        help="readings to print before exiting (0 for no limit)")
+    sample.add_argument("--session-file", default=SESSION_FILE,
+                        help="file holding the id of the session to watch")
+    sample.set_defaults(func=health)
+
+    profile = commands.add_parser(
+            "sched-profile",
+            help="pin the robot launch's capture processes to their own cores and "
+                 "raise their priority")
+    profile.add_argument("--profile", choices=["none", "pinned", "realtime"],
+                         default="pinned")
+    profile.add_argument("--watch", action="store_true",
+                         help="keep applying it to processes that start later")
+    profile.add_argument("--hot-cores", type=int,
+                         help="cores for capture and streaming (default half of them)")
+    profile.add_argument("--session-file", default=SESSION_FILE,
+                         help="file holding the id of the launch session")
+    profile.set_defaults(func=sched_profile)
+
+    layout = commands.add_parser(
+            "display-layout",
+            help="print the outputs and HMD windows of the X display")
+    layout.set_defaults(func=display_layout)
+
+    robot = commands.add_parser(
+            "robot-ssh",
+            help="time a command on the robot over the shared ssh channel")
+    robot.add_argument("--host", help="default ROBOT_HOSTNAME, or localhost")
+    robot.add_argument("--user", help="default ROBOT_USERNAME, or you")
+    robot.set_defaults(func=robot_ssh)
+
+    stitch = commands.add_parser(
+            "remap",
+            help="build and cache the dual fisheye to equirectangular remap table "
+                 "for stream-cameras --equirect")
+    stitch.add_argument("--width", type=int, default=1440, help="fisheye frame width")
+    stitch.add_argument("--height", type=int, default=1440, help="fisheye frame height")
+    stitch.set_defaults(func=remap)
+
+    config = commands.add_parser(
+            "config", help="print the Project Crunch configuration the installer wrote")
+    config.add_argument("--file", default=config_store.CONFIG_FILE)
+    config.set_defaults(func=show_config)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
@@ -0,0 +1,169 @@
+"""
+The Project Crunch configuration: one file of shell exports, written by the
+installer and the ssh key configuration and read by the launcher and the
+robot scripts.
+
+    # Project Crunch configuration, written by the installer.
+    export CRUNCH_CONFIG_VERSION=1
+    export ROBOT_CATKIN_PATH=/home/nrg/catkin_ws
+    export ROBOT_HOSTNAME=robot
+    ...
+
+It is plain shell, so bash sources it directly: the robot scripts do, and
+.bashrc and .xsessionrc each get one line (INCLUDE_LINE) that does, instead
+of a new export every time something is configured. It is also simple
+enough that load() parses it without a shell, and load() only reads the
+file again when its size or modification time changes, so a repeated read
+costs one stat().
+
+update() rewrites the whole file under a temporary name and renames it into
+place, so a reader never sees half a file.
+
+The installer uses this module too; it imports it from here rather than
+keeping a copy (see install_steps.py).
+"""
+import os
+import shlex
+import time
+
+CONFIG_FILE = os.environ.get("CRUNCH_CONFIG") or os.path.join(
+        os.path.expanduser("~"), ".config", "project-crunch", "config")
+# Bumped when the meaning of a setting changes
+CONFIG_VERSION = 1
+VERSION_KEY = "CRUNCH_CONFIG_VERSION"
+HEADER = "# Project Crunch configuration, written by the installer."
+
+# Settings in the order they are written
+KEYS = (
+    "ROBOT_CATKIN_PATH",
+    "ROBOT_PROJECT_CRUNCH_PATH",
+    "BASE_CATKIN_PATH",
+    "ROBOT_HOSTNAME",
+    "ROBOT_USERNAME",
+    "BASE_HOSTNAME",
+    "ROBOT_IP",
+    "BASE_IP",
+    "ROS_MASTER_URI",
+    "ROS_IP",
+    "OPENHMD_INSTALL_DEST",
+    "CRUNCH_TRANSPORT",
+    "CRUNCH_CAPTURE_MODE",
+)
+
+
+
+def include_line(path=None):
+    '''
+    The one line shell startup files need to read the config file at path.
+    A path in the home directory is written from $HOME, as
+    config_lines.sh writes it, so the default line is the same for every
+    user.
+    '''
+    path = os.path.abspath(path or CONFIG_FILE)
+    home = os.path.expanduser("~")
+    rest = os.path.relpath(path, home)
+    if not rest.startswith("..") and shlex.quote(rest) == rest:
+        quoted = '"$HOME/{}"'.format(rest)
+    else:
+        quoted = shlex.quote(path)
+    return "[ -f {0} ] && . {0}".format(quoted)
+
+
+INCLUDE_LINE = include_line()
+
+# path: ((size, mtime), settings) of the last load
+_cache = {}
+
+
+def parse(text):
+    '''Settings from config text: a dict of name to value'''
+    settings = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("export "):
+            line = line[len("export "):]
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        name, value = line.split("=", 1)
+        if any(c in value for c in "'\"\\"):
+            value = "".join(shlex.split(value))
+        settings[name] = value
+    return settings
+
+
+def format_config(settings):
+    '''Config text for settings, known keys first'''
+    names = [key for key in KEYS if key in settings]
+    names += sorted(name for name in settings if name not in KEYS and name != VERSION_KEY)
+    lines = [HEADER, "export {}={}".format(VERSION_KEY, CONFIG_VERSION)]
+    lines += ["export {}={}".format(name, shlex.quote(str(settings[name])))
+              for name in names]
+    return "\n".join(lines) + "\n"
+
+
+def load(path=None):
+    '''
+    The settings in the config file, or an empty dict if there is none.
+    Returns the same dict until the file changes; do not modify it.
+    '''
+    path = path or CONFIG_FILE
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return {}
+    key = (stat.st_size, stat.st_mtime_ns)
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(path) as f:
+        settings = parse(f.read())
+    _cache[path] = (key, settings)
+    return settings
+
+
+def get(name, default=None, path=None):
+    '''
+    A setting: from the environment if it is set there, so a shell can
+    override the file, otherwise from the config file
+    '''
+    value = os.environ.get(name)
+    if value is not None:
+        return value
+    return load(path).get(name, default)
+
+
+def update(settings, path=None):
+    '''
+    Set the given settings in the config file, keeping the others; a value
+    of None removes a setting
+    '''
+    path = path or CONFIG_FILE
+    merged = dict(load(path))
+    for name, value in settings.items():
+        if value is None:
+            merged.pop(name, None)
+        else:
+            merged[name] = value
+    text = format_config(merged)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp, "w") as f:
+        f.write(text)
+    os.replace(temp, path)
+    _cache.pop(path, None)
+
+
+def benchmark(path=None, reads=10000):
+    '''Microseconds per load(): (first read and parse, cached read)'''
+    path = path or CONFIG_FILE
+    _cache.pop(path, None)
+    start = time.perf_counter()
+    load(path)
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(reads):
+        load(path)
+    cached = (time.perf_counter() - start) / reads
+    return first * 1e6, cached * 1e6
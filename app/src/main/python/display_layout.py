@@ -0,0 +1,199 @@
+"""
+In-process display layout for the HMD windows.
+
+Reads monitor geometry with RandR and moves windows with EWMH requests over a
+single X connection, replacing the xrandr | grep and wmctrl | grep pipelines.
+Any number of headset outputs can be matched to HMD windows in one pass.
+"""
+import collections
+import re
+import time
+
+from Xlib import X, Xatom, display
+from Xlib.protocol import event as xevent
+
+# Native panel resolution of the HTC Vive
+VIVE_RESOLUTION = (2160, 1200)
+
+HMD_WINDOW_NAME = re.compile(r"^HMD(\d+)$")
+
+Monitor = collections.namedtuple("Monitor", "name x y width height")
+
+
+class DisplayLayoutError(Exception):
+    pass
+
+
+def window_name(disp, window):
+    '''Return the EWMH title of a window, falling back to WM_NAME'''
+    prop = window.get_full_property(disp.intern_atom("_NET_WM_NAME"),
+                                    disp.intern_atom("UTF8_STRING"))
+    name = prop.value if prop is not None and prop.value else window.get_wm_name()
+    if isinstance(name, bytes):
+        name = name.decode("utf-8", "ignore")
+    return name or None
+
+
+def move_window(disp, window, x, y, width, height):
+    '''
+    Ask the window manager to move the window, the same request wmctrl -e
+    sends, and configure it directly for servers without a WM.
+    '''
+    root = disp.screen().root
+    # Gravity 0 plus the x, y, width and height flags (bits 8-11).
+    flags = (1 << 8) | (1 << 9) | (1 << 10) | (1 << 11)
+    msg = xevent.ClientMessage(
+            window=window,
+            client_type=disp.intern_atom("_NET_MOVERESIZE_WINDOW"),
+            data=(32, [flags, x, y, width, height]))
+    root.send_event(
+            msg,
+            event_mask=X.SubstructureRedirectMask | X.SubstructureNotifyMask)
+    window.configure(x=x, y=y, width=width, height=height)
+
+
+class DisplayLayout(object):
+    """
+    Maps HMD windows (HMD1, HMD2, ...) onto the outputs running at headset
+    resolution, ordered left to right.
+
+    The monitor list is cached and only re-read when the RandR configuration
+    timestamp changes, so repeated calls cost one round trip.
+    """
+
+    def __init__(self, display_name=None, resolution=VIVE_RESOLUTION):
+        self.disp = display.Display(display_name)
+        if not self.disp.has_extension("RANDR"):
+            raise DisplayLayoutError("X server does not support RandR")
+        self.root = self.disp.screen().root
+        self.resolution = resolution
+        self._config_timestamp = None
+        self._monitors = []
+
+    def close(self):
+        self.disp.close()
+
+    def monitors(self):
+        '''Return every active output as a Monitor, cached between calls'''
+        res = self.root.xrandr_get_screen_resources_current()
+        if res.config_timestamp != self._config_timestamp:
+            monitors = []
+            for output in res.outputs:
+                info = self.disp.xrandr_get_output_info(output, res.config_timestamp)
+                if not info.crtc:
+                    continue
+                crtc = self.disp.xrandr_get_crtc_info(info.crtc, res.config_timestamp)
+                name = info.name
+                if isinstance(name, bytes):
+                    name = name.decode("utf-8", "ignore")
+                monitors.append(Monitor(name, crtc.x, crtc.y, crtc.width, crtc.height))
+            self._monitors = monitors
+            self._config_timestamp = res.config_timestamp
+        return list(self._monitors)
+
+    def hmd_monitors(self):
+        '''Return the outputs at headset resolution, left to right'''
+        width, height = self.resolution
+        hmds = [m for m in self.monitors() if (m.width, m.height) == (width, height)]
+        return sorted(hmds, key=lambda m: (m.x, m.y))
+
+    def assign(self, names):
+        '''
+        Pair window names with headset outputs in order. Returns a dict of
+        name -> (x, y, width, height); names without an output are left out.
+        '''
+        return {name: (m.x, m.y, m.width, m.height)
+                for name, m in zip(names, self.hmd_monitors())}
+
+    def hmd_windows(self):
+        '''Return a dict of name -> window for every mapped HMD window'''
+        clients = self.root.get_full_property(
+                self.disp.intern_atom("_NET_CLIENT_LIST"), Xatom.WINDOW)
+        if clients is not None:
+            windows = [self.disp.create_resource_object("window", wid)
+                       for wid in clients.value]
+        else:
+            windows = self.root.query_tree().children
+        found = {}
+        for window in windows:
+            name = window_name(self.disp, window)
+            if name and HMD_WINDOW_NAME.match(name):
+                found[name] = window
+        return found
+
+    def place_all(self):
+        '''
+        Move every existing HMD window onto its headset in one pass. Returns
+        the list of window names that were placed.
+        '''
+        windows = self.hmd_windows()
+        names = sorted(windows, key=lambda n: int(HMD_WINDOW_NAME.match(n).group(1)))
+        targets = self.assign(names)
+        for name in names:
+            if name in targets:
+                move_window(self.disp, windows[name], *targets[name])
+            else:
+                print("No headset output left for {}".format(name))
+        self.disp.flush()
+        return [name for name in names if name in targets]
+
+
+#######################################
+# Benchmark
+#######################################
+def _layout_once(layout, names):
+    # What a placement costs per launch: the headset outputs, the HMD
+    # windows and a move for each. On a test server without outputs at
+    # headset resolution the windows go side by side instead.
+    layout.hmd_monitors()
+    windows = layout.hmd_windows()
+    width, height = layout.resolution
+    for index, name in enumerate(names):
+        move_window(layout.disp, windows[name], index * width, 0, width, height)
+    layout.disp.sync()
+
+
+def benchmark(headsets=(1, 2, 4, 8), repeats=20, display_name=None):
+    '''
+    Time laying out dummy HMD windows on display_name, e.g. an Xvfb, for
+    each count in headsets. Returns {count: result}, each with "first_ms",
+    a layout on a new connection, "cached_ms", the median of repeats more
+    on the same connection, and "per_headset_ms", that per window.
+    '''
+    dummies = display.Display(display_name)
+    root = dummies.screen().root
+    results = {}
+    try:
+        for count in headsets:
+            names = ["HMD{}".format(i + 1) for i in range(count)]
+            windows = []
+            for name in names:
+                window = root.create_window(0, 0, 320, 240, 0, dummies.screen().root_depth)
+                window.set_wm_name(name)
+                window.map()
+                windows.append(window)
+            dummies.sync()
+            start = time.perf_counter()
+            layout = DisplayLayout(display_name)
+            try:
+                _layout_once(layout, names)
+                first = time.perf_counter() - start
+                times = []
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    _layout_once(layout, names)
+                    times.append(time.perf_counter() - start)
+            finally:
+                layout.close()
+            for window in windows:
+                window.destroy()
+            dummies.sync()
+            cached = sorted(times)[len(times) // 2]
+            results[count] = {
+                "first_ms": round(first * 1000, 2),
+                "cached_ms": round(cached * 1000, 2),
+                "per_headset_ms": round(cached * 1000 / count, 2),
+            }
+    finally:
+        dummies.close()
+    return results
@@ -0,0 +1,190 @@
+"""
+Dual fisheye to equirectangular remapping.
+
+The front and rear fisheye frames are written into one preallocated input
+buffer. A lookup table holds, for every output pixel, the flat index of the
+input pixel it samples, so producing an equirectangular frame is a single
+numpy gather with no Python level loop. Tables depend only on the frame
+sizes and the calibration; they are built once, saved under the cache
+directory and memory-mapped on later runs.
+"""
+import collections
+import concurrent.futures
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+# Bump when the table layout or projection math changes
+LUT_VERSION = 1
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "project-crunch", "remap")
+
+# Center and radius of the image circle in pixels, and the lens field of
+# view in degrees, for an equidistant fisheye lens.
+Calibration = collections.namedtuple("Calibration", "cx cy radius fov")
+
+
+def default_calibration(width, height, fov=190.0):
+    '''An image circle centered in the frame and touching its short side'''
+    return Calibration((width - 1) / 2.0, (height - 1) / 2.0, min(width, height) / 2.0, fov)
+
+
+def build_lut(in_size, out_size, front, rear):
+    '''
+    Return the flat input index sampled by every output pixel, as an int32
+    array of shape (out_height * out_width,). Input index 2 * h * w (one past
+    both frames) is a black pixel used outside the image circles.
+    '''
+    in_w, in_h = in_size
+    out_w, out_h = out_size
+    lon = (np.arange(out_w, dtype=np.float64) + 0.5) / out_w * 2 * np.pi - np.pi
+    lat = np.pi / 2 - (np.arange(out_h, dtype=np.float64) + 0.5) / out_h * np.pi
+    lon, lat = np.meshgrid(lon, lat)
+    x = np.cos(lat) * np.sin(lon)
+    y = np.sin(lat)
+    z = np.cos(lat) * np.cos(lon)
+
+    black = 2 * in_w * in_h
+    lut = np.full(out_w * out_h, black, dtype=np.int32)
+    for camera, calib, sign in ((0, front, 1.0), (1, rear, -1.0)):
+        # The rear camera looks down -z and is mirrored left to right.
+        cz = sign * z
+        cx = sign * x
+        theta = np.arccos(np.clip(cz, -1.0, 1.0))
+        phi = np.arctan2(y, cx)
+        r = theta / np.radians(calib.fov / 2.0) * calib.radius
+        px = np.rint(calib.cx + r * np.cos(phi)).astype(np.int64)
+        py = np.rint(calib.cy - r * np.sin(phi)).astype(np.int64)
+        use = (cz >= 0) & (px >= 0) & (px < in_w) & (py >= 0) & (py < in_h)
+        use &= r <= calib.radius
+        flat = (camera * in_h + py) * in_w + px
+        lut[use.ravel()] = flat[use].astype(np.int32)
+    return lut
+
+
+def _cache_key(in_size, out_size, front, rear):
+    text = repr((LUT_VERSION, tuple(in_size), tuple(out_size), tuple(front), tuple(rear)))
+    return hashlib.sha1(text.encode("ascii")).hexdigest()
+
+
+def load_lut(in_size, out_size, front, rear, cache_dir=CACHE_DIR):
+    '''Return the lookup table, memory-mapped from the cache when possible'''
+    path = os.path.join(cache_dir, _cache_key(in_size, out_size, front, rear) + ".npy")
+    try:
+        return np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        pass
+    lut = build_lut(in_size, out_size, front, rear)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write to a temporary name first so a reader never maps half a file.
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "wb") as f:
+        np.save(f, lut)
+    os.replace(tmp, path)
+    return np.load(path, mmap_mode="r")
+
+
+class FisheyeRemapper(object):
+    """
+    Turns a front/rear fisheye pair of in_size (width, height) into one
+    equirectangular frame of out_size (defaults to 2h x h).
+
+    Write the fisheye frames into input_buffer()[0] and [1] (e.g. with
+    cv2.VideoCapture.read(image=...)) and call remap(). With threads > 1 the
+    gather is split into row bands, which numpy runs without holding the GIL.
+    """
+
+    def __init__(self, in_size, out_size=None, channels=3, front=None, rear=None,
+                 threads=1, cache_dir=CACHE_DIR):
+        in_w, in_h = in_size
+        if out_size is None:
+            out_size = (2 * in_h, in_h)
+        if front is None:
+            front = default_calibration(in_w, in_h)
+        if rear is None:
+            rear = default_calibration(in_w, in_h)
+        self.in_size = in_size
+        self.out_size = out_size
+        self.channels = channels
+        self.lut = load_lut(in_size, out_size, front, rear, cache_dir)
+        # Both frames plus the trailing black pixel, as one flat pixel array
+        self._pixels = np.zeros((2 * in_w * in_h + 1, channels), dtype=np.uint8)
+        out_w, out_h = out_size
+        self._out = np.empty((out_h * out_w, channels), dtype=np.uint8)
+        self.threads = threads
+        self._pool = None
+        if threads > 1:
+            self._pool = concurrent.futures.ThreadPoolExecutor(threads)
+            bounds = np.linspace(0, out_h, threads + 1).astype(int) * out_w
+            self._bands = list(zip(bounds[:-1], bounds[1:]))
+
+    def input_buffer(self):
+        '''Return a (2, h, w, channels) view to write the fisheye frames into'''
+        in_w, in_h = self.in_size
+        return self._pixels[:-1].reshape(2, in_h, in_w, self.channels)
+
+    def _gather(self, band):
+        start, stop = band
+        np.take(self._pixels, self.lut[start:stop], axis=0, out=self._out[start:stop])
+
+    def remap(self):
+        '''
+        Return the equirectangular frame, shape (out_h, out_w, channels).
+        The array is reused, so it is only valid until the next call.
+        '''
+        if self._pool is None:
+            np.take(self._pixels, self.lut, axis=0, out=self._out)
+        else:
+            list(self._pool.map(self._gather, self._bands))
+        out_w, out_h = self.out_size
+        return self._out.reshape(out_h, out_w, self.channels)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+
+#######################################
+# Benchmark
+#######################################
+def benchmark(in_size=(1440, 1440), threads=(1, 2, 4), duration=3.0, cache_dir=None):
+    '''
+    Remap random fisheye pairs of in_size for duration seconds with each
+    count of threads. Returns {"build_s": seconds to build the table,
+    "load_s": seconds to map it from the cache, threads: frames/s}.
+    '''
+    own_cache = cache_dir is None
+    if own_cache:
+        cache_dir = tempfile.mkdtemp(prefix="crunch-remap-")
+    try:
+        front = rear = default_calibration(*in_size)
+        out_size = (2 * in_size[1], in_size[1])
+        start = time.perf_counter()
+        load_lut(in_size, out_size, front, rear, cache_dir)
+        results = {"build_s": round(time.perf_counter() - start, 3)}
+        start = time.perf_counter()
+        load_lut(in_size, out_size, front, rear, cache_dir)
+        results["load_s"] = round(time.perf_counter() - start, 4)
+        frames = np.random.default_rng(1).integers(
+                0, 256, (2, in_size[1], in_size[0], 3), dtype=np.uint8)
+        for count in threads:
+            remapper = FisheyeRemapper(in_size, threads=count, cache_dir=cache_dir)
+            try:
+                remapper.input_buffer()[...] = frames
+                remapper.remap()
+                done = 0
+                start = time.perf_counter()
+                while time.perf_counter() - start < duration:
+                    remapper.remap()
+                    done += 1
+                results[count] = round(done / (time.perf_counter() - start), 1)
+            finally:
+                remapper.close()
+    finally:
+        if own_cache:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+    return results
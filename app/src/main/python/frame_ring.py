@@ -0,0 +1,144 @@
+"""
+Hand-off buffers between a camera capture thread and the thread that
+encodes and sends its frames.
+
+FrameRing is the "freshest" mode: a few preallocated slots where a new frame
+overwrites any frame the consumer has not taken yet, so the consumer always
+gets the newest frame and never works through a backlog. FrameQueue is the
+"queue" mode: a bounded FIFO that never drops, which is what
+video_stream_opencv's buffer_queue_size gives.
+
+Both have the same interface: put(image, captured) and close() from the
+capture thread, get(timeout) from the consumer, and a stats dict with put,
+taken and dropped frame counts.
+"""
+import collections
+import queue
+import threading
+
+import numpy as np
+
+FRESHEST = "freshest"
+QUEUE = "queue"
+MODES = (FRESHEST, QUEUE)
+
+# The frame a consumer got: its capture sequence number, its capture time and
+# the image.
+Frame = collections.namedtuple("Frame", "seq captured image")
+
+
+class FrameRing(object):
+    """
+    Latest-frame-wins buffer for one producer and one consumer.
+
+    put() copies the image into a free slot, so the camera's own buffer can
+    be reused straight away. get() returns the newest frame; its image stays
+    valid until the next get(). Frames that were overwritten before anyone
+    took them are counted in stats["dropped"].
+
+    Three slots are enough: one being read, one holding the newest frame and
+    one being written. Slots are allocated on the first put() and again if
+    the frame shape changes.
+    """
+
+    def __init__(self, slots=3):
+        if slots < 3:
+            raise ValueError("FrameRing needs at least 3 slots")
+        self._slots = [None] * slots
+        self._captured = [0.0] * slots
+        self._seq = [0] * slots
+        self._latest = None
+        self._reading = None
+        self._next_seq = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self.stats = {"put": 0, "taken": 0, "dropped": 0}
+
+    def _free_slot(self):
+        for index in range(len(self._slots)):
+            if index != self._latest and index != self._reading:
+                return index
+
+    def put(self, image, captured):
+        with self._cond:
+            index = self._free_slot()
+        slot = self._slots[index]
+        if slot is None or slot.shape != image.shape or slot.dtype != image.dtype:
+            slot = self._slots[index] = np.empty_like(image)
+        # Copy outside the lock; the consumer never touches a free slot.
+        np.copyto(slot, image)
+        with self._cond:
+            if self._latest is not None:
+                self.stats["dropped"] += 1
+            self._next_seq += 1
+            self._seq[index] = self._next_seq
+            self._captured[index] = captured
+            self._latest = index
+            self.stats["put"] += 1
+            self._cond.notify()
+
+    def close(self):
+        '''No more frames will come; get() returns None once the last is taken'''
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        '''
+        Return the newest Frame, or None if none arrives within timeout or
+        the ring is closed
+        '''
+        with self._cond:
+            self._cond.wait_for(lambda: self._latest is not None or self._closed, timeout)
+            if self._latest is None:
+                return None
+            index = self._reading = self._latest
+            self._latest = None
+            self.stats["taken"] += 1
+            return Frame(self._seq[index], self._captured[index], self._slots[index])
+
+
+class FrameQueue(object):
+    """
+    Lossless bounded FIFO: put() blocks while maxsize frames are waiting,
+    so every captured frame is sent, however old it gets.
+    """
+
+    def __init__(self, maxsize=100):
+        self._queue = queue.Queue(maxsize)
+        self._next_seq = 0
+        self.stats = {"put": 0, "taken": 0, "dropped": 0}
+
+    def put(self, image, captured):
+        self._next_seq += 1
+        self._queue.put(Frame(self._next_seq, captured, image))
+        self.stats["put"] += 1
+
+    def close(self):
+        '''No more frames will come; get() returns None once the last is taken'''
+        self._queue.put(None)
+
+    def get(self, timeout=None):
+        '''
+        Return the oldest Frame, or None if none arrives within timeout or
+        the queue is closed
+        '''
+        try:
+            frame = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if frame is None:
+            # Leave the marker for any later get()
+            self._queue.put(None)
+            return None
+        self.stats["taken"] += 1
+        return frame
+
+
+def frame_buffer(mode, queue_size=100):
+    '''Return an empty buffer for mode, one of MODES'''
+    if mode == FRESHEST:
+        return FrameRing()
+    if mode == QUEUE:
+        return FrameQueue(queue_size)
+    raise ValueError("Unknown capture mode {}".format(mode))
@@ -0,0 +1,548 @@
+"""
+Decoded camera frames shared between processes without copying.
+
+receive-cameras --share decodes each frame once and puts it into a
+SharedFrameRing, one per stream, in a file under /dev/shm. Any number of
+local consumers (up to the ring's max_readers) open it with
+SharedFrameReader and get the frame as a numpy view of the shared mapping:
+the pixels are never copied or deserialized again, however many consumers
+there are. In the two headset mode each HMD's consumer reads the same
+memory, where a topic subscription gives each its own copy.
+
+The ring has the same interface as frame_ring.FrameRing: put(image,
+captured) on the writing side, get(timeout) returning a Frame whose image
+stays valid until the next get() on the reading side. It keeps the same
+latest-frame-wins rule across processes:
+
+  * every reader publishes the sequence number of the frame it holds in
+    its entry of the ring's header, its generation counter
+  * the writer only ever overwrites a slot no reader holds and that is not
+    the newest frame; with max_readers + 2 slots there always is one, so the
+    writer never waits and a slow reader only ever costs itself frames
+  * each slot carries the sequence number of its frame, zeroed while it is
+    being written, so a reader can check (valid()) that a frame was not
+    overwritten under it, as a seqlock does
+
+File layout, native byte order:
+
+    HEADER                      magic, version, slots, max_readers, height,
+                                width, channels, replaced, newest sequence
+    READER * max_readers        pid, sequence held
+    SLOT * slots                sequence, capture time
+    (padding to a page)
+    frame data * slots          height * width * channels bytes each
+
+Readers poll the newest sequence number every POLL_INTERVAL: there is no
+cross process wakeup in the standard library, and at 30 fps a millisecond
+of polling is below a frame of latency.
+
+A consumer attaches by opening the ring by name, e.g. for the front camera:
+
+    reader = SharedFrameReader("camera1")
+    while True:
+        frame = reader.get(timeout=1.0)
+        if frame is None:
+            continue                # no writer, or it stopped sending
+        show(frame.image)           # valid until the next get()
+        if not reader.valid(frame):
+            pass                    # overwritten while in use; discard
+
+The reader registers in the ring's header when it opens it, and from then on
+gets the frames put after that, never one left over from before. Its entry
+is freed by close(), or taken over by the next reader once its process has
+exited. Decoding is only worth it with someone to read the result, so the
+receiver puts the first frame of a stream, which creates the ring, and
+after that skips decoding while the ring has no live readers.
+"""
+import fcntl
+import mmap
+import multiprocessing
+import os
+import struct
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import proc_stats
+from frame_ring import Frame
+
+SHARE_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+HEADER = struct.Struct("=4sIIIIIIIQ")
+# Where the replaced flag and the newest sequence number are in HEADER
+REPLACED = 28
+NEWEST = 32
+MAGIC = b"CRFS"
+VERSION = 1
+READER = struct.Struct("=QQ")
+SLOT = struct.Struct("=Qd")
+MAX_READERS = 4
+# Seconds between checks for a new frame
+POLL_INTERVAL = 0.001
+# Seconds without a frame after which a reader checks whether the ring was
+# made again by a new writer, e.g. a respawned receive-cameras
+REOPEN_AFTER = 1.0
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def ring_path(name):
+    '''Where the ring called name lives, e.g. name "camera1"'''
+    return os.path.join(SHARE_DIR, "project-crunch-{}".format(name))
+
+
+class _Layout(object):
+    '''Offsets into a ring of the given geometry'''
+
+    def __init__(self, slots, max_readers, shape):
+        self.slots = slots
+        self.max_readers = max_readers
+        self.shape = tuple(shape)
+        self.frame_size = int(np.prod(self.shape))
+        self.readers = HEADER.size
+        self.slot_headers = self.readers + READER.size * max_readers
+        self.data = -(-(self.slot_headers + SLOT.size * slots) // mmap.PAGESIZE) * mmap.PAGESIZE
+        self.size = self.data + self.frame_size * slots
+
+    def reader(self, index):
+        return self.readers + READER.size * index
+
+    def slot(self, index):
+        return self.slot_headers + SLOT.size * index
+
+    def image(self, buffer, index):
+        return np.frombuffer(buffer, dtype=np.uint8, count=self.frame_size,
+                             offset=self.data + self.frame_size * index).reshape(self.shape)
+
+
+class SharedFrameRing(object):
+    """
+    The writing side of a shared ring. name is the ring's name (see
+    ring_path); the ring is created on the first put() and made again if
+    the frame shape changes, which tells open readers to reopen it.
+    """
+
+    def __init__(self, name, max_readers=MAX_READERS):
+        self.path = ring_path(name)
+        self.max_readers = max_readers
+        self.slots = max_readers + 2
+        self._map = None
+        self._layout = None
+        self._seq = 0
+        self.stats = {"put": 0}
+
+    def _create(self, shape):
+        layout = _Layout(self.slots, self.max_readers, shape)
+        tmp = "{}.{}.tmp".format(self.path, os.getpid())
+        fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, layout.size)
+            buffer = mmap.mmap(fd, layout.size)
+        finally:
+            os.close(fd)
+        HEADER.pack_into(buffer, 0, MAGIC, VERSION, layout.slots, layout.max_readers,
+                         shape[0], shape[1], shape[2] if len(shape) > 2 else 1, 0, 0)
+        os.replace(tmp, self.path)
+        self._retire()
+        self._map = buffer
+        self._layout = layout
+
+    def _retire(self):
+        if self._map is not None:
+            # Readers of the old file see this and open the new one.
+            struct.pack_into("=I", self._map, REPLACED, 1)
+            self._map.close()
+            self._map = None
+
+    def readers(self):
+        '''Number of live readers registered in the ring, 0 before it exists'''
+        if self._layout is None:
+            return 0
+        count = 0
+        for index in range(self._layout.max_readers):
+            pid = READER.unpack_from(self._map, self._layout.reader(index))[0]
+            if pid and _alive(pid):
+                count += 1
+        return count
+
+    def _held(self):
+        held = set()
+        for index in range(self._layout.max_readers):
+            pid, seq = READER.unpack_from(self._map, self._layout.reader(index))
+            if pid and seq:
+                held.add(seq)
+        return held
+
+    def put(self, image, captured):
+        if self._layout is None or self._layout.shape != image.shape:
+            self._create(image.shape)
+        layout = self._layout
+        held = self._held()
+        newest = self._seq
+        # The oldest slot no reader holds; never the newest frame.
+        free = None
+        for index in range(layout.slots):
+            seq = SLOT.unpack_from(self._map, layout.slot(index))[0]
+            if seq == newest and seq:
+                continue
+            if seq in held:
+                continue
+            if free is None or seq < free[1]:
+                free = (index, seq)
+        index = free[0]
+        SLOT.pack_into(self._map, layout.slot(index), 0, 0.0)
+        np.copyto(layout.image(self._map, index), image)
+        self._seq += 1
+        SLOT.pack_into(self._map, layout.slot(index), self._seq, captured)
+        struct.pack_into("=Q", self._map, NEWEST, self._seq)
+        self.stats["put"] += 1
+
+    def close(self):
+        '''Remove the ring; readers see it as replaced and wait for a new one'''
+        self._retire()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class SharedFrameReader(object):
+    """
+    One consumer of a shared ring. get() returns the newest frame it has not
+    had yet; stats counts the frames taken and those it missed.
+    """
+
+    def __init__(self, name):
+        self.path = ring_path(name)
+        self._map = None
+        self._layout = None
+        self._entry = None
+        self._last = 0
+        self._holding = None
+        self._inode = None
+        self._checked = 0.0
+        self.stats = {"taken": 0, "missed": 0}
+
+    def _open(self):
+        try:
+            fd = os.open(self.path, os.O_RDWR)
+        except OSError:
+            return False
+        try:
+            inode = os.fstat(fd).st_ino
+            buffer = mmap.mmap(fd, 0)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                magic, version, slots, max_readers, height, width, channels, _, _ = \
+                    HEADER.unpack_from(buffer)
+                if magic != MAGIC or version != VERSION:
+                    raise ValueError("{} is not a frame ring".format(self.path))
+                shape = (height, width, channels) if channels > 1 else (height, width)
+                layout = _Layout(slots, max_readers, shape)
+                entry = self._claim(buffer, layout)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+        if entry is None:
+            buffer.close()
+            raise RuntimeError("{} already has {} readers".format(self.path, max_readers))
+        # On first attach, whatever is in the ring was put before anyone read
+        # it and may be long out of date. A ring made again by the writer
+        # only has frames this reader has not had.
+        self._last = struct.unpack_from("=Q", buffer, NEWEST)[0] if self._inode is None else 0
+        self._map, self._layout, self._entry = buffer, layout, entry
+        self._inode = inode
+        self._checked = time.monotonic()
+        return True
+
+    @staticmethod
+    def _claim(buffer, layout):
+        # Entries of readers that died without closing are free again.
+        for index in range(layout.max_readers):
+            pid = READER.unpack_from(buffer, layout.reader(index))[0]
+            if pid and _alive(pid):
+                continue
+            READER.pack_into(buffer, layout.reader(index), os.getpid(), 0)
+            return index
+        return None
+
+    def _replaced(self):
+        if struct.unpack_from("=I", self._map, REPLACED)[0] != 0:
+            return True
+        # A writer that died could not mark its ring, so a quiet ring is
+        # checked against the file now at its path.
+        now = time.monotonic()
+        if now - self._checked < REOPEN_AFTER:
+            return False
+        self._checked = now
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except OSError:
+            return False
+
+    def get(self, timeout=None):
+        '''The newest Frame not yet taken, or None if none comes within timeout'''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self._map is None or self._replaced():
+                self._release()
+                if not self._open():
+                    self._map = None
+            if self._map is not None:
+                frame = self._take()
+                if frame is not None:
+                    self._checked = time.monotonic()
+                    return frame
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(POLL_INTERVAL)
+
+    def _take(self):
+        layout = self._layout
+        newest = struct.unpack_from("=Q", self._map, NEWEST)[0]
+        if newest <= self._last:
+            return None
+        for index in range(layout.slots):
+            seq, captured = SLOT.unpack_from(self._map, layout.slot(index))
+            if seq != newest:
+                continue
+            # Claim the frame, then make sure the writer had not started
+            # on the slot before it could see the claim.
+            READER.pack_into(self._map, layout.reader(self._entry), os.getpid(), seq)
+            if SLOT.unpack_from(self._map, layout.slot(index))[0] != seq:
+                return None
+            if self._last:
+                self.stats["missed"] += seq - self._last - 1
+            self._last = seq
+            self._holding = index
+            self.stats["taken"] += 1
+            return Frame(seq, captured, layout.image(self._map, index))
+        return None
+
+    def valid(self, frame):
+        '''True if frame's image was not overwritten while it was in use'''
+        if self._map is None or self._holding is None:
+            return False
+        return SLOT.unpack_from(self._map, self._layout.slot(self._holding))[0] == frame.seq
+
+    def _release(self):
+        if self._map is not None:
+            try:
+                READER.pack_into(self._map, self._layout.reader(self._entry), 0, 0)
+                self._map.close()
+            except BufferError:
+                # A frame is still in use; the mapping goes with it.
+                pass
+            self._map = None
+            self._holding = None
+
+    def close(self):
+        self._release()
+
+
+def rings():
+    '''
+    The rings in SHARE_DIR, as dicts with name, shape, newest (sequence
+    number) and readers (live ones)
+    '''
+    found = []
+    prefix = os.path.basename(ring_path(""))
+    for filename in sorted(os.listdir(SHARE_DIR)):
+        if not filename.startswith(prefix) or filename.endswith(".tmp"):
+            continue
+        try:
+            with open(os.path.join(SHARE_DIR, filename), "rb") as f:
+                header = f.read(HEADER.size)
+                magic, version, slots, max_readers, height, width, channels, _, newest = \
+                    HEADER.unpack(header)
+                if magic != MAGIC or version != VERSION:
+                    continue
+                entries = f.read(READER.size * max_readers)
+        except (OSError, struct.error):
+            continue
+        readers = 0
+        for index in range(max_readers):
+            pid = READER.unpack_from(entries, READER.size * index)[0]
+            if pid and os.path.exists("/proc/{}".format(pid)):
+                readers += 1
+        found.append({"name": filename[len(prefix):], "shape": (height, width, channels),
+                      "newest": newest, "readers": readers})
+    return found
+
+
+class FrameSharer(object):
+    """
+    Sink for FrameReceiver that decodes each stream's JPEG frames once and
+    puts them in the shared ring "camera<stream + 1>". Decoding happens on
+    a thread per stream, away from the receiver; a frame that arrives
+    before the previous one is decoded replaces it. Once a stream's ring
+    exists, its frames are only decoded while it has readers; stats counts
+    the frames shared and skipped.
+    """
+
+    def __init__(self, max_readers=MAX_READERS):
+        self.max_readers = max_readers
+        self.rings = {}
+        self.stats = {"shared": 0, "skipped": 0}
+        self._pending = {}
+        self._cond = threading.Condition()
+
+    def __call__(self, stream, frame_id, data):
+        with self._cond:
+            if stream not in self.rings:
+                self.rings[stream] = SharedFrameRing("camera{}".format(stream + 1),
+                                                     self.max_readers)
+                threading.Thread(target=self._decode, args=(stream,), daemon=True,
+                                 name="share-camera{}".format(stream + 1)).start()
+            self._pending[stream] = (data, time.time())
+            self._cond.notify_all()
+
+    def _decode(self, stream):
+        import cv2
+
+        ring = self.rings[stream]
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: stream in self._pending)
+                data, received = self._pending.pop(stream)
+            if ring.stats["put"] and not ring.readers():
+                self.stats["skipped"] += 1
+                continue
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is not None:
+                ring.put(image, received)
+                self.stats["shared"] += 1
+
+    def close(self):
+        for ring in self.rings.values():
+            ring.close()
+
+
+#######################################
+# Benchmark
+#######################################
+def _shared_consumer(name, frames, slow, results):
+    reader = SharedFrameReader(name)
+    torn = 0
+    checksum = 0
+    while reader.stats["taken"] + reader.stats["missed"] < frames:
+        frame = reader.get(timeout=2.0)
+        if frame is None:
+            break
+        checksum += int(frame.image[::64, ::64].sum())
+        if slow:
+            time.sleep(slow)
+        if not reader.valid(frame):
+            torn += 1
+        del frame
+    results.put((reader.stats["taken"], torn))
+    reader.close()
+
+
+def _copy_consumer(conn, shape, frames, results):
+    taken = 0
+    checksum = 0
+    while taken < frames:
+        try:
+            data = conn.recv_bytes()
+        except EOFError:
+            break
+        image = np.frombuffer(data, dtype=np.uint8).reshape(shape)
+        checksum += int(image[::64, ::64].sum())
+        taken += 1
+    results.put((taken, 0))
+
+
+def _io_bytes(pid):
+    '''Bytes the process has moved through read and write calls'''
+    try:
+        with open("/proc/{}/io".format(pid)) as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+    except OSError:
+        return 0
+    return int(fields["rchar"]) + int(fields["wchar"])
+
+
+def _run(mode, consumers, width, height, fps, duration, slow=0.0):
+    shape = (height, width, 3)
+    rng = np.random.RandomState(0)
+    images = [rng.randint(0, 256, size=shape, dtype=np.uint8) for _ in range(4)]
+    count = int(duration * fps)
+    results = multiprocessing.Queue()
+    name = "bench-{}".format(os.getpid())
+    processes = []
+    pipes = []
+    if mode == "shared":
+        ring = SharedFrameRing(name, max_readers=max(consumers, 1))
+        ring.put(images[0], time.time())
+        for i in range(consumers):
+            processes.append(multiprocessing.Process(
+                    target=_shared_consumer,
+                    args=(name, count, slow if i == 0 else 0.0, results)))
+    else:
+        for _ in range(consumers):
+            receive, send = multiprocessing.Pipe(duplex=False)
+            pipes.append(send)
+            processes.append(multiprocessing.Process(
+                    target=_copy_consumer, args=(receive, shape, count, results)))
+    for process in processes:
+        process.start()
+    time.sleep(0.5)
+    pids = [os.getpid()] + [process.pid for process in processes]
+    first = [proc_stats.sample(pid) for pid in pids]
+    io_before = [_io_bytes(pid) for pid in pids]
+    start = time.monotonic()
+    for i in range(count):
+        image = images[i % len(images)]
+        if mode == "shared":
+            ring.put(image, time.time())
+        else:
+            for pipe in pipes:
+                pipe.send_bytes(image.reshape(-1))
+        delay = start + (i + 1) / fps - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    last = [proc_stats.sample(pid) for pid in pids]
+    io_after = [_io_bytes(pid) for pid in pids]
+    taken = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    if mode == "shared":
+        ring.close()
+    cpu = sum(b.cpu - a.cpu for a, b in zip(first, last) if a is not None and b is not None)
+    moved = sum(after - before for before, after in zip(io_before, io_after))
+    return {
+        "cpu_ms_per_frame": round(cpu / count * 1000, 2),
+        "copied_mb_per_frame": round(moved / count / 1e6, 2),
+        "delivered": [round(t / float(count), 3) for t, _ in sorted(taken, reverse=True)],
+        "torn": sum(torn for _, torn in taken),
+    }
+
+
+def benchmark(consumers=(1, 2, 4), width=1440, height=1440, fps=30.0, duration=5.0):
+    '''
+    Hand one stream of decoded width x height frames at fps to each count
+    of consumers, through a shared ring and, for comparison, as a copy per
+    consumer over a pipe, like a topic subscription. Consumers sum a sparse
+    sample of each frame, so the figures are the cost of getting frames to
+    them. Returns {"shared": {n: result}, "copies": {n: result}, "slow":
+    result}, where "slow" has one consumer taking 200 ms per frame beside
+    fast ones: delivered lists each consumer's share of the frames, fastest
+    first, and torn counts frames overwritten while in use.
+    '''
+    results = {"shared": {}, "copies": {}}
+    for mode in ("shared", "copies"):
+        for n in consumers:
+            results[mode][n] = _run(mode, n, width, height, fps, duration)
+    results["slow"] = _run("shared", max(consumers), width, height, fps, duration, slow=0.2)
+    return results
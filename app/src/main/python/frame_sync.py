@@ -0,0 +1,242 @@
+"""
+Pairing of the front and rear camera frames for the sphere display.
+
+The two cameras are captured and sent as independent streams, and the
+sphere display shows whatever it last got on each topic, so under load the
+two hemispheres drift apart by frames and the seam tears. receive-cameras
+puts a FrameSynchronizer in front of its publisher: it holds the frames of
+the two streams until each has its partner, the frame of the other stream
+captured closest to it, and passes them on as a pair.
+
+Pairing is greedy and never waits for a better match, so it adds no more
+latency than it takes the partner to arrive:
+
+  * a new frame pairs with the buffered frame of the other stream closest
+    to it in capture time, if that is within the tolerance
+  * frames of the other stream captured more than the tolerance before a
+    new frame can no longer be paired, and are dropped; so are buffered
+    frames older than a pair that was just passed on
+  * a frame without a partner is buffered, at most depth of them per stream,
+    the oldest being dropped first
+
+With the tolerance at most half a frame interval every frame has at most
+one partner, so the greedy pairs are the best ones and which frames are
+dropped only depends on capture times and arrival order. The tolerance is
+capped at half the measured frame interval for that reason, and is that by
+default: the cameras run freely, so their frames can be up to half an
+interval apart, and the adaptive rate changes the interval as it goes.
+
+A stream whose partner has sent nothing for STALE_PARTNER seconds is passed
+on unpaired, along with the frames buffered for either stream, so a single
+camera, the stitched equirectangular stream or a rear camera that dropped
+out still show, and nothing stalls waiting for the partner.
+
+benchmark() runs the synchronizer on a simulated clock against two
+streams with network jitter and loss, as `python bench.py sync`.
+"""
+import collections
+import random
+import time
+
+from latency import Histogram
+
+FRONT = 0
+REAR = 1
+# Seconds two frames' capture times may be apart to be paired before the
+# frame intervals are known; after that, half the longest interval
+DEFAULT_TOLERANCE = 1 / 60.0
+# Unpaired frames buffered per stream
+DEFAULT_DEPTH = 3
+# Seconds without a frame after which a stream is taken to have stopped
+STALE_PARTNER = 1.0
+# Weight of a new frame interval in the running estimate
+INTERVAL_WEIGHT = 0.1
+# Intervals this many times the estimate or more are frames that went missing
+GAP = 1.5
+
+# A frame waiting for its partner
+_Pending = collections.namedtuple("_Pending", "frame_id data captured arrived")
+
+
+class FrameSynchronizer(object):
+    """
+    Pairs the frames of streams (front, rear) by capture time and passes
+    them to callback(stream, frame_id, data, captured), the front frame of a
+    pair first. Frames of any other stream are passed straight on. push()
+    takes frames in the same form, e.g. as a stamped FrameReceiver callback.
+
+    tolerance, in seconds, caps the default of half a frame interval. stats
+    counts pairs, frames dropped unpaired and frames passed on without a
+    partner; waited is a latency.Histogram of the seconds the first frame of
+    each pair spent waiting for the second. clock gives the arrival time of a
+    frame, time.monotonic by default.
+    """
+
+    def __init__(self, callback, streams=(FRONT, REAR), tolerance=None,
+                 depth=DEFAULT_DEPTH, clock=time.monotonic):
+        self.callback = callback
+        self.streams = tuple(streams)
+        self.tolerance = tolerance
+        self.depth = depth
+        self.clock = clock
+        self._pending = {stream: collections.deque() for stream in self.streams}
+        self._last_captured = {}
+        self._last_arrived = {}
+        self._interval = {}
+        self.stats = {"paired": 0, "dropped": 0, "unpaired": 0}
+        self.waited = Histogram()
+
+    def _effective_tolerance(self):
+        intervals = list(self._interval.values())
+        if len(intervals) < len(self.streams):
+            return self.tolerance or DEFAULT_TOLERANCE
+        half = max(intervals) / 2
+        return min(self.tolerance, half) if self.tolerance else half
+
+    def _drop(self, pending, count=1):
+        for _ in range(count):
+            pending.popleft()
+        self.stats["dropped"] += count
+
+    def _alone(self, stream, frame_id, data, captured):
+        self.stats["unpaired"] += 1
+        self.callback(stream, frame_id, data, captured)
+
+    def push(self, stream, frame_id, data, captured):
+        if stream not in self._pending:
+            self.callback(stream, frame_id, data, captured)
+            return
+        now = self.clock()
+        previous = self._last_captured.get(stream)
+        if previous is not None and captured > previous:
+            interval = captured - previous
+            estimate = self._interval.get(stream, interval)
+            # A gap left by lost frames is not a longer interval.
+            if interval < GAP * estimate:
+                self._interval[stream] = estimate + INTERVAL_WEIGHT * (interval - estimate)
+        self._last_captured[stream] = captured
+        self._last_arrived[stream] = now
+
+        other = self.streams[1] if stream == self.streams[0] else self.streams[0]
+        own, theirs = self._pending[stream], self._pending[other]
+        other_arrived = self._last_arrived.get(other)
+        if other_arrived is None or now - other_arrived > STALE_PARTNER:
+            # No partner to wait for; whatever is buffered goes on alone too,
+            # oldest first, as its partners will not come either.
+            for each, pending in ((other, theirs), (stream, own)):
+                while pending:
+                    self._alone(each, *pending.popleft()[:3])
+            self._alone(stream, frame_id, data, captured)
+            return
+
+        tolerance = self._effective_tolerance()
+        while theirs and theirs[0].captured < captured - tolerance:
+            self._drop(theirs)
+        best = None
+        for index, pending in enumerate(theirs):
+            distance = abs(pending.captured - captured)
+            if distance <= tolerance and (best is None or distance < best[1]):
+                best = (index, distance)
+        if best is None:
+            own.append(_Pending(frame_id, data, captured, now))
+            if len(own) > self.depth:
+                self._drop(own)
+            return
+
+        self._drop(theirs, best[0])
+        partner = theirs.popleft()
+        # Nothing buffered for this stream is older than a partner that
+        # could still come.
+        self._drop(own, len(own))
+        self.stats["paired"] += 1
+        self.waited.record(now - partner.arrived)
+        frames = {stream: (frame_id, data, captured),
+                  other: (partner.frame_id, partner.data, partner.captured)}
+        for each in self.streams:
+            self.callback(each, *frames[each])
+
+
+#######################################
+# Benchmark
+#######################################
+def _arrivals(fps, duration, phase, delay, jitter, loss, capture_jitter, rng):
+    '''(arrival, stream, captured, index) of both streams' frames, in arrival order'''
+    events = []
+    for stream, offset in ((FRONT, 0.0), (REAR, phase)):
+        for k in range(int(duration * fps)):
+            if rng.random() < loss:
+                continue
+            captured = k / fps + offset + rng.gauss(0, capture_jitter)
+            # Jitter has a long tail, as queueing delays do.
+            arrival = captured + delay + (rng.expovariate(1 / jitter) if jitter else 0)
+            events.append((arrival, stream, captured, k))
+    events.sort()
+    return events
+
+
+def simulate(fps=30.0, duration=60.0, phase=0.012, delay=0.02, jitter=0.005, loss=0.0,
+             capture_jitter=0.001, tolerance=None, depth=DEFAULT_DEPTH, seed=1):
+    '''
+    Two streams at fps, the rear captured phase seconds after the front,
+    arriving delay plus an exponentially distributed jitter (mean jitter
+    seconds) after capture, losing a loss fraction of frames. Returns a
+    dict: "pairing", the fraction of frames per stream that were paired;
+    "pairable", the fraction whose own partner was delivered at all;
+    "dropped"; "added_ms", percentiles in ms of the latency pairing added,
+    the first frame's wait for the second; "skew_ms" and "unsynced_skew_ms",
+    percentiles in ms of how far apart the capture times of the front and
+    rear frames on show were, with and without the synchronizer.
+    '''
+    rng = random.Random(seed)
+    events = _arrivals(fps, duration, phase, delay, jitter, loss, capture_jitter, rng)
+    clock = [0.0]
+    shown = {}
+    synced_skew = Histogram()
+
+    def show(stream, frame_id, data, captured):
+        shown[stream] = captured
+        if stream == REAR and FRONT in shown:
+            synced_skew.record(abs(shown[REAR] - shown[FRONT]))
+
+    synchronizer = FrameSynchronizer(show, tolerance=tolerance, depth=depth,
+                                     clock=lambda: clock[0])
+    # Without it, each topic shows its newest frame.
+    newest = {}
+    unsynced_skew = Histogram()
+    frames = 0
+    delivered = {FRONT: set(), REAR: set()}
+    for arrival, stream, captured, index in events:
+        # The receiver drops frames that arrive after a newer one.
+        if captured < newest.get(stream, float("-inf")):
+            continue
+        newest[stream] = captured
+        delivered[stream].add(index)
+        frames += 1
+        if len(newest) == 2:
+            unsynced_skew.record(abs(newest[FRONT] - newest[REAR]))
+        clock[0] = arrival
+        synchronizer.push(stream, frames, None, captured)
+
+    def percentiles(histogram):
+        if not histogram.total:
+            return {}
+        return {p: round(histogram.percentile(p) * 1000, 1) for p in (50, 99)}
+
+    stats = synchronizer.stats
+    both = len(delivered[FRONT] & delivered[REAR])
+    return {
+        "pairing": round(2 * stats["paired"] / float(frames), 3) if frames else 0.0,
+        "pairable": round(2 * both / float(frames), 3) if frames else 0.0,
+        "dropped": stats["dropped"],
+        "added_ms": percentiles(synchronizer.waited),
+        "skew_ms": percentiles(synced_skew),
+        "unsynced_skew_ms": percentiles(unsynced_skew),
+    }
+
+
+def benchmark(fps=30.0, duration=60.0, jitter=(0.0, 0.005, 0.015, 0.03), loss=(0.0, 0.02),
+              tolerance=None, seed=1):
+    '''simulate() for every combination of jitter and loss, as {(jitter, loss): result}'''
+    return {(each_jitter, each_loss): simulate(fps=fps, duration=duration, jitter=each_jitter,
+                                               loss=each_loss, tolerance=tolerance, seed=seed)
+            for each_jitter in jitter for each_loss in loss}
@@ -0,0 +1,283 @@
+"""
+Loss tolerant UDP transport for camera frames.
+
+Each frame is cut into fixed size datagrams. Every group of group_size data
+datagrams is followed by one XOR parity datagram, so the receiver can rebuild
+any single lost datagram per group without a retransmission. Frames that
+cannot be completed, or that arrive after a newer frame of the same stream
+was delivered, are dropped: for teleoperation a late frame is worthless and
+waiting for it would stall everything behind it.
+
+Frame ids count from 1 again whenever a sender starts, e.g. when the
+supervisor respawns it or a recording is replayed. The receiver takes a
+stream whose datagrams come from a new address, or whose frame id falls
+more than RESTART_GAP behind the newest delivered one, to be a new sender
+and starts that stream over instead of dropping its frames as late.
+
+Datagram layout (network byte order):
+
+    frame id      uint32
+    stream        uint8
+    group size    uint8
+    index         uint16   data shards first, then one parity shard per group
+    data shards   uint16
+    frame length  uint32
+    captured      float64  sender's wall clock when the frame was captured
+    sent          float64  sender's wall clock when the frame was sent
+    payload       PAYLOAD_SIZE bytes (the last data shard may be shorter)
+"""
+import collections
+import socket
+import struct
+import threading
+import time
+
+HEADER = struct.Struct("!IBBHHIdd")
+# Keeps header + payload under a 1500 byte MTU with room for IP/UDP headers
+PAYLOAD_SIZE = 1400
+DEFAULT_GROUP_SIZE = 8
+# Seconds a partially received frame is kept before it is given up on
+DEFAULT_MAX_AGE = 0.2
+# Frames a frame id may fall behind the newest delivered one and still be a
+# late frame of the same sender; datagrams that late are long past max_age.
+RESTART_GAP = 64
+
+# Wall clock times of one frame: captured and sent on the sender's clock,
+# received (completed) and displayed (handed to the callback, or to whatever
+# shows it after that) on the receiver's.
+FrameStamps = collections.namedtuple("FrameStamps", "captured sent received displayed")
+
+
+def _xor(blocks, size):
+    acc = 0
+    for block in blocks:
+        acc ^= int.from_bytes(block.ljust(size, b"\0"), "big")
+    return acc.to_bytes(size, "big")
+
+
+def encode_frame(frame_id, stream, data, group_size=DEFAULT_GROUP_SIZE,
+                 payload_size=PAYLOAD_SIZE, captured=0.0, sent=0.0):
+    '''Split one frame into a list of datagrams, parity included'''
+    shards = [data[i:i + payload_size] for i in range(0, len(data), payload_size)] or [b""]
+    count = len(shards)
+    packets = []
+    for index, shard in enumerate(shards):
+        packets.append(HEADER.pack(frame_id, stream, group_size, index, count,
+                                   len(data), captured, sent) + shard)
+    for group, start in enumerate(range(0, count, group_size)):
+        parity = _xor(shards[start:start + group_size], payload_size)
+        packets.append(HEADER.pack(frame_id, stream, group_size, count + group,
+                                   count, len(data), captured, sent) + parity)
+    return packets
+
+
+class _PartialFrame(object):
+    def __init__(self, count, length, group_size, captured, sent):
+        self.count = count
+        self.length = length
+        self.group_size = group_size
+        self.captured = captured
+        self.sent = sent
+        self.shards = {}
+        self.parity = {}
+        self.first_seen = time.monotonic()
+
+    def add(self, index, payload):
+        if index < self.count:
+            self.shards[index] = payload
+        else:
+            self.parity[index - self.count] = payload
+
+    def assemble(self, payload_size):
+        '''Return the frame bytes if every shard is present or recoverable'''
+        if len(self.shards) + len(self.parity) < self.count:
+            return None
+        if len(self.shards) < self.count:
+            for group, start in enumerate(range(0, self.count, self.group_size)):
+                members = range(start, min(start + self.group_size, self.count))
+                missing = [i for i in members if i not in self.shards]
+                if not missing:
+                    continue
+                if len(missing) > 1 or group not in self.parity:
+                    return None
+                present = [self.shards[i] for i in members if i in self.shards]
+                self.shards[missing[0]] = _xor(present + [self.parity[group]],
+                                               payload_size)
+        data = b"".join(self.shards[i] for i in range(self.count))
+        return data[:self.length]
+
+
+class FrameSender(object):
+    """
+    Sends frames of one stream to a FrameReceiver at (host, port). Every
+    observer's sent(stream, nbytes) method is called for every frame.
+    """
+
+    def __init__(self, host, port, stream=0, group_size=DEFAULT_GROUP_SIZE,
+                 payload_size=PAYLOAD_SIZE, observers=()):
+        self.addr = (host, port)
+        self.stream = stream
+        self.observers = list(observers)
+        self.group_size = group_size
+        self.payload_size = payload_size
+        self.frame_id = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 << 20)
+
+    def send(self, data, captured=None):
+        '''Send one frame; captured is the time.time() it was captured at'''
+        self.frame_id = (self.frame_id + 1) & 0xffffffff
+        sent = time.time()
+        if captured is None:
+            captured = sent
+        for packet in encode_frame(self.frame_id, self.stream, data, self.group_size,
+                                   self.payload_size, captured, sent):
+            self.sock.sendto(packet, self.addr)
+        for observer in self.observers:
+            observer.sent(self.stream, len(data))
+        return self.frame_id
+
+    def close(self):
+        self.sock.close()
+
+
+class FrameReceiver(object):
+    """
+    Receives frames from any number of FrameSenders and passes every
+    completed frame to callback(stream, frame_id, data), or with stamped to
+    callback(stream, frame_id, data, captured), captured being the sender's
+    capture time.
+
+    stats holds running counters: frames delivered, frames dropped (late or
+    incomplete), datagrams and bytes received. Every observer's
+    delivered(stream, nbytes, stamps) or dropped(stream) method is called for
+    every frame, stamps being the frame's FrameStamps. peer is the address the
+    last datagram came from, and stamps the FrameStamps of the frame being
+    handed to the callback, displayed not yet set; a callback that holds
+    frames back can keep them to stamp the frame once it is shown. restarts
+    counts streams started over for a new sender.
+    """
+
+    def __init__(self, port, callback, host="0.0.0.0", max_age=DEFAULT_MAX_AGE,
+                 payload_size=PAYLOAD_SIZE, observers=(), stamped=False):
+        self.callback = callback
+        self.stamped = stamped
+        self.observers = list(observers)
+        self.peer = None
+        self.stamps = None
+        self.max_age = max_age
+        self.payload_size = payload_size
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 << 20)
+        self.sock.bind((host, port))
+        self.sock.settimeout(self.max_age)
+        self._partial = {}
+        self._delivered = {}
+        self._peers = {}
+        self._running = False
+        self.stats = {"delivered": 0, "dropped": 0, "datagrams": 0, "bytes": 0,
+                      "restarts": 0}
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._running = False
+
+    def run(self):
+        self._running = True
+        last_expire = time.monotonic()
+        try:
+            while self._running:
+                try:
+                    packet, self.peer = self.sock.recvfrom(HEADER.size + self.payload_size)
+                    self.handle(packet, self.peer)
+                except socket.timeout:
+                    pass
+                now = time.monotonic()
+                if now - last_expire > self.max_age:
+                    self._expire()
+                    last_expire = now
+        finally:
+            self.sock.close()
+
+    def _behind(self, stream, frame_id):
+        '''Frames frame_id is behind the newest delivered of stream, or None'''
+        last = self._delivered.get(stream)
+        if last is None:
+            return None
+        # Serial number comparison so the 32 bit frame id can wrap
+        behind = (last - frame_id) & 0xffffffff
+        return behind if behind < 0x80000000 else None
+
+    def _is_late(self, stream, frame_id):
+        return self._behind(stream, frame_id) is not None
+
+    def _restart(self, stream):
+        '''Forget stream's frames, which came from a sender that is gone'''
+        self._delivered.pop(stream, None)
+        for key in [k for k in self._partial if k[0] == stream]:
+            del self._partial[key]
+            self._dropped(stream)
+        self.stats["restarts"] += 1
+
+    def handle(self, packet, peer=None):
+        '''Take one datagram; peer is the address it came from, if known'''
+        if len(packet) < HEADER.size:
+            return
+        (frame_id, stream, group_size, index, count, length,
+         captured, sent) = HEADER.unpack_from(packet)
+        self.stats["datagrams"] += 1
+        self.stats["bytes"] += len(packet)
+        if peer is not None:
+            known = self._peers.get(stream)
+            self._peers[stream] = peer
+            if known is not None and known != peer:
+                self._restart(stream)
+        behind = self._behind(stream, frame_id)
+        if behind is not None and behind > RESTART_GAP:
+            self._restart(stream)
+        elif behind is not None:
+            return
+        key = (stream, frame_id)
+        partial = self._partial.get(key)
+        if partial is None:
+            partial = self._partial[key] = _PartialFrame(count, length, group_size,
+                                                         captured, sent)
+        partial.add(index, packet[HEADER.size:])
+        data = partial.assemble(self.payload_size)
+        if data is None:
+            return
+        del self._partial[key]
+        self._delivered[stream] = frame_id
+        self.stats["delivered"] += 1
+        self._drop_older(stream, frame_id)
+        self.stamps = FrameStamps(partial.captured, partial.sent, time.time(), None)
+        if self.stamped:
+            self.callback(stream, frame_id, data, partial.captured)
+        else:
+            self.callback(stream, frame_id, data)
+        if self.observers:
+            stamps = self.stamps._replace(displayed=time.time())
+            for observer in self.observers:
+                observer.delivered(stream, length, stamps)
+
+    def _drop_older(self, stream, frame_id):
+        for key in [k for k in self._partial if k[0] == stream]:
+            if self._is_late(stream, key[1]):
+                del self._partial[key]
+                self._dropped(stream)
+
+    def _expire(self):
+        now = time.monotonic()
+        for key, partial in list(self._partial.items()):
+            if now - partial.first_seen > self.max_age:
+                del self._partial[key]
+                self._dropped(key[0])
+
+    def _dropped(self, stream):
+        self.stats["dropped"] += 1
+        for observer in self.observers:
+            observer.dropped(stream)
@@ -0,0 +1,314 @@
+"""
+Live health of a running launch: CPU, memory and threads of every process
+it started, and the frame rate and throughput of every camera stream, on
+the base and on the robot.
+
+HealthSampler takes one reading of the machine it runs on: a single pass
+over /proc (proc_stats.scan) and one small file, STREAM_STATS_FILE, that the
+UDP camera streams keep up to date through StreamCounters. After the first
+reading only new processes and those of the launch are read again, so a
+reading costs about as much as the launch has processes, a millisecond or
+two for a few dozen.
+
+The robot is read by `Project-Crunch health`, which prints a JSON reading
+every second. RemoteHealth starts it once over the shared ssh channel and
+keeps the latest line, so sampling the robot costs no connection or process
+start per reading.
+
+HealthMonitor samples the base and collects the robot's readings on a
+background thread; the GUI only ever looks at its latest readings.
+"""
+import json
+import os
+import subprocess
+import threading
+import time
+
+import proc_stats
+
+STREAM_STATS_FILE = os.path.join(os.path.expanduser("~"), ".cache", "project-crunch",
+                                 "streams.json")
+# robot_launch.sh records the id of the session it runs in here
+SESSION_FILE = os.path.join(os.path.expanduser("~"), ".cache", "project-crunch",
+                            "robot-launch.session")
+# Seconds between readings
+SAMPLE_INTERVAL = 1.0
+# Seconds after which stream counters or a robot reading are out of date
+STALE_AFTER = 3.0
+# Seconds to wait before starting the robot's health reporter again
+RESTART_DELAY = 5.0
+
+
+class StreamCounters(object):
+    """
+    Frame observer for FrameSender and FrameReceiver that counts frames,
+    bytes and drops per stream and writes the totals to path every
+    write_interval seconds.
+    """
+
+    def __init__(self, path=STREAM_STATS_FILE, write_interval=SAMPLE_INTERVAL):
+        self.path = path
+        self.write_interval = write_interval
+        # stream: [frames, bytes, dropped]
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._last_write = time.monotonic()
+
+    def _count(self, stream, frames, nbytes, dropped):
+        with self._lock:
+            counts = self.counts.setdefault(stream, [0, 0, 0])
+            counts[0] += frames
+            counts[1] += nbytes
+            counts[2] += dropped
+            now = time.monotonic()
+            if now - self._last_write > self.write_interval:
+                self._last_write = now
+                self.write()
+
+    def sent(self, stream, nbytes):
+        self._count(stream, 1, nbytes, 0)
+
+    def delivered(self, stream, nbytes, stamps):
+        self._count(stream, 1, nbytes, 0)
+
+    def dropped(self, stream):
+        self._count(stream, 0, 0, 1)
+
+    def write(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump({"time": time.time(),
+                       "streams": {str(stream): counts
+                                   for stream, counts in self.counts.items()}}, f)
+        os.replace(tmp, self.path)
+
+
+def read_session(path=SESSION_FILE, proc_root="/proc"):
+    '''
+    The session id robot_launch.sh recorded, or None. The record is stale,
+    and the id may belong to an unrelated session, if it was written before
+    the last boot or its session leader is now some other program.
+    '''
+    try:
+        with open(path) as f:
+            session = int(f.read())
+            written = os.fstat(f.fileno()).st_mtime
+    except (OSError, ValueError):
+        return None
+    if written < proc_stats.boot_time(proc_root):
+        return None
+    try:
+        with open(os.path.join(proc_root, str(session), "cmdline"), "rb") as f:
+            command = f.read()
+    except OSError:
+        # The leader has exited; what it started still carries the id.
+        return session
+    return session if b"robot_launch.sh" in command else None
+
+
+class HealthSampler(object):
+    """
+    Readings of the launch's processes on this machine. groups is a
+    callable returning the process groups of the launch; session_file holds
+    the id of a session to include as well. Descendants of either are
+    included too.
+
+    sample() returns a dict: "time", the wall clock; "processes", a list of
+    dicts with pid, name, cpu (percent of one core since the last reading),
+    rss (bytes) and threads; "streams", a list of dicts with stream, fps,
+    bytes_per_s and dropped_per_s.
+    """
+
+    def __init__(self, groups=None, session_file=None, stream_file=STREAM_STATS_FILE,
+                 proc_root="/proc"):
+        self.groups = groups or (lambda: ())
+        self.session_file = session_file
+        self.stream_file = stream_file
+        self.proc_root = proc_root
+        self._processes = {}
+        self._streams = None
+        # Pids already seen outside the launch. A process does not join
+        # it later, so these are not read again.
+        self._outside = set()
+
+    def sample(self):
+        present = proc_stats.pids(self.proc_root)
+        # Pids that exited are forgotten, as they get reused.
+        self._outside &= present
+        table = proc_stats.scan(self.proc_root, present - self._outside)
+        sessions = ()
+        if self.session_file is not None:
+            session = read_session(self.session_file)
+            sessions = () if session is None else (session,)
+        pids = proc_stats.family(table, self.groups(), sessions)
+        processes = []
+        for pid in sorted(pids):
+            info = table[pid]
+            if info.state == "Z":
+                continue
+            before = self._processes.get(pid)
+            cpu = 0.0
+            if before is not None and before.name == info.name:
+                cpu = proc_stats.cpu_percent(before, info)
+            processes.append({"pid": pid, "name": info.name, "cpu": round(cpu, 1),
+                              "rss": info.rss, "threads": info.threads})
+        self._processes = {pid: table[pid] for pid in pids}
+        self._outside.update(pid for pid in table if pid not in pids)
+        return {"time": time.time(), "processes": processes, "streams": self.streams()}
+
+    def streams(self):
+        '''Rates from the stream counters since the last call'''
+        try:
+            with open(self.stream_file) as f:
+                current = json.load(f)
+        except (OSError, ValueError):
+            return []
+        before, self._streams = self._streams, current
+        if time.time() - current["time"] > STALE_AFTER:
+            return []
+        if before is None or current["time"] <= before["time"]:
+            return []
+        elapsed = current["time"] - before["time"]
+        rates = []
+        for stream, counts in sorted(current["streams"].items(), key=lambda item: int(item[0])):
+            previous = before["streams"].get(stream, [0, 0, 0])
+            frames, nbytes, dropped = [max(now - then, 0) / elapsed
+                                       for now, then in zip(counts, previous)]
+            rates.append({"stream": int(stream), "fps": round(frames, 1),
+                          "bytes_per_s": round(nbytes), "dropped_per_s": round(dropped, 1)})
+        return rates
+
+
+class RemoteHealth(object):
+    """
+    The robot's readings, from one `Project-Crunch health` started over
+    connection (an ssh_pool.RobotConnection) and kept running. command is
+    the remote command line that starts it. latest is the last reading, or
+    None if there is none newer than STALE_AFTER.
+    """
+
+    def __init__(self, connection, command):
+        self.connection = connection
+        self.command = command
+        self._latest = None
+        self._received = None
+        self._proc = None
+        self._stop = threading.Event()
+
+    @property
+    def latest(self):
+        if self._received is None or time.monotonic() - self._received > STALE_AFTER:
+            return None
+        return self._latest
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True, name="remote-health")
+        thread.start()
+        return thread
+
+    def run(self):
+        '''Read the robot's readings until stopped, restarting the reporter if it exits'''
+        while not self._stop.is_set():
+            self._proc = self.connection.popen(self.command, stdin=subprocess.DEVNULL,
+                                               stdout=subprocess.PIPE,
+                                               stderr=subprocess.DEVNULL,
+                                               universal_newlines=True, bufsize=1)
+            for line in self._proc.stdout:
+                try:
+                    self._latest = json.loads(line)
+                except ValueError:
+                    continue
+                self._received = time.monotonic()
+            self._proc.wait()
+            self._stop.wait(RESTART_DELAY)
+
+    def stop(self):
+        self._stop.set()
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.terminate()
+
+
+class HealthMonitor(object):
+    """
+    Samples this machine with sampler every interval seconds on a background
+    thread and collects the robot's readings from remote, once it is set.
+    readings() returns the latest of each, by side.
+    """
+
+    def __init__(self, sampler, remote=None, interval=SAMPLE_INTERVAL):
+        self.sampler = sampler
+        self.remote = remote
+        self.interval = interval
+        self.base = None
+        self._stop = threading.Event()
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True, name="health")
+        thread.start()
+        return thread
+
+    def run(self):
+        while not self._stop.is_set():
+            self.base = self.sampler.sample()
+            self._stop.wait(self.interval)
+
+    def watch_remote(self, remote):
+        self.remote = remote
+        remote.start()
+
+    def readings(self):
+        readings = {}
+        if self.base is not None:
+            readings["base"] = self.base
+        robot = self.remote.latest if self.remote is not None else None
+        if robot is not None:
+            readings["robot"] = robot
+        return readings
+
+    def stop(self):
+        self._stop.set()
+        if self.remote is not None:
+            self.remote.stop()
+
+
+def report(interval=SAMPLE_INTERVAL, count=0, session_file=SESSION_FILE,
+           stream_file=STREAM_STATS_FILE):
+    '''
+    Print a JSON reading of the robot launch every interval seconds, count
+    times or forever; what RemoteHealth reads
+    '''
+    sampler = HealthSampler(session_file=session_file, stream_file=stream_file)
+    printed = 0
+    while not count or printed < count:
+        start = time.monotonic()
+        try:
+            print(json.dumps(sampler.sample()), flush=True)
+        except BrokenPipeError:
+            # The base went away; so does the reporter.
+            return
+        printed += 1
+        time.sleep(max(interval - (time.monotonic() - start), 0))
+
+
+def benchmark(processes=50, samples=20):
+    '''
+    Seconds per sample() with processes fake launch processes (sleeps in
+    one process group) to watch
+    '''
+    children = [subprocess.Popen(["sleep", "60"], preexec_fn=os.setpgrp)]
+    pgid = children[0].pid
+    for _ in range(processes - 1):
+        children.append(subprocess.Popen(["sleep", "60"],
+                                         preexec_fn=lambda: os.setpgid(0, pgid)))
+    try:
+        sampler = HealthSampler(groups=lambda: (pgid,))
+        sampler.sample()
+        start = time.perf_counter()
+        for _ in range(samples):
+            sampler.sample()
+        return (time.perf_counter() - start) / samples
+    finally:
+        for child in children:
+            child.kill()
+            child.wait()
@@ -0,0 +1,228 @@
+"""
+End-to-end frame latency for the UDP camera streams.
+
+Every frame carries the robot's wall clock at capture and at send, and the
+base adds its own receive and display stamps (frame_transport.FrameStamps).
+LatencyRecorder turns each set of stamps into per stage latencies:
+
+    encode   capture -> send       robot clock
+    network  send -> receive       robot to base, offset corrected
+    display  receive -> display    base clock
+    total    capture -> display    robot to base, offset corrected
+
+The robot/base clock offset is estimated by ClockSync, which pings the
+robot's control port and keeps the sample with the smallest round trip, so
+neither machine needs NTP.
+
+Latencies go into histograms with logarithmic buckets: recording is one
+increment, and percentiles are accurate to within BUCKET_RATIO. The recorder
+writes them every few seconds to LATENCY_FILE, a few KB of binary, which the
+launcher and `Project-Crunch latency-report` read.
+"""
+import collections
+import math
+import os
+import socket
+import struct
+import threading
+import time
+
+STAGES = ("encode", "network", "display", "total")
+
+LATENCY_FILE = os.path.join(os.path.expanduser("~"), ".cache", "project-crunch",
+                            "latency.bin")
+
+# Bucket 0 holds everything up to MIN_LATENCY; bucket i holds
+# (MIN_LATENCY * BUCKET_RATIO ** (i - 1), MIN_LATENCY * BUCKET_RATIO ** i].
+# 256 buckets reach about 12 seconds.
+MIN_LATENCY = 50e-6
+BUCKET_RATIO = 1.05
+BUCKETS = 256
+_LOG_RATIO = math.log(BUCKET_RATIO)
+
+# magic, version, stage count, time written, clock offset
+FILE_HEADER = struct.Struct("!4sBBdd")
+FILE_MAGIC = b"CRLT"
+FILE_VERSION = 1
+STAGE_NAME = struct.Struct("!8s")
+COUNTS = struct.Struct("!{}I".format(BUCKETS))
+
+# magic, base send time, robot reply time
+PING = struct.Struct("!4sdd")
+PING_MAGIC = b"PING"
+
+
+class Histogram(object):
+    '''Latency histogram with logarithmic buckets'''
+
+    def __init__(self, counts=None):
+        self.counts = list(counts) if counts is not None else [0] * BUCKETS
+        self.total = sum(self.counts)
+
+    def record(self, seconds):
+        if seconds <= MIN_LATENCY:
+            index = 0
+        else:
+            index = min(int(math.log(seconds / MIN_LATENCY) / _LOG_RATIO) + 1,
+                        BUCKETS - 1)
+        self.counts[index] += 1
+        self.total += 1
+
+    def percentile(self, p):
+        '''Upper bound of the bucket holding the p-th percentile, in seconds'''
+        if not self.total:
+            return None
+        rank = max(1, int(math.ceil(p / 100.0 * self.total)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return MIN_LATENCY * BUCKET_RATIO ** index
+        return MIN_LATENCY * BUCKET_RATIO ** (BUCKETS - 1)
+
+
+def write_stats(histograms, offset=0.0, path=LATENCY_FILE):
+    '''Atomically write a dict of stage name -> Histogram to path'''
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    parts = [FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, len(histograms),
+                              time.time(), offset)]
+    for name, histogram in histograms.items():
+        parts.append(STAGE_NAME.pack(name.encode("ascii")))
+        parts.append(COUNTS.pack(*histogram.counts))
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(b"".join(parts))
+    os.replace(tmp, path)
+
+
+def read_stats(path=LATENCY_FILE):
+    '''
+    Return (time written, clock offset, OrderedDict of stage -> Histogram)
+    from a file written by write_stats. Raises ValueError if it is not one.
+    '''
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < FILE_HEADER.size:
+        raise ValueError("{} is truncated".format(path))
+    magic, version, count, written, offset = FILE_HEADER.unpack_from(data)
+    if magic != FILE_MAGIC or version != FILE_VERSION:
+        raise ValueError("{} is not a latency file".format(path))
+    if len(data) != FILE_HEADER.size + count * (STAGE_NAME.size + COUNTS.size):
+        raise ValueError("{} is truncated".format(path))
+    histograms = collections.OrderedDict()
+    pos = FILE_HEADER.size
+    for _ in range(count):
+        name = STAGE_NAME.unpack_from(data, pos)[0].rstrip(b"\0").decode("ascii")
+        pos += STAGE_NAME.size
+        histograms[name] = Histogram(COUNTS.unpack_from(data, pos))
+        pos += COUNTS.size
+    return written, offset, histograms
+
+
+def summary(histograms):
+    '''One line per stage: p50/p95/p99 in milliseconds and the frame count'''
+    lines = []
+    for name, histogram in histograms.items():
+        if not histogram.total:
+            continue
+        lines.append("{:<8} p50 {:6.1f}  p95 {:6.1f}  p99 {:6.1f} ms  ({} frames)".format(
+            name, *[histogram.percentile(p) * 1000 for p in (50, 95, 99)],
+            histogram.total))
+    return lines
+
+
+class LatencyRecorder(object):
+    """
+    Frame observer for FrameReceiver that records every frame's per stage
+    latencies and writes the histograms to path every write_interval seconds.
+    clock is a ClockSync (or anything with an offset attribute, in seconds
+    robot minus base); without one both machines are assumed to agree.
+    """
+
+    def __init__(self, path=LATENCY_FILE, clock=None, write_interval=2.0):
+        self.path = path
+        self.clock = clock
+        self.write_interval = write_interval
+        self.histograms = collections.OrderedDict((name, Histogram()) for name in STAGES)
+        self._last_write = time.monotonic()
+
+    @property
+    def offset(self):
+        return self.clock.offset if self.clock is not None else 0.0
+
+    def delivered(self, stream, nbytes, stamps):
+        offset = self.offset
+        record = self.histograms
+        record["encode"].record(stamps.sent - stamps.captured)
+        record["network"].record(stamps.received - (stamps.sent - offset))
+        record["display"].record(stamps.displayed - stamps.received)
+        record["total"].record(stamps.displayed - (stamps.captured - offset))
+        now = time.monotonic()
+        if now - self._last_write > self.write_interval:
+            self._last_write = now
+            self.write()
+
+    def dropped(self, stream):
+        pass
+
+    def write(self):
+        write_stats(self.histograms, self.offset, self.path)
+
+
+def answer_ping(sock, data, address):
+    '''Robot side: stamp a ping from ClockSync and send it back'''
+    magic, sent, _ = PING.unpack(data)
+    sock.sendto(PING.pack(magic, sent, time.time()), address)
+
+
+class ClockSync(object):
+    """
+    Estimates the robot clock minus the base clock by pinging the robot's
+    control port every interval seconds. Each ping gives
+    offset = robot time - (send + receive) / 2, which is exact when the two
+    directions take equally long; the sample with the smallest round trip
+    out of the last window is used, as it had the least queueing to skew it.
+    """
+
+    def __init__(self, receiver, control_port, interval=1.0, window=30, timeout=0.5):
+        self.receiver = receiver
+        self.control_port = control_port
+        self.interval = interval
+        self.timeout = timeout
+        self.samples = collections.deque(maxlen=window)
+        self.offset = 0.0
+        self.round_trip = None
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def run(self):
+        '''Ping forever, updating offset; blocks'''
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(self.timeout)
+        while True:
+            if self.receiver.peer is not None:
+                self.ping(sock, (self.receiver.peer[0], self.control_port))
+            time.sleep(self.interval)
+
+    def ping(self, sock, address):
+        sent = time.time()
+        sock.sendto(PING.pack(PING_MAGIC, sent, 0.0), address)
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            try:
+                data = sock.recv(PING.size)
+            except socket.timeout:
+                return
+            received = time.time()
+            if len(data) != PING.size:
+                continue
+            magic, echoed, remote = PING.unpack(data)
+            # Replies to earlier pings that timed out are ignored.
+            if magic != PING_MAGIC or echoed != sent:
+                continue
+            self.samples.append((received - sent, remote - (sent + received) / 2.0))
+            self.round_trip, self.offset = min(self.samples)
+            return
@@ -0,0 +1,212 @@
+"""
+Parallel system launch with readiness probes.
+
+The launch is described as a graph of stages. Every stage starts as soon as
+the stages it depends on are ready, so the robot and base sides come up at
+the same time and the critical path is only as long as its slowest chain.
+A stage is ready when its action returns; actions that start a process then
+wait on a real readiness signal (an open port, a frame on a topic, a live
+process) through the probes below.
+
+The orchestrator runs its own asyncio loop on a background thread and
+reports progress through a callback, so the Qt event loop never blocks.
+"""
+import asyncio
+import os
+import signal
+import threading
+import time
+
+# Stage states passed to the progress callback
+STARTED = "started"
+READY = "ready"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class Stage(object):
+    """
+    One step of the launch. action is a callable returning either None or an
+    awaitable; the stage is ready once the awaitable completes. The stage
+    fails if that takes longer than timeout seconds.
+    """
+
+    def __init__(self, name, action, depends=(), timeout=120.0):
+        self.name = name
+        self.action = action
+        self.depends = tuple(depends)
+        self.timeout = timeout
+
+
+class LaunchOrchestrator(object):
+    """
+    Runs a set of Stages as a dependency graph.
+
+    progress, if given, is called as progress(stage_name, state, elapsed)
+    from the orchestrator thread every time a stage changes state. elapsed
+    is seconds since the launch began. After the run, timings maps each
+    stage name to its (started, finished) offsets in seconds.
+    """
+
+    def __init__(self, stages, progress=None):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            for dep in stage.depends:
+                if dep not in self.stages:
+                    raise ValueError("Stage {} depends on unknown stage {}"
+                                     .format(stage.name, dep))
+        self.progress = progress
+        self.timings = {}
+        self.states = {}
+        self._t0 = None
+
+    def start(self):
+        '''Run the launch on a daemon thread and return the thread'''
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def run(self):
+        '''Run the launch to completion in a fresh event loop'''
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self._run_all())
+        finally:
+            loop.close()
+        self.report()
+        return all(state == READY for state in self.states.values())
+
+    def report(self):
+        for name, (started, finished) in sorted(self.timings.items(),
+                                                key=lambda item: item[1]):
+            print("{:<12} {:<8} {:7.2f}s -> {:7.2f}s ({:.2f}s)".format(
+                name, self.states.get(name), started, finished, finished - started))
+
+    def _elapsed(self):
+        return time.monotonic() - self._t0
+
+    def _notify(self, name, state):
+        self.states[name] = state
+        if self.progress is not None:
+            self.progress(name, state, self._elapsed())
+
+    async def _run_all(self):
+        self._t0 = time.monotonic()
+        tasks = {}
+        for name in self._ordered():
+            stage = self.stages[name]
+            deps = [tasks[dep] for dep in stage.depends]
+            tasks[name] = asyncio.ensure_future(self._run_stage(stage, deps))
+        await asyncio.gather(*tasks.values())
+
+    def _ordered(self):
+        '''Topologically sort the stages so dependencies are created first'''
+        ordered, visiting = [], set()
+
+        def visit(name):
+            if name in ordered:
+                return
+            if name in visiting:
+                raise ValueError("Launch stages have a dependency cycle at {}".format(name))
+            visiting.add(name)
+            for dep in self.stages[name].depends:
+                visit(dep)
+            visiting.discard(name)
+            ordered.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return ordered
+
+    async def _run_stage(self, stage, deps):
+        dep_results = await asyncio.gather(*deps)
+        if not all(dep_results):
+            self._notify(stage.name, SKIPPED)
+            return False
+        started = self._elapsed()
+        self._notify(stage.name, STARTED)
+        try:
+            result = stage.action()
+            if asyncio.iscoroutine(result) or isinstance(result, asyncio.Future):
+                await asyncio.wait_for(result, stage.timeout)
+        except Exception as exc:
+            print("Launch stage {} failed: {!r}".format(stage.name, exc))
+            self.timings[stage.name] = (started, self._elapsed())
+            self._notify(stage.name, FAILED)
+            return False
+        self.timings[stage.name] = (started, self._elapsed())
+        self._notify(stage.name, READY)
+        return True
+
+
+#######################################
+# Readiness probes
+#######################################
+async def wait_for_port(host, port, interval=0.1):
+    '''Return once something accepts TCP connections on host:port'''
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            await asyncio.sleep(interval)
+            continue
+        writer.close()
+        return
+
+
+async def wait_for_frame(topic, catkin, master_uri, interval=0.5):
+    '''
+    Return once a single message has been received on topic. rostopic needs
+    the ROS environment, so it is run through the catkin workspace setup.
+    If the wait is cancelled, e.g. by the stage timeout, rostopic is killed.
+    '''
+    env = os.environ.copy()
+    env["ROS_MASTER_URI"] = master_uri
+    cmd = "source {}/devel/setup.bash && exec rostopic echo -n 1 {}/header".format(
+            catkin, topic)
+    while True:
+        # A session of its own, so the whole of it can be killed at once.
+        proc = await asyncio.create_subprocess_exec(
+                "bash", "-c", cmd, env=env,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+                start_new_session=True)
+        try:
+            returncode = await proc.wait()
+        finally:
+            if proc.returncode is None:
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                await proc.wait()
+        if returncode == 0:
+            return
+        await asyncio.sleep(interval)
+
+
+def process_alive(name):
+    '''Return True if a process whose command name is name is running'''
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(os.path.join("/proc", pid, "comm")) as f:
+                if f.read().strip() == name:
+                    return True
+        except OSError:
+            # The process exited while we were looking at it.
+            continue
+    return False
+
+
+async def wait_for_process(name, interval=0.2):
+    '''Return once a process named name is running'''
+    while not process_alive(name):
+        await asyncio.sleep(interval)
+
+
+async def run_blocking(func, *args):
+    '''Run a blocking call on the default executor'''
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, func, *args)
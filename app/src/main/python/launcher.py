@@ -0,0 +1,301 @@
+"""
+The system launch, without any GUI.
+
+Launcher holds everything a launch needs: it reads the settings, starts the
+robot and base sides, positions the HMD windows and stops the robot again.
+GUIWindow drives it from its pages, and `Project-Crunch launch` drives it
+straight from the command line:
+
+    Project-Crunch launch --headsets 2
+
+Nothing here imports Qt, and modules that are only needed once the launch
+is under way (Xlib, the launch stages, the latency files) are imported when
+they are first used, so the command line starts its first process as soon
+as possible.
+"""
+import os
+import shlex
+import socket
+import subprocess
+import time
+
+import config_store
+import proc_stats
+from health import HealthMonitor, HealthSampler, RemoteHealth
+from supervisor import Supervisor
+
+# Seconds to wait for rviz to open the HMD windows before giving up
+HMD_WINDOW_DEADLINE = 60
+
+# Seconds to wait for the robot side to stop
+KILL_TIMEOUT = 5
+
+# Settings a launch cannot do without
+REQUIRED_SETTINGS = (
+    "ROBOT_CATKIN_PATH",
+    "BASE_CATKIN_PATH",
+    "ROBOT_HOSTNAME",
+    "ROBOT_USERNAME",
+    "ROBOT_PROJECT_CRUNCH_PATH",
+)
+
+
+class Launcher(object):
+    """
+    One launch of the system. base_launch is the path of base_launch.sh.
+    headsets is the number of HMD windows to position.
+    """
+
+    def __init__(self, base_launch, headsets=1):
+        self.base_launch = base_launch
+        self.headsets = headsets
+        self.orchestrator = None
+        self.robot_connection = None
+        # Owns every local process of the launch; the robot side is
+        # stopped through kill_launch.sh as one of its teardown actions.
+        self.supervisor = Supervisor()
+        self.supervisor.on_stop("robot", self.kill_robot)
+        # Readings of every process the supervisor started; the robot's
+        # are added once there is a connection to it.
+        self.health = HealthMonitor(HealthSampler(
+                groups=lambda: [process.pgid for process in self.supervisor.processes]))
+        self.supervisor.on_stop("health", self.health.stop)
+        # One X connection for every placement of the launch, so the
+        # monitor list is only read again when RandR reports a change.
+        self.layout = None
+        self.supervisor.on_stop("layout", self.close_layout)
+        # Seconds from the start of this process to the first launched one
+        self.first_process = None
+
+    def load_settings(self):
+        '''
+        Read the settings from the configuration and environment. Returns
+        the names of the required ones that are missing.
+        '''
+        # Settings come from the Project Crunch configuration the installer
+        # writes, unless they are set in the environment.
+        self.robot_catkin = config_store.get("ROBOT_CATKIN_PATH")
+        self.base_catkin = config_store.get("BASE_CATKIN_PATH")
+        self.robot_hostname = config_store.get("ROBOT_HOSTNAME")
+        self.robot_username = config_store.get("ROBOT_USERNAME")
+        self.robot_project_crunch_path = config_store.get("ROBOT_PROJECT_CRUNCH_PATH")
+        # Camera transport: "ros" (ROS topics over TCP) or "udp" (loss
+        # tolerant UDP frame transport)
+        self.transport = config_store.get("CRUNCH_TRANSPORT", "ros")
+        # Camera capture: "freshest" (always the newest frame) or "queue"
+        # (every frame, however late)
+        self.capture_mode = config_store.get("CRUNCH_CAPTURE_MODE", "freshest")
+        missing = [name for name in REQUIRED_SETTINGS if config_store.get(name) is None]
+        if missing:
+            return missing
+
+        # Use this section for running the launcher via
+        # the zip or tar release, ie normal use.
+        self.robot_launch = os.path.join(
+                self.robot_project_crunch_path,
+                "Project-Crunch", "Project-Crunch",
+                "target", "Project-Crunch",
+                "robot_launch.sh"
+        )
+        self.kill_launch = os.path.join(
+                self.robot_project_crunch_path,
+                "Project-Crunch", "Project-Crunch",
+                "target", "Project-Crunch",
+                "kill_launch.sh"
+        )
+        # Use this section for running the launcher
+        # in "debug" mode via fbs run, where the installation
+        # being considered is actually the repository.
+        #self.robot_launch = os.path.join(
+        #        self.robot_project_crunch_path,
+        #        "project-crunch", "app", "src",
+        #        "main", "resources", "base",
+        #        "robot_launch.sh"
+        #)
+        #self.kill_launch = os.path.join(
+        #        self.robot_project_crunch_path,
+        #        "project-crunch", "app", "src",
+        #        "main", "resources", "base",
+        #        "kill_launch.sh"
+        #)
+        return []
+
+    def stages(self):
+        '''The launch as a graph of launch_orchestrator Stages'''
+        from launch_orchestrator import (Stage, run_blocking, wait_for_frame,
+                                         wait_for_port, wait_for_process)
+
+        # Robot and base start together; each later stage waits on a real
+        # readiness signal instead of a fixed sleep.
+        master_uri = "http://{}:11311".format(self.robot_hostname)
+        camera_topic = "/camera1/image_raw"
+        if self.transport == "udp":
+            camera_topic += "/compressed"
+        return [
+            # Both block, launch_robot on the ssh handshake, so they run on
+            # the executor to start side by side.
+            Stage("robot", lambda: run_blocking(self.launch_robot)),
+            Stage("base", lambda: run_blocking(self.launch_base)),
+            Stage("roscore", lambda: wait_for_port(self.robot_hostname, 11311),
+                  depends=["robot"]),
+            Stage("cameras", lambda: wait_for_frame(camera_topic,
+                                                    self.base_catkin, master_uri),
+                  depends=["roscore"]),
+            Stage("rviz", lambda: wait_for_process("rviz"), depends=["base"]),
+            # The watcher is event driven, so it can listen from the start.
+            Stage("windows", lambda: run_blocking(self.position_windows),
+                  timeout=HMD_WINDOW_DEADLINE + 5),
+        ]
+
+    def start(self, progress=None):
+        '''
+        Start the launch on a background thread; progress is passed on to
+        the LaunchOrchestrator. Returns the thread.
+        '''
+        from launch_orchestrator import LaunchOrchestrator
+
+        self.orchestrator = LaunchOrchestrator(self.stages(), progress=progress)
+        self.health.start()
+        return self.orchestrator.start()
+
+    def _process_started(self, what):
+        if self.first_process is None:
+            self.first_process = proc_stats.age()
+            print("First process ({}) started {:.2f}s after startup".format(
+                what, self.first_process))
+
+    def position_windows(self):
+        from display_layout import DisplayLayout
+        from window_watcher import HMDWindowWatcher
+
+        names = ["HMD{}".format(i + 1) for i in range(self.headsets)]
+        if self.layout is None:
+            self.layout = DisplayLayout()
+        targets = self.layout.assign(names)
+        if len(targets) < len(names):
+            print("Found {} headset outputs for {} HMD windows".format(
+                len(targets), len(names)))
+        watcher = HMDWindowWatcher(targets, deadline=HMD_WINDOW_DEADLINE)
+        watcher.run()
+
+    def close_layout(self):
+        if self.layout is not None:
+            self.layout.close()
+            self.layout = None
+
+    def launch_robot(self):
+        import ssh_pool
+
+        # All robot traffic shares one multiplexed ssh channel, so only the
+        # first command pays for the handshake.
+        connection = ssh_pool.connection(self.robot_username, self.robot_hostname)
+        start = time.monotonic()
+        connection.open()
+        self.robot_connection = connection
+        sshProcess = self.supervisor.spawn("robot ssh", self.robot_connection.command(),
+                                           stdin=subprocess.PIPE,
+                                           universal_newlines=True,
+                                           bufsize=0).proc
+        self._process_started("robot")
+
+        # robot_launch.sh reads the robot's Project Crunch configuration
+        # itself, so the whole .bashrc does not have to be sourced.
+        sshProcess.stdin.write("export DISPLAY=:0\n")
+        sshProcess.stdin.write("bash {} -c {} -t {} --base-host {} --capture-mode {}\n".format(
+            self.robot_launch, self.robot_catkin, self.transport,
+            socket.gethostname(), self.capture_mode))
+        sshProcess.stdin.close()
+        print("Robot launch sent in {:.3f}s".format(time.monotonic() - start))
+        self.health.watch_remote(RemoteHealth(connection, self.robot_command("health")))
+
+    def robot_command(self, arguments):
+        '''
+        Remote command line that runs `Project-Crunch arguments` from the
+        robot's installation, the way robot_launch.sh runs its tools
+        '''
+        directory = shlex.quote(os.path.dirname(self.robot_launch))
+        return ('if [ -x {0}/Project-Crunch ]; then exec {0}/Project-Crunch {1}; '
+                'else exec python3 {0}/../../python/main.py {1}; fi'.format(directory, arguments))
+
+    def kill_robot(self):
+        if self.robot_connection is None:
+            return
+        start = time.monotonic()
+        self.robot_connection.run("bash {}".format(self.kill_launch), check=False,
+                                  timeout=KILL_TIMEOUT)
+        print("Robot kill finished in {:.3f}s".format(time.monotonic() - start))
+
+    def launch_base(self):
+        my_env = os.environ.copy()
+        my_env["PATH"] = "/usr/sbin:/sbin:" + my_env["PATH"]
+        self.supervisor.spawn("base", ["bash",
+                                       self.base_launch,
+                                       "--catkin",
+                                       self.base_catkin,
+                                       "--transport",
+                                       self.transport],
+                              env=my_env)
+        self._process_started("base")
+
+    def stop(self):
+        '''
+        Stop both sides of the launch at once and close the shared ssh
+        connection
+        '''
+        start = time.monotonic()
+        self.supervisor.stop()
+        if self.robot_connection is not None:
+            import ssh_pool
+
+            ssh_pool.close_all()
+        print("Launch stopped in {:.3f}s".format(time.monotonic() - start))
+
+
+def attached_headsets():
+    '''The Vive headsets plugged in right now, oldest first'''
+    from vive_monitor import HeadsetMonitor
+
+    monitor = HeadsetMonitor()
+    monitor.scan()
+    return monitor.headsets()
+
+
+def launch(base_launch, headsets=1, check_headsets=True):
+    '''
+    Launch the whole system from the command line, print its progress and
+    keep it running until interrupted. Returns an exit code.
+    '''
+    launcher = Launcher(base_launch, headsets)
+    missing = launcher.load_settings()
+    if missing:
+        print("These settings are missing: {}".format(", ".join(missing)))
+        print("Rerun the installer and ssh configuration, or add them to {}".format(
+            config_store.CONFIG_FILE))
+        return 1
+    if check_headsets:
+        found = attached_headsets()
+        if len(found) < headsets:
+            print("Found {} headset(s), need {}. Plug them in and turn them on.".format(
+                len(found), headsets))
+            return 1
+
+    def progress(stage, state, elapsed):
+        print("[launch] {:<8} {:<8} {:6.2f}s".format(stage, state, elapsed), flush=True)
+
+    from launch_orchestrator import READY
+
+    thread = launcher.start(progress)
+    try:
+        thread.join()
+        states = launcher.orchestrator.states.values()
+        if not all(state == READY for state in states):
+            print("The launch did not complete")
+            return 1
+        print("Launched; press Ctrl-C to stop")
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        launcher.stop()
+    return 0
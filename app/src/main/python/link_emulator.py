@@ -0,0 +1,172 @@
+"""
+Localhost link emulation for benchmarking the frame transports.
+
+UdpLinkEmulator and TcpLinkEmulator sit between a sender and a receiver on
+one machine and add latency, jitter and loss (and for UDP, a bandwidth cap
+with a bounded bottleneck queue), so the UDP transport and the
+ROS/TCP path can be compared under the same conditions without a real long
+distance link. TCP cannot lose data from the application's point of view, so
+a "lost" TCP chunk is instead held back for one retransmission timeout, which
+reproduces the head-of-line stall a real loss causes.
+"""
+import heapq
+import queue
+import random
+import socket
+import threading
+import time
+
+
+class _Link(object):
+    def __init__(self, delay=0.0, jitter=0.0, loss=0.0, seed=None):
+        self.delay = delay
+        self.jitter = jitter
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.stats = {"forwarded": 0, "lost": 0, "bytes": 0}
+        self._running = False
+
+    def _latency(self):
+        return max(0.0, self.delay + self.random.uniform(-self.jitter, self.jitter))
+
+    def stop(self):
+        self._running = False
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+
+class UdpLinkEmulator(_Link):
+    """
+    Forwards datagrams arriving on listen_port to target (host, port), each
+    one delayed by delay +/- jitter seconds and dropped with probability
+    loss. Datagrams may be reordered by the jitter, as on a real link.
+
+    If bandwidth (bytes/s) is set, datagrams are serialized onto the link at
+    that rate behind a queue holding at most queue_limit seconds of data;
+    anything beyond that is tail dropped like at a real bottleneck router.
+    bandwidth may be changed while the emulator runs.
+    """
+
+    def __init__(self, listen_port, target, bandwidth=None, queue_limit=0.5, **kwargs):
+        super(UdpLinkEmulator, self).__init__(**kwargs)
+        self.target = target
+        self.bandwidth = bandwidth
+        self.queue_limit = queue_limit
+        self.stats["queue_drops"] = 0
+        self._link_free = 0.0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # A frame arrives as a burst of datagrams; do not let the kernel drop
+        # them before the emulator gets to decide.
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 << 20)
+        self.sock.bind(("127.0.0.1", listen_port))
+        self.sock.settimeout(0.001)
+        self._queue = []
+        self._seq = 0
+
+    def run(self):
+        self._running = True
+        out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            while self._running:
+                timeout = 0.05
+                if self._queue:
+                    timeout = max(0.0001, self._queue[0][0] - time.monotonic())
+                self.sock.settimeout(timeout)
+                try:
+                    packet = self.sock.recv(65536)
+                    departs = self._serialize(len(packet))
+                    if departs is None:
+                        self.stats["queue_drops"] += 1
+                    elif self.random.random() < self.loss:
+                        self.stats["lost"] += 1
+                    else:
+                        self._seq += 1
+                        heapq.heappush(self._queue,
+                                       (departs + self._latency(), self._seq, packet))
+                except socket.timeout:
+                    pass
+                now = time.monotonic()
+                while self._queue and self._queue[0][0] <= now:
+                    _, _, packet = heapq.heappop(self._queue)
+                    out.sendto(packet, self.target)
+                    self.stats["forwarded"] += 1
+                    self.stats["bytes"] += len(packet)
+        finally:
+            out.close()
+            self.sock.close()
+
+    def _serialize(self, size):
+        '''
+        Return when a datagram of size bytes leaves the bottleneck, or None
+        if the bottleneck queue is full.
+        '''
+        now = time.monotonic()
+        if not self.bandwidth:
+            return now
+        start = max(self._link_free, now)
+        if start - now > self.queue_limit:
+            return None
+        self._link_free = start + float(size) / self.bandwidth
+        return self._link_free
+
+
+class TcpLinkEmulator(_Link):
+    """
+    Accepts one TCP connection on listen_port and relays it to target. Data
+    keeps its order; each chunk is delayed by delay +/- jitter seconds and,
+    with probability loss, additionally by rto seconds.
+    """
+
+    def __init__(self, listen_port, target, rto=0.2, chunk_size=1400, **kwargs):
+        super(TcpLinkEmulator, self).__init__(**kwargs)
+        self.target = target
+        self.rto = rto
+        self.chunk_size = chunk_size
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(("127.0.0.1", listen_port))
+        self.server.listen(1)
+
+    def run(self):
+        self._running = True
+        client, _ = self.server.accept()
+        upstream = socket.create_connection(self.target)
+        chunks = queue.Queue()
+        writer = threading.Thread(target=self._write, args=(chunks, upstream),
+                                  daemon=True)
+        writer.start()
+        ready_at = 0.0
+        try:
+            while self._running:
+                chunk = client.recv(self.chunk_size)
+                if not chunk:
+                    break
+                latency = self._latency()
+                if self.random.random() < self.loss:
+                    self.stats["lost"] += 1
+                    latency += self.rto
+                # In order delivery: nothing overtakes a stalled chunk.
+                ready_at = max(ready_at, time.monotonic() + latency)
+                chunks.put((ready_at, chunk))
+        finally:
+            chunks.put(None)
+            writer.join()
+            client.close()
+            upstream.close()
+            self.server.close()
+
+    def _write(self, chunks, upstream):
+        while True:
+            item = chunks.get()
+            if item is None:
+                return
+            ready_at, chunk = item
+            wait = ready_at - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            upstream.sendall(chunk)
+            self.stats["forwarded"] += 1
+            self.stats["bytes"] += len(chunk)
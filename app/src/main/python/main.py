@@ -4,6 +4,16 @@
 # Written by:   Kate Baumli
 # Modified:     Monday March 4, 2019
 ###############################################################
+import sys
+if __name__ == "__main__" and len(sys.argv) > 1:
+    # Command line tools (e.g. those run by robot_launch.sh) skip the GUI.
+    import cli
+    sys.exit(cli.main(sys.argv[1:]))
+
+import time
+from launcher import Launcher
+# Qt and everything behind it is only loaded for the GUI; the command line
+# tools above never import it.
 from PyQt5.QtWidgets import QMainWindow
 from PyQt5.QtWidgets import QWidget
 from PyQt5.QtWidgets import QPushButton
@@ -11,21 +21,51 @@ from PyQt5.QtWidgets import QVBoxLayout,QHBoxLayout
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtWidgets import QLabel
 from PyQt5.QtWidgets import QFileDialog
+from PyQt5.QtWidgets import QTableWidget, QTableWidgetItem, QHeaderView
 from PyQt5.QtGui import QIcon
 from PyQt5.QtCore import QObjectCleanupHandler
 from PyQt5.QtCore import QSize
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+import collections
 import functools
-import sys
-import subprocess
-import signal
-import os
-import re
-import time
+import config_store
+import proc_stats
 from fbs_runtime.application_context import ApplicationContext
-from traceback import print_exc
 #TODO: Add "back"  buttons to each page
 #TODO: Make layout pretty
 
+# Milliseconds between refreshes of the frame latency shown while running
+LATENCY_REFRESH = 2000
+# Milliseconds between refreshes of the health panel
+HEALTH_REFRESH = 1000
+PROCESS_COLUMNS = ("Side", "Process", "PID", "CPU %", "Memory MB", "Threads")
+STREAM_COLUMNS = ("Side", "Stream", "fps", "MB/s", "Dropped/s")
+
+def health_table(columns):
+    table = QTableWidget(0, len(columns))
+    table.setHorizontalHeaderLabels(columns)
+    table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+    table.verticalHeader().hide()
+    table.setEditTriggers(QTableWidget.NoEditTriggers)
+    return table
+
+def fill_table(table, rows):
+    '''Show rows of strings in table, reusing the items already there'''
+    table.setUpdatesEnabled(False)
+    table.setRowCount(len(rows))
+    for row, texts in enumerate(rows):
+        for column, text in enumerate(texts):
+            item = table.item(row, column)
+            if item is None:
+                table.setItem(row, column, QTableWidgetItem(text))
+            elif item.text() != text:
+                item.setText(text)
+    table.setUpdatesEnabled(True)
+
+class LaunchProgress(QObject):
+    '''Carries launch progress from the orchestrator thread to the GUI'''
+    changed = pyqtSignal(str, str, float)
+
 class GUIWindow(QMainWindow):
 
     def __init__(self,one_headset_img,two_headset_img, 
@@ -39,75 +79,27 @@ class GUIWindow(QMainWindow):
         self.setCentralWidget(self.main_widget)
         self.main_widget.setLayout(QVBoxLayout())
         self.headset_refs = []
+        self.headset_monitor = None
+        self.launcher = Launcher(base_launch)
+        self.launch_progress = LaunchProgress()
+        self.launch_progress.changed.connect(self.on_launch_progress)
         self.first_page()
 
     def closeEvent(self, event):
         # Override main window's function called when the red X is clicked 
         print("You closed the app!")
-        #subprocess.call([self.kill_launch])
+        self.launcher.stop()
 
     def get_env_vars(self):
-        error_msg = ""
-        missing_env_vars = 0
-        self.robot_catkin = os.environ.get("ROBOT_CATKIN_PATH")
-        self.base_catkin = os.environ.get("BASE_CATKIN_PATH")
-        self.robot_hostname = os.environ.get("ROBOT_HOSTNAME")
-        self.robot_username = os.environ.get("ROBOT_USERNAME")
-        self.robot_project_crunch_path = os.environ.get("ROBOT_PROJECT_CRUNCH_PATH")
-
-        print(self.robot_catkin, self.base_catkin, self.robot_hostname, self.robot_username)
-        if self.robot_catkin is None:
-            error_msg += "ROBOT_CATKIN_PATH\n"
-            missing_env_vars += 1
-        if self.base_catkin is None: 
-            error_msg += "BASE_CATKIN_PATH\n"
-            missing_env_vars += 1
-        if self.robot_hostname is None:
-            error_msg += "ROBOT_HOSTNAME\n"
-            missing_env_vars += 1
-        if self.robot_username is None:
-            error_msg += "ROBOT_USERNAME\n"
-            missing_env_vars += 1
-        if self.robot_project_crunch_path is None: 
-            error_msg += "ROBOT_PROJECT_CRUNCH_PATH\n"
-            missing_env_vars += 1
+        missing = self.launcher.load_settings()
+        missing_env_vars = len(missing)
+        error_msg = "".join(name + "\n" for name in missing)
         if missing_env_vars > 0:
             if missing_env_vars == 1:
-                return "The following environment variable is not properly set:\n\n"+error_msg+"\nPlease close the app, set it (either by rerunning\n the installer and ssh configuration or using\n'export {}=<value>') and try again.".format(error_msg.rstrip())
+                return "The following setting is missing:\n\n"+error_msg+"\nPlease close the app, set it (either by rerunning\n the installer and ssh configuration or by adding\n'export {}=<value>' to {}) and try again.".format(error_msg.rstrip(), config_store.CONFIG_FILE)
             else: 
-                return "The following {} environment variables are not properly set:\n\n".format(missing_env_vars) + error_msg+"\nPlease close the app, set them (either by rerunning\n the installer and ssh configuration or using \n'export <ENVIRONMENT_VARIABLE_NAME>=<value>') and try again."
-        else:
-            # Use this section for running the launcher via
-            # the zip or tar release, ie normal use.
-            self.robot_launch = os.path.join(
-                    self.robot_project_crunch_path,
-                    "Project-Crunch", "Project-Crunch",
-                    "target", "Project-Crunch",
-                    "robot_launch.sh"
-            )
-            self.kill_launch = os.path.join(
-                    self.robot_project_crunch_path,
-                    "Project-Crunch", "Project-Crunch",
-                    "target", "Project-Crunch",
-                    "kill_launch.sh"
-            )
-            # Use this section for running the launcher
-            # in "debug" mode via fbs run, where the installation 
-            # being considered is actually the repository.
-            #self.robot_launch = os.path.join(
-            #        self.robot_project_crunch_path, 
-            #        "project-crunch", "app", "src", 
-            #        "main", "resources", "base",
-            #        "robot_launch.sh"
-            #)
-            #self.kill_launch = os.path.join(
-            #        self.robot_project_crunch_path,
-            #        "project-crunch", "app", "src", 
-            #        "main", "resources", "base", 
-            #        "kill_launch.sh"
-            #)
-            
-            return None
+                return "The following {} settings are missing:\n\n".format(missing_env_vars) + error_msg+"\nPlease close the app, set them (either by rerunning\n the installer and ssh configuration or by adding \n'export <NAME>=<value>' lines to {}) and try again.".format(config_store.CONFIG_FILE)
+        return None
     
     class ChangeLayout:
         ''' 
@@ -204,11 +196,23 @@ class GUIWindow(QMainWindow):
 
     def one_headset_config(self):
         self.two_headsets = False
+        self.launcher.headsets = 1
+        self.start_headset_monitor()
         self.plug_in_headset()
      
     def two_headset_config(self):
         self.two_headsets = True
+        self.launcher.headsets = 2
+        self.start_headset_monitor()
         self.plug_in_headset(extra_str=" first ")    
+
+    def start_headset_monitor(self):
+        # Listen for headsets from the moment the user is asked to plug one
+        # in, so the new headset is already known when they click 'Done'.
+        if self.headset_monitor is None:
+            from vive_monitor import HeadsetMonitor
+            self.headset_monitor = HeadsetMonitor()
+            self.headset_monitor.start()
     
     @ChangeLayout(size=(200,100),title="Prepare for System Launch")
     def plug_in_headset(self,extra_str=" ",error=False):
@@ -238,99 +242,85 @@ class GUIWindow(QMainWindow):
             self.plug_in_headset(error=True)
 
     def get_new_vive_port(self):
-        # TODO: Have this function find the port where the vive was just plugged
-        #in, return None if there wasn't one plugged in. If there are multiple
-        # vives plugged in, return port of most recently plugged in vive
-        return "dummy"
+        '''
+        Return the devpath of the most recently plugged in vive that has not
+        been claimed yet, or None if there is none.
+        '''
+        headset = self.headset_monitor.latest(exclude=self.headset_refs)
+        if headset is None:
+            return None
+        print("Found headset {}".format(headset))
+        return headset.devpath
 
-    @ChangeLayout()
+    @ChangeLayout(size=(640,560))
     def launch_page(self):
         layout = QVBoxLayout()
         text = QLabel("Launching system...")
+        self.launch_status = QLabel("")
+        self.latency_status = QLabel("")
+        self.latency_status.setStyleSheet("font-family: monospace")
         layout.addWidget(text)
+        layout.addWidget(self.launch_status)
+        layout.addWidget(self.latency_status)
+        # Health of both sides, sampled by the launcher in the background
+        self.process_table = health_table(PROCESS_COLUMNS)
+        self.stream_table = health_table(STREAM_COLUMNS)
+        layout.addWidget(QLabel("Processes"))
+        layout.addWidget(self.process_table, 3)
+        layout.addWidget(QLabel("Camera streams"))
+        layout.addWidget(self.stream_table, 1)
+        self.health_timer = QTimer(self)
+        self.health_timer.timeout.connect(self.update_health)
+        self.health_timer.start(HEALTH_REFRESH)
+        if self.launcher.transport == "udp":
+            # receive-cameras writes the latency histograms to a file.
+            self.launch_time = time.time()
+            self.latency_timer = QTimer(self)
+            self.latency_timer.timeout.connect(self.update_latency)
+            self.latency_timer.start(LATENCY_REFRESH)
         return layout
 
-    def launch_system_backend(self):
-        self.launch_robot()
-        self.launch_base()
-        #ISSUE: temporary workaround to position windows running before OpenHMD plugin is added
-        time.sleep(30)
-        self.position_windows()
-
-    def position_windows(self):
-        p1 = subprocess.Popen(['xrandr'], stdout=subprocess.PIPE)
-        opt, err = subprocess.Popen(['grep','2160x1200'],
-                stdin=p1.stdout,
-                stdout=subprocess.PIPE).communicate()
-        list_of_opt = opt.splitlines()
-        self.coords = []
-        for line in list_of_opt:
-            line = line.decode("utf-8", "ignore")
-            try:
-                res_coords = re.search("\d+x\d+\+\d+\+\d+",line).group()
-                _ , x, y = res_coords.split("+")
-                self.coords.append((x,y))
-            except:
-                pass
-       
-        # get HDMI/DP port ID using grep to find window position
-        windows = subprocess.Popen(["wmctrl","-l"],stdout=subprocess.PIPE)
-        hmd1, err = subprocess.Popen(['grep','HMD1'],
-                        stdin=windows.stdout,
-                                stdout=subprocess.PIPE).communicate()
-        wid1 = hmd1.split()[0]
-        print(wid1)
-        subprocess.call(["wmctrl","-ir",wid1,
-            "-e","0,{},{},2160,1200".format(self.coords[0][0],self.coords[0][1])])
-
-        if self.two_headsets:
-            windows = subprocess.Popen(["wmctrl","-l"],stdout=subprocess.PIPE)
-            hmd2, err = subprocess.Popen(["grep","HMD2"],
-                        stdin=windows.stdout,
-                        stdout=subprocess.PIPE).communicate()
-            print(hmd2)
-            wid2 = hmd2.split()[0]
-            subprocess.call(["wmctrl","-ir",wid2,
-                "-e","0,{},{},2160,1200".format(self.coords[1][0],self.coords[1][1])])
-
-    def launch_robot(self):
+    def update_latency(self):
+        from latency import LATENCY_FILE, read_stats, summary
         try:
-            robot_client = self.robot_username + "@" + self.robot_hostname
-        except TypeError:
-            # Prints the exception to stdout
-            print_exc() #TODO make sure this works
+            written, offset, histograms = read_stats(LATENCY_FILE)
+        except (OSError, ValueError):
+            return
+        if written < self.launch_time:
+            # Left over from an earlier run
+            return
+        lines = ["Frame latency (robot clock {:+.1f} ms):".format(offset * 1000)]
+        lines.extend(summary(histograms))
+        self.latency_status.setText("\n".join(lines))
 
-        #ssh_robot_launch_cmd = "ssh -f {} bash {} -c {}".format(robot_client, self.robot_launch, self.robot_catkin)
-        #print(ssh_robot_launch_cmd)
-        #subprocess.call(ssh_robot_launch_cmd.split(" "))
-        
-        sshProcess = subprocess.Popen(['ssh',
-                                    robot_client],
-                                    stdin=subprocess.PIPE,
-                                    universal_newlines=True,
-                                    bufsize=0,
-                                    preexec_fn=os.setsid)
+    def update_health(self):
+        readings = self.launcher.health.readings()
+        processes = []
+        streams = []
+        for side in ("base", "robot"):
+            reading = readings.get(side)
+            if reading is None:
+                continue
+            for p in sorted(reading["processes"], key=lambda p: -p["cpu"]):
+                processes.append((side, p["name"], str(p["pid"]), "{:.1f}".format(p["cpu"]),
+                                  "{:.0f}".format(p["rss"] / 1e6), str(p["threads"])))
+            for s in reading["streams"]:
+                streams.append((side, "camera{}".format(s["stream"] + 1),
+                                "{:.1f}".format(s["fps"]),
+                                "{:.2f}".format(s["bytes_per_s"] / 1e6),
+                                "{:.1f}".format(s["dropped_per_s"])))
+        fill_table(self.process_table, processes)
+        fill_table(self.stream_table, streams)
 
-        sshProcess.stdin.write("export DISPLAY=:0\n")
-        sshProcess.stdin.write("source .bashrc\n")
-        sshProcess.stdin.write("bash {} -c {}\n".format(self.robot_launch,
-            self.robot_catkin))
-        sshProcess.stdin.close()
+    def on_launch_progress(self, stage, state, elapsed):
+        self.stage_status[stage] = "{}: {} ({:.1f}s)".format(stage, state, elapsed)
+        self.launch_status.setText("\n".join(self.stage_status.values()))
 
-        #sshProcess.kill()
-        # send SIGTERM to all process groups so GUI does not hang.
-        #os.killpg(os.getpgid(sshProcess.pid), signal.SIGTERM)
-    
-    def launch_base(self):
-        my_env = os.environ.copy()
-        my_env["PATH"] = "/usr/sbin:/sbin:" + my_env["PATH"]
-        print(my_env)
-        subprocess.Popen(["bash",
-                            self.base_launch,
-                            "--catkin",
-                            self.base_catkin],
-                            env=my_env)
-        #subprocess.call([self.base_launch,"--catkin",self.base_catkin])
+    def launch_system_backend(self):
+        # The launcher runs its stages on their own thread, which reports
+        # back through a Qt signal.
+        self.stage_status = collections.OrderedDict()
+        self.launcher.start(progress=self.launch_progress.changed.emit)
     
 
 class AppContext(ApplicationContext):
@@ -343,6 +333,7 @@ class AppContext(ApplicationContext):
         # base_launch.sh
         base_launch = self.get_resource("base_launch.sh")
         main_window = GUIWindow(one_headset_img,two_headset_img, base_launch)
+        print("Window shown {:.2f}s after startup".format(proc_stats.age()))
         return self.app.exec_()
         
 if __name__ == "__main__":
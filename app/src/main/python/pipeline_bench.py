@@ -0,0 +1,367 @@
+"""
+Hermetic benchmark of the robot to base camera path on one Linux machine.
+
+No cameras, headsets, second computer or ROS are needed. Three local
+processes stand in for the real system:
+
+    robot   synthetic fisheye cameras captured at the configured resolution
+            and fps into the chosen capture buffer (frame_ring), then encoded
+            and sent with FrameSender; also answers the rate control and
+            clock sync datagrams like the real robot
+    link    UdpLinkEmulator with the configured bandwidth, RTT and loss
+    base    FrameReceiver with a sink that decodes every frame, plus the
+            same latency recording as receive-cameras
+
+While they run, the harness samples every process's CPU and memory from
+/proc. run_benchmark() returns a dict of plain numbers, and
+`python bench.py pipeline` prints it as JSON so runs can be compared.
+
+stall makes the robot's encoder stop for that many milliseconds once a
+second, as when the CPU is briefly taken by something else. The encode
+latency (capture to send) then shows how stale frames get in each capture
+mode.
+
+Frames are zlib compressed by default so the suite needs nothing beyond
+numpy; codec="jpeg" uses OpenCV like the real robot does.
+"""
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+import proc_stats
+
+DEFAULT_CONFIG = {
+    "cameras": 2,
+    "width": 1440,
+    "height": 1440,
+    "fps": 30.0,
+    "codec": "zlib",
+    "quality": 80,
+    "duration": 10.0,
+    # Link; bandwidth in Mbit/s, 0 for unlimited
+    "bandwidth": 0.0,
+    "rtt": 0.0,
+    "jitter": 0.0,
+    "loss": 0.0,
+    "adaptive": False,
+    "capture_mode": "freshest",
+    "queue_size": 100,
+    "stall": 0.0,
+    # Capture and encode every camera in a process of its own
+    "camera_processes": True,
+    "port": 5700,
+    "seed": 1,
+}
+
+# Seconds the base and link keep running after the robot stops, so frames
+# still in flight are counted.
+DRAIN_TIME = 1.0
+# Seconds between /proc samples
+SAMPLE_INTERVAL = 0.25
+
+
+class SyntheticCamera(object):
+    """
+    Produces fisheye-like frames of (width, height) whose content moves every
+    frame, so the encoder cannot get away with repeating itself. capture()
+    returns (image, capture time) and encode() turns an image into bytes.
+    """
+
+    def __init__(self, width, height, codec="zlib", quality=80, seed=0):
+        self.codec = codec
+        self.quality = quality
+        self.count = 0
+        rng = np.random.RandomState(seed)
+        # Random 8x8 pixel blocks compress to roughly what a JPEG of a real
+        # scene does (about 300 KB at 1440x1440).
+        blocks = rng.randint(0, 256, size=(-(-height // 8), -(-width // 8), 3))
+        image = np.repeat(np.repeat(blocks.astype(np.uint8), 8, 0), 8, 1)[:height, :width]
+        y, x = np.ogrid[0:height, 0:width]
+        cx, cy, radius = (width - 1) / 2.0, (height - 1) / 2.0, min(width, height) / 2.0
+        image[(x - cx) ** 2 + (y - cy) ** 2 > radius ** 2] = 0
+        self.image = np.ascontiguousarray(image)
+        if codec == "jpeg":
+            import cv2
+            self._cv2 = cv2
+        elif codec != "zlib":
+            raise ValueError("Unknown codec {}".format(codec))
+
+    def capture(self):
+        self.count += 1
+        return np.roll(self.image, self.count * 8, axis=1), time.time()
+
+    def encode(self, image):
+        if self.codec == "jpeg":
+            params = [int(self._cv2.IMWRITE_JPEG_QUALITY), self.quality]
+            _, data = self._cv2.imencode(".jpg", image, params)
+            return data.tobytes()
+        return zlib.compress(image.tobytes(), 1)
+
+
+def decode(codec, data):
+    if codec == "jpeg":
+        import cv2
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return zlib.decompress(data)
+
+
+#######################################
+# Stand-in processes
+#######################################
+def _camera(config, index, target, settings, deadline, counts):
+    '''
+    Capture, encode and send synthetic camera index until deadline; counts
+    is a shared array of frames sent, bytes sent, captured and dropped
+    '''
+    import threading
+    from frame_ring import frame_buffer
+    from frame_transport import FrameSender
+
+    camera = SyntheticCamera(config["width"], config["height"], config["codec"],
+                             config["quality"], seed=config["seed"] + index)
+    frames = frame_buffer(config["capture_mode"], config["queue_size"])
+
+    def capture():
+        # The camera runs at its own rate whatever the encoder does.
+        next_frame = time.monotonic()
+        while next_frame < deadline:
+            frames.put(*camera.capture())
+            next_frame += 1.0 / config["fps"]
+            delay = next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        frames.close()
+
+    threading.Thread(target=capture, daemon=True).start()
+    sender = FrameSender(target[0], target[1], stream=index)
+    next_stall = time.monotonic() + 1.0
+    while True:
+        frame = frames.get()
+        if frame is None or time.monotonic() > deadline + DRAIN_TIME / 2:
+            break
+        data = camera.encode(frame.image)
+        sender.send(data, frame.captured)
+        counts[0] += 1
+        counts[1] += len(data)
+        if config["stall"] and time.monotonic() > next_stall:
+            time.sleep(config["stall"] / 1000.0)
+            next_stall = time.monotonic() + 1.0
+        # Pace to the rate the base asked for; with adaptation off that
+        # is the camera rate.
+        if settings.rung.fps < config["fps"]:
+            time.sleep(1.0 / settings.rung.fps)
+    sender.close()
+    counts[2] = frames.stats["put"]
+    counts[3] = frames.stats["dropped"]
+
+
+def _robot(config, target, results, finish):
+    import threading
+    from adaptive_rate import CONTROL_PORT_OFFSET, SharedStreamSettings, StreamSettings
+
+    # Like stream-cameras, every camera gets a process of its own, unless
+    # camera_processes is off and they share this one as threads.
+    if config["camera_processes"]:
+        settings = SharedStreamSettings(config["width"], config["height"], config["fps"])
+        worker = multiprocessing.Process
+    else:
+        settings = StreamSettings(config["width"], config["height"], config["fps"])
+        worker = threading.Thread
+    settings.listen(config["port"] + CONTROL_PORT_OFFSET)
+    counts = [multiprocessing.Array("q", 4, lock=False) for _ in range(config["cameras"])]
+    deadline = time.monotonic() + config["duration"]
+    workers = [worker(target=_camera, args=(config, i, target, settings, deadline, counts[i]))
+               for i in range(config["cameras"])]
+    for each in workers:
+        each.start()
+    for each in workers:
+        each.join()
+    results.put(("robot", {"frames_sent": sum(c[0] for c in counts),
+                           "bytes_sent": sum(c[1] for c in counts),
+                           "frames_captured": sum(c[2] for c in counts),
+                           "frames_dropped": sum(c[3] for c in counts)}))
+    finish.wait()
+
+
+def _link(config, listen_port, target, results, finish):
+    from link_emulator import UdpLinkEmulator
+
+    link = UdpLinkEmulator(listen_port, target,
+                           bandwidth=config["bandwidth"] * 125000 or None,
+                           delay=config["rtt"] / 2000.0, jitter=config["jitter"] / 1000.0,
+                           loss=config["loss"] / 100.0, seed=config["seed"])
+    link.start()
+    time.sleep(config["duration"] + DRAIN_TIME)
+    link.stop()
+    results.put(("link", dict(link.stats)))
+    finish.wait()
+
+
+def _base(config, latency_file, results, finish):
+    import threading
+    from adaptive_rate import (CONTROL_PORT_OFFSET, LinkMonitor, RateController,
+                               control_loop)
+    from frame_transport import FrameReceiver
+    from latency import ClockSync, LatencyRecorder
+
+    def sink(stream, frame_id, data):
+        decode(config["codec"], data)
+
+    receiver = FrameReceiver(config["port"], sink)
+    control_port = config["port"] + CONTROL_PORT_OFFSET
+    clock = ClockSync(receiver, control_port)
+    clock.start()
+    recorder = LatencyRecorder(latency_file, clock)
+    receiver.observers.append(recorder)
+    if config["adaptive"]:
+        monitor = LinkMonitor()
+        receiver.observers.append(monitor)
+        threading.Thread(target=control_loop,
+                         args=(receiver, monitor, RateController(), control_port),
+                         daemon=True).start()
+    receiver.start()
+    time.sleep(config["duration"] + DRAIN_TIME)
+    receiver.stop()
+    recorder.write()
+    results.put(("base", dict(receiver.stats)))
+    finish.wait()
+
+
+#######################################
+# Harness
+#######################################
+def _latency_summary(path):
+    from latency import read_stats
+
+    _, _, histograms = read_stats(path)
+    summary = {}
+    for name, histogram in histograms.items():
+        if histogram.total:
+            summary[name] = {"p{}".format(p): round(histogram.percentile(p) * 1000, 2)
+                             for p in (50, 95, 99)}
+            summary[name]["frames"] = histogram.total
+    return summary
+
+
+def run_benchmark(**overrides):
+    '''
+    Run one benchmark with DEFAULT_CONFIG updated by overrides and return
+    the results as a dict that json.dumps can write.
+    '''
+    config = dict(DEFAULT_CONFIG)
+    unknown = set(overrides) - set(config)
+    if unknown:
+        raise ValueError("Unknown benchmark settings: {}".format(", ".join(sorted(unknown))))
+    config.update(overrides)
+    link_port = config["port"] + 2
+    workdir = tempfile.mkdtemp(prefix="crunch-bench-")
+    latency_file = os.path.join(workdir, "latency.bin")
+
+    results = multiprocessing.Queue()
+    finish = multiprocessing.Event()
+    processes = {
+        "base": multiprocessing.Process(target=_base,
+                                        args=(config, latency_file, results, finish)),
+        "link": multiprocessing.Process(target=_link,
+                                        args=(config, link_port, ("127.0.0.1", config["port"]),
+                                              results, finish)),
+        "robot": multiprocessing.Process(target=_robot,
+                                         args=(config, ("127.0.0.1", link_port),
+                                               results, finish)),
+    }
+    # Receivers first, so the first frames are not sent into closed ports.
+    for name in ("base", "link"):
+        processes[name].start()
+    time.sleep(0.2)
+    started = time.monotonic()
+    processes["robot"].start()
+
+    # (name, pid): reading, for each process and its camera processes
+    first = {}
+    last = {}
+    stages = {}
+    while len(stages) < len(processes):
+        table = proc_stats.scan()
+        for name, process in processes.items():
+            for pid in proc_stats.family(table, pids=[process.pid]):
+                reading = proc_stats.sample(pid)
+                if reading is not None:
+                    first.setdefault((name, pid), reading)
+                    last[(name, pid)] = reading
+        while not results.empty():
+            name, stats = results.get()
+            stages[name] = stats
+        time.sleep(SAMPLE_INTERVAL)
+    elapsed = time.monotonic() - started
+    finish.set()
+    for process in processes.values():
+        process.join()
+
+    for name, stats in stages.items():
+        main = (name, processes[name].pid)
+        if main not in first:
+            continue
+        window = last[main].when - first[main].when
+        keys = [key for key in first if key[0] == name]
+        cpu = sum(last[key].cpu - first[key].cpu for key in keys)
+        stats["cpu_percent"] = round(100.0 * cpu / window, 1) if window > 0 else 0.0
+        stats["peak_rss_mb"] = round(sum(last[key].peak_rss for key in keys) / 1e6, 1)
+    latency = _latency_summary(latency_file)
+    shutil.rmtree(workdir, ignore_errors=True)
+    base = stages["base"]
+    robot = stages["robot"]
+    return {
+        "config": config,
+        "elapsed": round(elapsed, 2),
+        "throughput": {
+            "sent_fps": round(robot["frames_sent"] / config["duration"], 2),
+            "delivered_fps": round(base["delivered"] / config["duration"], 2),
+            "sent_mbit_s": round(robot["bytes_sent"] * 8 / 1e6 / config["duration"], 2),
+            "delivered_ratio": round(float(base["delivered"]) / max(robot["frames_sent"], 1), 4),
+        },
+        "latency_ms": latency,
+        "stages": stages,
+    }
+
+
+def scaling(cameras=(1, 2, 4, 8), **overrides):
+    '''
+    run_benchmark() with each number of cameras, with a process per camera
+    and, for comparison, a thread per camera. Returns {"processes": {n:
+    result}, "threads": {n: result}}, each result giving delivered_fps,
+    per_camera_fps, efficiency (delivered over n times the camera fps, 1.0
+    being linear scaling) and robot_cpu_percent.
+    '''
+    results = {"processes": {}, "threads": {}}
+    for mode in results:
+        for count in cameras:
+            run = run_benchmark(**dict(overrides, cameras=count,
+                                       camera_processes=(mode == "processes")))
+            fps = run["config"]["fps"]
+            delivered = run["throughput"]["delivered_fps"]
+            results[mode][count] = {
+                "delivered_fps": delivered,
+                "per_camera_fps": round(delivered / count, 2),
+                "efficiency": round(delivered / (count * fps), 3),
+                "robot_cpu_percent": run["stages"]["robot"].get("cpu_percent"),
+            }
+    results["cores"] = os.cpu_count()
+    return results
+
+
+def main(config, output=None):
+    '''Run one benchmark and write its results as JSON to output or stdout'''
+    results = run_benchmark(**config)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return results
@@ -0,0 +1,144 @@
+"""
+Per process CPU and memory figures read straight from /proc.
+
+ProcessSample is one reading of a process; cpu_percent() turns two readings
+of the same process into a utilisation, so callers decide how often to look.
+scan() reads every process at once, one file each, and family() picks the
+processes of a launch out of it.
+"""
+import collections
+import os
+import time
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+# cpu is user + system seconds, rss and peak_rss are bytes, taken at the
+# monotonic time when.
+ProcessSample = collections.namedtuple("ProcessSample",
+                                       "pid when cpu rss peak_rss threads")
+
+
+# One process from scan(): parent, process group and session ids, state
+# letter and command name as well as the ProcessSample figures but the peak.
+ProcessInfo = collections.namedtuple("ProcessInfo",
+                                     "pid ppid pgid session state name when cpu rss threads")
+
+
+def sample(pid, proc_root="/proc"):
+    '''Return a ProcessSample for pid, or None if it has exited'''
+    base = os.path.join(proc_root, str(pid))
+    try:
+        with open(os.path.join(base, "stat")) as f:
+            stat = f.read()
+        with open(os.path.join(base, "status")) as f:
+            status = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces, so split after its closing paren.
+    fields = stat[stat.rindex(")") + 2:].split()
+    cpu = (int(fields[11]) + int(fields[12])) / float(CLOCK_TICKS)
+    rss = int(fields[21]) * PAGE_SIZE
+    peak_rss = rss
+    threads = int(fields[17])
+    for line in status.splitlines():
+        if line.startswith("VmHWM:"):
+            peak_rss = int(line.split()[1]) * 1024
+            break
+    return ProcessSample(pid, time.monotonic(), cpu, rss, peak_rss, threads)
+
+
+def age(pid="self", proc_root="/proc"):
+    '''Seconds since pid started, to the resolution of a clock tick'''
+    with open(os.path.join(proc_root, str(pid), "stat")) as f:
+        stat = f.read()
+    with open(os.path.join(proc_root, "uptime")) as f:
+        uptime = float(f.read().split()[0])
+    started = int(stat[stat.rindex(")") + 2:].split()[19])
+    return uptime - started / float(CLOCK_TICKS)
+
+
+def boot_time(proc_root="/proc"):
+    '''Wall clock time the machine booted at, in whole seconds'''
+    with open(os.path.join(proc_root, "stat")) as f:
+        for line in f:
+            if line.startswith("btime "):
+                return int(line.split()[1])
+    return 0
+
+
+def _parse_stat(pid, stat, when):
+    # The command name may contain spaces, so split after its closing paren.
+    close = stat.rindex(")")
+    fields = stat[close + 2:].split()
+    return ProcessInfo(pid, int(fields[1]), int(fields[2]), int(fields[3]), fields[0],
+                       stat[stat.index("(") + 1:close], when,
+                       (int(fields[11]) + int(fields[12])) / float(CLOCK_TICKS),
+                       int(fields[21]) * PAGE_SIZE, int(fields[17]))
+
+
+def pids(proc_root="/proc"):
+    '''The ids of every process'''
+    return {int(name) for name in os.listdir(proc_root) if name.isdigit()}
+
+
+def scan(proc_root="/proc", only=None):
+    '''A ProcessInfo for every process, or only those in only, by pid'''
+    table = {}
+    when = time.monotonic()
+    for pid in pids(proc_root) if only is None else only:
+        try:
+            with open(os.path.join(proc_root, str(pid), "stat")) as f:
+                stat = f.read()
+        except OSError:
+            continue
+        table[pid] = _parse_stat(pid, stat, when)
+    return table
+
+
+def family(table, pgids=(), sessions=(), pids=()):
+    '''
+    The pids in table that are one of pids, in one of the process groups
+    pgids or the sessions, or descend from a process that is. roslaunch
+    starts every node in a session of its own, so membership alone misses
+    them.
+    '''
+    pgids = set(pgids)
+    sessions = set(sessions)
+    members = {pid for pid, info in table.items()
+               if pid in pids or info.pgid in pgids or info.session in sessions}
+    children = collections.defaultdict(list)
+    for pid, info in table.items():
+        children[info.ppid].append(pid)
+    pending = list(members)
+    while pending:
+        for child in children[pending.pop()]:
+            if child not in members:
+                members.add(child)
+                pending.append(child)
+    return members
+
+
+def running(pids, proc_root="/proc"):
+    '''
+    The pids that have not exited. Zombies do not count: they are gone,
+    only not yet reaped by their parent.
+    '''
+    alive = set()
+    for pid in pids:
+        try:
+            with open(os.path.join(proc_root, str(pid), "stat")) as f:
+                stat = f.read()
+        except OSError:
+            continue
+        if stat[stat.rindex(")") + 2] != "Z":
+            alive.add(pid)
+    return alive
+
+
+def cpu_percent(first, second):
+    '''CPU use between two samples of one process, 100 being one full core'''
+    elapsed = second.when - first.when
+    if elapsed <= 0:
+        return 0.0
+    return 100.0 * (second.cpu - first.cpu) / elapsed
@@ -0,0 +1,375 @@
+"""
+Recording and replay of the camera streams, for reviewing a mission after
+the fact and for testing the pipeline without cameras.
+
+A recording is a directory of segments. Each segment is a pair of
+append-only files:
+
+    segment-000000.frames   header, then one record per frame: RECORD
+                            (time, frame id, stream, length) followed by
+                            the encoded frame as it came off the link
+    segment-000000.index    header, then one INDEX_ENTRY (time, offset of
+                            the record) per frame, 16 bytes
+
+Recorder writes both through large buffers, so the disk sees big sequential
+writes, and never fsyncs: a frame is safe once the OS writes it back. A new
+segment is started every segment_size bytes. If the recorder dies, the end of
+an index may be missing; Replayer rebuilds it from the frames file.
+
+Replayer memory-maps every segment. Finding the frame at a given time is a
+bisection over the segments' start times and then over one segment's index,
+so seeking is O(log n) whatever the length of the recording, and frames are
+handed out as views of the mapping without copying them.
+
+`Project-Crunch receive-cameras --record DIR` records on the base, and
+`Project-Crunch replay DIR` sends a recording to receive-cameras as if it
+came from the robot.
+"""
+import bisect
+import collections
+import glob
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+import numpy as np
+
+# magic, version, time created
+SEGMENT_HEADER = struct.Struct("!4sBd")
+SEGMENT_MAGIC = b"CRSG"
+INDEX_HEADER = struct.Struct("!4sB")
+INDEX_MAGIC = b"CRIX"
+FORMAT_VERSION = 1
+# time (wall clock), frame id, stream, frame length
+RECORD = struct.Struct("!dIBI")
+# time, offset of the frame's RECORD in the frames file
+INDEX_ENTRY = struct.Struct("!dQ")
+INDEX_DTYPE = np.dtype([("time", ">f8"), ("offset", ">u8")])
+
+FRAMES_SUFFIX = ".frames"
+INDEX_SUFFIX = ".index"
+# Bytes of frames per segment; about half a minute of two 1440x1440 streams
+SEGMENT_SIZE = 512 << 20
+# Bytes buffered before a write reaches the disk
+WRITE_BUFFER = 8 << 20
+
+# One frame of a recording; data is a memoryview of the mapped segment
+RecordedFrame = collections.namedtuple("RecordedFrame", "time stream frame_id data")
+
+
+def segment_paths(directory):
+    '''The frames files of the segments in directory, oldest first'''
+    return sorted(glob.glob(os.path.join(directory, "segment-*" + FRAMES_SUFFIX)))
+
+
+class Recorder(object):
+    """
+    Appends frames to the recording in directory, after any segments already
+    there. It can be used directly as FrameReceiver's callback. Frames may
+    come from several threads.
+    """
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE, buffer_size=WRITE_BUFFER):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_size = segment_size
+        self.buffer_size = buffer_size
+        existing = segment_paths(directory)
+        self._number = int(os.path.basename(existing[-1])[8:14]) + 1 if existing else 0
+        self._frames = None
+        self._index = None
+        self._offset = 0
+        self._last_time = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"frames": 0, "bytes": 0, "segments": 0}
+
+    def __call__(self, stream, frame_id, data):
+        self.write(stream, frame_id, data)
+
+    def write(self, stream, frame_id, data, timestamp=None):
+        '''Append one encoded frame, stamped timestamp or now'''
+        with self._lock:
+            if timestamp is None:
+                timestamp = time.time()
+            # The index is bisected on time, so it must never go backwards,
+            # even if the clock does.
+            timestamp = max(timestamp, self._last_time)
+            self._last_time = timestamp
+            size = RECORD.size + len(data)
+            if self._frames is None or (self._offset + size > self.segment_size
+                                        and self._offset > SEGMENT_HEADER.size):
+                self._start_segment()
+            self._frames.write(RECORD.pack(timestamp, frame_id, stream, len(data)))
+            self._frames.write(data)
+            self._index.write(INDEX_ENTRY.pack(timestamp, self._offset))
+            self._offset += size
+            self.stats["frames"] += 1
+            self.stats["bytes"] += len(data)
+
+    def _start_segment(self):
+        self._close_segment()
+        base = os.path.join(self.directory, "segment-{:06d}".format(self._number))
+        self._number += 1
+        self._frames = open(base + FRAMES_SUFFIX, "wb", buffering=self.buffer_size)
+        self._index = open(base + INDEX_SUFFIX, "wb", buffering=1 << 16)
+        self._frames.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, FORMAT_VERSION, time.time()))
+        self._index.write(INDEX_HEADER.pack(INDEX_MAGIC, FORMAT_VERSION))
+        self._offset = SEGMENT_HEADER.size
+        self.stats["segments"] += 1
+
+    def _close_segment(self):
+        if self._frames is not None:
+            self._frames.close()
+            self._index.close()
+            self._frames = self._index = None
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+
+
+class Segment(object):
+    """
+    One mapped segment. times and offsets are arrays with one entry per
+    frame; frame(i) returns the i-th frame.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.created = SEGMENT_HEADER.unpack_from(self.map)
+        if magic != SEGMENT_MAGIC or version != FORMAT_VERSION:
+            raise ValueError("{} is not a recording segment".format(path))
+        index = self._read_index(path[:-len(FRAMES_SUFFIX)] + INDEX_SUFFIX)
+        self.times = index["time"]
+        self.offsets = index["offset"]
+
+    def _read_index(self, path):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            data = b""
+        entries = np.zeros(0, dtype=INDEX_DTYPE)
+        if len(data) >= INDEX_HEADER.size and data[:4] == INDEX_MAGIC:
+            whole = (len(data) - INDEX_HEADER.size) // INDEX_DTYPE.itemsize
+            entries = np.frombuffer(data, dtype=INDEX_DTYPE, count=whole,
+                                    offset=INDEX_HEADER.size)
+        # Entries for frames that never made it to the frames file go, and
+        # frames the index missed are found by walking the records.
+        size = len(self.map)
+        while len(entries) and self._record_end(int(entries["offset"][-1])) > size:
+            entries = entries[:-1]
+        offset = SEGMENT_HEADER.size
+        if len(entries):
+            offset = self._record_end(int(entries["offset"][-1]))
+        missing = []
+        while offset + RECORD.size <= size:
+            timestamp, _, _, length = RECORD.unpack_from(self.map, offset)
+            if offset + RECORD.size + length > size:
+                break
+            missing.append((timestamp, offset))
+            offset += RECORD.size + length
+        if missing:
+            entries = np.concatenate([entries, np.array(missing, dtype=INDEX_DTYPE)])
+        return entries
+
+    def _record_end(self, offset):
+        if offset + RECORD.size > len(self.map):
+            return offset + RECORD.size
+        return offset + RECORD.size + RECORD.unpack_from(self.map, offset)[3]
+
+    def __len__(self):
+        return len(self.times)
+
+    def frame(self, i):
+        offset = int(self.offsets[i])
+        timestamp, frame_id, stream, length = RECORD.unpack_from(self.map, offset)
+        start = offset + RECORD.size
+        return RecordedFrame(timestamp, stream, frame_id,
+                             memoryview(self.map)[start:start + length])
+
+    def close(self):
+        try:
+            self.map.close()
+        except BufferError:
+            # Frames handed out still point into the mapping; it goes when
+            # they do.
+            pass
+
+
+class Replayer(object):
+    """
+    A recording opened for replay. start and end are the times of its first
+    and last frames.
+    """
+
+    def __init__(self, directory):
+        # A segment the recorder died in before writing anything is skipped.
+        paths = [path for path in segment_paths(directory)
+                 if os.path.getsize(path) >= SEGMENT_HEADER.size]
+        self.segments = [segment for segment in map(Segment, paths) if len(segment)]
+        if not self.segments:
+            raise ValueError("No recording in {}".format(directory))
+        self._starts = [float(segment.times[0]) for segment in self.segments]
+        self.start = self._starts[0]
+        self.end = float(self.segments[-1].times[-1])
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments)
+
+    def streams(self):
+        '''The stream numbers in the recording'''
+        return sorted({segment.frame(i).stream for segment in self.segments
+                       for i in range(min(len(segment), 64))})
+
+    def seek(self, timestamp):
+        '''Position (segment, frame) of the first frame at or after timestamp'''
+        segment = max(bisect.bisect_right(self._starts, timestamp) - 1, 0)
+        index = int(np.searchsorted(self.segments[segment].times, timestamp, "left"))
+        if index == len(self.segments[segment]) and segment + 1 < len(self.segments):
+            return segment + 1, 0
+        return segment, index
+
+    def frames(self, start=None):
+        '''Every frame from time start (or the beginning) on, in order'''
+        segment, index = self.seek(start) if start is not None else (0, 0)
+        for number in range(segment, len(self.segments)):
+            current = self.segments[number]
+            for i in range(index, len(current)):
+                yield current.frame(i)
+            index = 0
+
+    def play(self, output, speed=1.0, start=None):
+        '''
+        Call output(frame) for every frame from start on, spaced as they
+        were recorded divided by speed, or as fast as possible if speed is 0
+        '''
+        began = None
+        for frame in self.frames(start):
+            if speed:
+                if began is None:
+                    began = (time.monotonic(), frame.time)
+                delay = began[0] + (frame.time - began[1]) / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            output(frame)
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+
+
+def replay_to(host, port, directory, speed=1.0, start=None, loop=False):
+    '''
+    Send the recording in directory to a receive-cameras at (host, port),
+    each stream as its own FrameSender like the robot does
+    '''
+    from frame_transport import FrameSender
+
+    replayer = Replayer(directory)
+    senders = {}
+
+    def send(frame):
+        sender = senders.get(frame.stream)
+        if sender is None:
+            sender = senders[frame.stream] = FrameSender(host, port, stream=frame.stream)
+        sender.send(bytes(frame.data))
+
+    try:
+        while True:
+            replayer.play(send, speed=speed,
+                          start=None if start is None else replayer.start + start)
+            if not loop:
+                return
+    finally:
+        for sender in senders.values():
+            sender.close()
+        replayer.close()
+
+
+def _drop_cache(directory):
+    '''Write a recording out and drop it from the page cache, so replay reads the disk'''
+    for path in glob.glob(os.path.join(directory, "segment-*")):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def benchmark(directory=None, cameras=2, width=1440, height=1440, fps=30.0,
+              duration=10.0, segment_size=64 << 20, seeks=1000):
+    '''
+    Record duration seconds of cameras synthetic streams (pipeline_bench's
+    cameras, zlib encoded, about 300 KB a frame at 1440x1440) as fast as
+    possible, then replay them as fast as possible from disk. Returns a dict
+    of plain numbers; the fps figures are over all streams, against
+    cameras * fps needed for real time.
+    '''
+    from pipeline_bench import SyntheticCamera
+
+    work = directory or tempfile.mkdtemp(prefix="crunch-recording-")
+    try:
+        # Frames are encoded up front so only the recording is timed.
+        frames = []
+        for camera in range(cameras):
+            synthetic = SyntheticCamera(width, height, seed=camera)
+            frames.append([synthetic.encode(synthetic.capture()[0]) for _ in range(8)])
+        count = int(duration * fps)
+        recorder = Recorder(work, segment_size=segment_size)
+        t0 = time.time()
+        slowest = 0.0
+        started = time.perf_counter()
+        for i in range(count):
+            for camera in range(cameras):
+                before = time.perf_counter()
+                recorder.write(camera, i, frames[camera][i % 8], t0 + i / fps)
+                slowest = max(slowest, time.perf_counter() - before)
+        recorder.close()
+        recorded = time.perf_counter() - started
+        total = recorder.stats["bytes"]
+
+        started = time.perf_counter()
+        _drop_cache(work)
+        synced = time.perf_counter() - started
+        started = time.perf_counter()
+        replayer = Replayer(work)
+        checksum = 0
+        for frame in replayer.frames():
+            checksum = zlib.crc32(frame.data, checksum)
+        replayed = time.perf_counter() - started
+
+        rng = np.random.RandomState(0)
+        targets = rng.uniform(replayer.start, replayer.end, seeks)
+        started = time.perf_counter()
+        for target in targets:
+            replayer.seek(target)
+        seek_time = (time.perf_counter() - started) / seeks
+        replayer.close()
+        needed = cameras * fps
+        return {
+            "frames": count * cameras,
+            "mb": round(total / 1e6, 1),
+            "segments": recorder.stats["segments"],
+            "record_fps": round(count * cameras / recorded, 1),
+            "record_mb_s": round(total / 1e6 / recorded, 1),
+            "record_realtime": round(count * cameras / recorded / needed, 2),
+            # Including writing it all back to the disk
+            "record_synced_mb_s": round(total / 1e6 / (recorded + synced), 1),
+            "slowest_write_ms": round(slowest * 1000, 2),
+            "replay_fps": round(count * cameras / replayed, 1),
+            "replay_mb_s": round(total / 1e6 / replayed, 1),
+            "replay_realtime": round(count * cameras / replayed / needed, 2),
+            "seek_us": round(seek_time * 1e6, 2),
+        }
+    finally:
+        if directory is None:
+            shutil.rmtree(work, ignore_errors=True)
@@ -0,0 +1,291 @@
+"""
+CPU affinity and scheduling profiles for the robot launch.
+
+On the robot computer the capture nodes share the cores with roscore, the
+image_view windows and everything else, and every time one of those takes a
+core a camera frame comes late, which shows as judder in the headset. A
+profile puts each process of the launch in one of three classes and gives
+each class its cores and priority:
+
+    capture     the camera nodes: video_stream (roslaunch) and
+                crunch-cameraN (stream-cameras)
+    transmit    crunch-stream and crunch-receive, which send and receive
+                the UDP streams
+    background  everything else: roscore, rosout, image_view, shells, ...
+
+Profiles:
+
+    none        leave everything as it is
+    pinned      capture and transmit on the hot cores at nice -5,
+                background on the other cores at nice 10
+    realtime    as pinned, but capture and transmit run SCHED_FIFO
+
+The hot cores are the last HOT_CORES of the cores this process may use
+(half of them by default, leaving at least one for the rest); with a single
+core only priorities change. Affinity and scheduling are set per thread, on
+every thread of a process. Raising priority needs CAP_SYS_NICE or an
+rtprio/nice limit; where that is not permitted a FIFO class falls back to
+nice, and a nice that is not permitted is left out, so a profile never
+stops the launch. The kernel's real time throttling
+(/proc/sys/kernel/sched_rt_runtime_us) still leaves the other classes a
+share of a core if a FIFO thread spins.
+
+Processes are found by name, so the Project Crunch tools name themselves
+(set_name) when they start. ProfileWatcher applies a profile to the robot
+launch's session and keeps applying it to processes that start later,
+respawned camera nodes included; robot_launch.sh runs it as
+`Project-Crunch sched-profile --watch` when CRUNCH_SCHED_PROFILE is set.
+"""
+import collections
+import os
+import time
+
+import proc_stats
+
+CAPTURE = "capture"
+TRANSMIT = "transmit"
+BACKGROUND = "background"
+
+# Process name prefixes of each class; the kernel keeps 15 characters.
+CLASS_NAMES = (
+    (CAPTURE, ("video_stream", "crunch-camera")),
+    (TRANSMIT, ("crunch-stream", "crunch-receive")),
+)
+
+# What a profile does to one class: cores "hot", "cold" or None to leave
+# them; fifo, a SCHED_FIFO priority or None; nice, a niceness or None.
+Policy = collections.namedtuple("Policy", "cores fifo nice")
+
+PROFILES = {
+    "none": {},
+    "pinned": {
+        CAPTURE: Policy("hot", None, -5),
+        TRANSMIT: Policy("hot", None, -5),
+        BACKGROUND: Policy("cold", None, 10),
+    },
+    "realtime": {
+        CAPTURE: Policy("hot", 50, -10),
+        TRANSMIT: Policy("hot", 40, -10),
+        BACKGROUND: Policy("cold", None, 10),
+    },
+}
+
+# Seconds between looks for new processes in ProfileWatcher
+WATCH_INTERVAL = 2.0
+
+
+def set_name(name):
+    '''Name this process (its main thread) name, as ps and the profiles see it'''
+    try:
+        with open("/proc/self/comm", "w") as f:
+            f.write(name[:15])
+    except OSError:
+        pass
+
+
+def classify(name):
+    '''The class of a process called name'''
+    for kind, prefixes in CLASS_NAMES:
+        if name.startswith(prefixes):
+            return kind
+    return BACKGROUND
+
+
+def split_cores(hot=None, cores=None):
+    '''
+    (hot, cold) sets of cores: the last hot of cores (those this process may
+    use by default), half of them unless given, and the rest
+    '''
+    cores = sorted(os.sched_getaffinity(0) if cores is None else cores)
+    if len(cores) < 2:
+        return set(cores), set(cores)
+    if hot is None:
+        hot = len(cores) // 2
+    hot = min(max(hot, 1), len(cores) - 1)
+    return set(cores[-hot:]), set(cores[:-hot])
+
+
+def _threads(pid):
+    try:
+        return [int(tid) for tid in os.listdir("/proc/{}/task".format(pid))]
+    except OSError:
+        return []
+
+
+def apply_policy(pid, policy, hot, cold):
+    '''
+    Apply policy to every thread of pid. Returns what was done, e.g.
+    ["cores 2,3", "fifo 50"], with "(not permitted)" where it was refused.
+    '''
+    done = []
+    cores = {"hot": hot, "cold": cold}.get(policy.cores)
+    nice = policy.nice
+    fifo_refused = False
+    for tid in _threads(pid):
+        try:
+            if cores:
+                os.sched_setaffinity(tid, cores)
+            if policy.fifo is not None and not fifo_refused:
+                try:
+                    os.sched_setscheduler(tid, os.SCHED_FIFO, os.sched_param(policy.fifo))
+                except PermissionError:
+                    fifo_refused = True
+            if nice is not None:
+                try:
+                    os.setpriority(os.PRIO_PROCESS, tid, nice)
+                except PermissionError:
+                    nice = None
+                    done.append("nice {} (not permitted)".format(policy.nice))
+        except ProcessLookupError:
+            # The thread exited meanwhile.
+            continue
+    if cores:
+        done.append("cores {}".format(",".join(str(core) for core in sorted(cores))))
+    if policy.fifo is not None:
+        done.append("fifo {}{}".format(policy.fifo, " (not permitted)" if fifo_refused else ""))
+    if nice is not None:
+        done.append("nice {}".format(nice))
+    return done
+
+
+def apply_profile(profile, pids, hot_cores=None, output=print):
+    '''
+    Apply profile, a name in PROFILES, to pids. Returns {pid: (class,
+    actions)}; output gets a line per process.
+    '''
+    policies = PROFILES[profile]
+    hot, cold = split_cores(hot_cores)
+    table = proc_stats.scan(only=pids)
+    result = {}
+    for pid in sorted(table):
+        kind = classify(table[pid].name)
+        policy = policies.get(kind)
+        if policy is None:
+            continue
+        actions = apply_policy(pid, policy, hot, cold)
+        result[pid] = (kind, actions)
+        output("{} {} ({}): {}".format(pid, table[pid].name, kind, ", ".join(actions)))
+    return result
+
+
+class ProfileWatcher(object):
+    """
+    Applies profile to the launch session recorded in session_file and to
+    its descendants, every interval seconds to the threads it has not seen
+    yet, until stopped.
+    """
+
+    def __init__(self, profile, session_file=None, hot_cores=None, interval=WATCH_INTERVAL,
+                 output=print):
+        from health import SESSION_FILE
+
+        self.profile = profile
+        self.session_file = session_file or SESSION_FILE
+        self.hot_cores = hot_cores
+        self.interval = interval
+        self.output = output
+        # Threads already done; pids and tids are reused, so this only
+        # keeps those that still exist.
+        self._done = set()
+
+    def apply(self):
+        from health import read_session
+
+        session = read_session(self.session_file)
+        if session is None:
+            return {}
+        table = proc_stats.scan()
+        pids = proc_stats.family(table, sessions=[session]) - {os.getpid()}
+        threads = {(pid, tid) for pid in pids for tid in _threads(pid)}
+        self._done &= threads
+        new = {pid for pid, tid in threads - self._done}
+        self._done |= threads
+        if not new:
+            return {}
+        return apply_profile(self.profile, new, self.hot_cores, self.output)
+
+    def run(self, stop=None):
+        while stop is None or not stop():
+            self.apply()
+            time.sleep(self.interval)
+
+
+#######################################
+# Benchmark
+#######################################
+def _camera(index, width, height, fps, duration, intervals):
+    from pipeline_bench import SyntheticCamera
+
+    set_name("crunch-camera{}".format(index + 1))
+    camera = SyntheticCamera(width, height, seed=index)
+    ticks = []
+    next_frame = time.monotonic() + 0.5
+    end = next_frame + duration
+    while next_frame < end:
+        delay = next_frame - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        ticks.append(time.monotonic())
+        camera.encode(camera.capture()[0])
+        next_frame += 1.0 / fps
+        # A frame that is more than one late is skipped, as a camera would.
+        if time.monotonic() > next_frame + 1.0 / fps:
+            next_frame = time.monotonic()
+    intervals.put([b - a for a, b in zip(ticks, ticks[1:])])
+
+
+def _load():
+    set_name("crunch-load")
+    while True:
+        sum(range(10000))
+
+
+def _jitter(profile, cameras, load, width, height, fps, duration, hot_cores):
+    import multiprocessing
+
+    intervals = multiprocessing.Queue()
+    loaders = [multiprocessing.Process(target=_load, daemon=True) for _ in range(load)]
+    workers = [multiprocessing.Process(target=_camera,
+                                       args=(i, width, height, fps, duration, intervals))
+               for i in range(cameras)]
+    for process in loaders + workers:
+        process.start()
+    time.sleep(0.2)
+    apply_profile(profile, [process.pid for process in loaders + workers], hot_cores,
+                  output=lambda line: None)
+    gaps = []
+    for _ in workers:
+        gaps.extend(intervals.get())
+    for process in workers:
+        process.join()
+    for process in loaders:
+        process.terminate()
+        process.join()
+    period = 1.0 / fps
+    gaps.sort()
+    mean = sum(gaps) / len(gaps)
+    variance = sum((gap - mean) ** 2 for gap in gaps) / len(gaps)
+    return {
+        "frames": len(gaps) + cameras,
+        "interval_ms": round(mean * 1000, 2),
+        "stdev_ms": round(variance ** 0.5 * 1000, 2),
+        "p99_deviation_ms": round(sorted(abs(gap - period) for gap in gaps)[
+            int(0.99 * (len(gaps) - 1))] * 1000, 2),
+        "late": sum(1 for gap in gaps if gap > 1.5 * period),
+    }
+
+
+def benchmark(profiles=("none", "pinned", "realtime"), cameras=2, load=None, width=640,
+              height=480, fps=30.0, duration=10.0, hot_cores=None):
+    '''
+    Inter-frame intervals of cameras synthetic capture processes (capture
+    and zlib encode at fps) while load busy processes, twice the cores by
+    default, compete for the CPU, under each of profiles. Returns {profile:
+    result}, each with the mean interval, its standard deviation, the 99th
+    percentile deviation from the frame period in ms, and the number of
+    intervals over one and a half periods ("late").
+    '''
+    if load is None:
+        load = 2 * len(os.sched_getaffinity(0))
+    return {profile: _jitter(profile, cameras, load, width, height, fps, duration, hot_cores)
+            for profile in profiles}
@@ -0,0 +1,176 @@
+"""
+Shared, multiplexed ssh connections to the robot.
+
+Every RobotConnection keeps one OpenSSH master channel (ControlMaster) open
+per user@host. Commands and long running processes all ride on that
+channel, so only the first call pays for the handshake and key exchange.
+Use connection() to get the shared instance for a robot.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+# Seconds the master stays up after the last client disconnects
+CONTROL_PERSIST = 600
+
+
+class RobotConnection(object):
+    """
+    A persistent ssh master channel to user@host.
+
+    run() executes a command and waits for it, and popen() starts a long
+    running remote process.
+    """
+
+    def __init__(self, user, host, control_dir=None):
+        self.user = user
+        self.host = host
+        self.target = "{}@{}".format(user, host)
+        if control_dir is None:
+            control_dir = os.path.join(os.path.expanduser("~"), ".ssh")
+        # Unix socket paths are short, so keep the name compact.
+        self.control_path = os.path.join(control_dir, "crunch-%r@%h:%p")
+        self._lock = threading.Lock()
+        self._opened = False
+
+    def options(self):
+        return [
+            "-o", "ControlMaster=auto",
+            "-o", "ControlPath={}".format(self.control_path),
+            "-o", "ControlPersist={}".format(CONTROL_PERSIST),
+        ]
+
+    def is_open(self):
+        '''Return True if the master channel is up'''
+        check = subprocess.run(
+                ["ssh", "-o", "ControlPath={}".format(self.control_path),
+                 "-O", "check", self.target],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return check.returncode == 0
+
+    def open(self):
+        '''Start the master channel in the background if it is not up yet'''
+        # ControlMaster=auto brings the master back if it ever drops, so
+        # the check only has to happen once.
+        with self._lock:
+            if self._opened:
+                return
+            if not self.is_open():
+                subprocess.run(["ssh", *self.options(), "-M", "-N", "-f", self.target],
+                               check=True)
+            self._opened = True
+
+    def close(self):
+        '''Shut down the master channel'''
+        self._opened = False
+        subprocess.run(
+                ["ssh", "-o", "ControlPath={}".format(self.control_path),
+                 "-O", "exit", self.target],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def command(self, remote_cmd=None):
+        '''Return the local argv that runs remote_cmd over the master channel'''
+        argv = ["ssh", *self.options(), self.target]
+        if remote_cmd is not None:
+            argv.append(remote_cmd)
+        return argv
+
+    def run(self, remote_cmd, input=None, check=True, timeout=None):
+        '''Run remote_cmd and wait for it. Returns a CompletedProcess.'''
+        self.open()
+        return subprocess.run(self.command(remote_cmd), input=input,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True, check=check,
+                              timeout=timeout)
+
+    def popen(self, remote_cmd=None, **kwargs):
+        '''Start remote_cmd (or a login shell) and return the local Popen'''
+        self.open()
+        return subprocess.Popen(self.command(remote_cmd), **kwargs)
+
+    def round_trip(self):
+        '''Return the seconds taken to run a no-op command on the robot'''
+        start = time.monotonic()
+        self.run("true")
+        return time.monotonic() - start
+
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def connection(user, host):
+    '''Return the shared RobotConnection for user@host'''
+    key = (user, host)
+    with _connections_lock:
+        if key not in _connections:
+            _connections[key] = RobotConnection(user, host)
+        return _connections[key]
+
+
+def close_all():
+    '''Shut down every master channel opened by this process'''
+    with _connections_lock:
+        for conn in _connections.values():
+            conn.close()
+        _connections.clear()
+
+
+#######################################
+# Benchmark
+#######################################
+# Remote stand-ins for robot_launch.sh and kill_launch.sh
+_LAUNCH = "nohup sleep 600 >/dev/null 2>&1 & echo $!"
+_KILL = "kill {}"
+
+
+def _summary(times):
+    times = sorted(times)
+    return {
+        "median_ms": round(times[len(times) // 2] * 1000, 1),
+        "max_ms": round(times[-1] * 1000, 1),
+    }
+
+
+def benchmark(user, host="localhost", repeats=10):
+    '''
+    Time launch and kill round trips to user@host, e.g. a local sshd: start
+    a remote stand-in for robot_launch.sh and kill it again, repeats times.
+    "fresh" opens a new ssh connection for each command, as the launcher did
+    before the pool; "pooled" uses a master channel of its own, opened
+    beforehand in "open_ms". Returns a dict of those.
+    '''
+    target = "{}@{}".format(user, host)
+    fresh = []
+    for _ in range(repeats):
+        start = time.monotonic()
+        pid = subprocess.run(["ssh", "-o", "ControlPath=none", target, _LAUNCH],
+                             stdout=subprocess.PIPE, universal_newlines=True,
+                             check=True).stdout.strip()
+        subprocess.run(["ssh", "-o", "ControlPath=none", target, _KILL.format(pid)],
+                       check=True)
+        fresh.append(time.monotonic() - start)
+
+    control_dir = tempfile.mkdtemp(prefix="crunch-ssh-")
+    conn = RobotConnection(user, host, control_dir=control_dir)
+    try:
+        start = time.monotonic()
+        conn.open()
+        opened = time.monotonic() - start
+        pooled = []
+        for _ in range(repeats):
+            start = time.monotonic()
+            pid = conn.run(_LAUNCH).stdout.strip()
+            conn.run(_KILL.format(pid))
+            pooled.append(time.monotonic() - start)
+    finally:
+        conn.close()
+        shutil.rmtree(control_dir, ignore_errors=True)
+    return {
+        "fresh": _summary(fresh),
+        "pooled": _summary(pooled),
+        "open_ms": round(opened * 1000, 1),
+    }
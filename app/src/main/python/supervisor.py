@@ -0,0 +1,276 @@
+"""
+Ownership of the processes a launch starts.
+
+Every process the Supervisor spawns gets a process group of its own, so
+whatever it starts in turn (rviz, a camera streamer behind a shell script)
+goes down with it. Descendants that left the group, like the nodes roslaunch
+starts in sessions of their own, are found by ancestry when it stops. Nothing
+is found by name: the supervisor only ever signals what it started.
+
+A process spawned with respawn=True is started again when it crashes (exits
+non-zero or on a signal). The first restart is almost immediate; if it keeps
+crashing, the delay doubles up to BACKOFF_MAX, and it goes back to the start
+once the process has stayed up for STABLE_AFTER seconds. If it cannot be
+started again at all, e.g. its command is gone, it is marked failed and
+left down.
+
+stop() tears everything down at once: SIGTERM to every group, a shared
+deadline, then SIGKILL to whatever is left. Teardown actions for processes
+the supervisor cannot signal itself, such as the robot side over ssh, are
+added with on_stop() and run in parallel with the local teardown.
+
+robot_launch.sh runs its camera nodes under `Project-Crunch supervise`, which
+is this class around a single command.
+"""
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import proc_stats
+
+# Seconds between SIGTERM and SIGKILL
+TERM_TIMEOUT = 0.5
+# Respawn delays in seconds: the first, and the most it grows to
+BACKOFF_FIRST = 0.02
+BACKOFF_MAX = 5.0
+# Seconds a respawned process has to stay up for the delay to reset
+STABLE_AFTER = 10.0
+# Seconds between checks for exited groups during teardown
+POLL_INTERVAL = 0.01
+
+# How each process ended up in stop()
+EXITED = "exited"
+TERMINATED = "terminated"
+KILLED = "killed"
+
+
+def signal_group(pgid, sig):
+    try:
+        os.killpg(pgid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def signal_pids(pids, sig):
+    for pid in pids:
+        try:
+            os.kill(pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+class SupervisedProcess(object):
+    """
+    One command under a Supervisor. proc is the current Popen, restarts the
+    number of times it has been respawned, delay the backoff before the
+    last respawn and respawned_in the seconds from the last crash to the new
+    process being started, delay included. failed is the OSError a respawn
+    failed with, after which the process stays down.
+    """
+
+    def __init__(self, supervisor, name, argv, respawn, popen_args):
+        self.supervisor = supervisor
+        self.name = name
+        self.argv = list(argv)
+        self.respawn = respawn
+        self.popen_args = popen_args
+        self.proc = None
+        self.started = None
+        self.restarts = 0
+        self.respawned_in = None
+        self.delay = None
+        self.failed = None
+        self.backoff = BACKOFF_FIRST
+        self._thread = None
+
+    @property
+    def pgid(self):
+        # Every process is the leader of its own group.
+        return self.proc.pid
+
+    def start(self):
+        self.proc = subprocess.Popen(self.argv, preexec_fn=os.setpgrp, **self.popen_args)
+        self.started = time.monotonic()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, daemon=True,
+                                            name="supervise-" + self.name)
+            self._thread.start()
+
+    def _watch(self):
+        while True:
+            code = self.proc.wait()
+            crashed_at = time.monotonic()
+            if not self.respawn or code == 0 or self.supervisor.stopping.is_set():
+                return
+            # Whatever the crashed process left behind in its group goes too.
+            signal_group(self.pgid, signal.SIGKILL)
+            if crashed_at - self.started >= STABLE_AFTER:
+                self.backoff = BACKOFF_FIRST
+            delay = self.delay = self.backoff
+            self.backoff = min(self.backoff * 2, BACKOFF_MAX)
+            self.supervisor.output("{} exited with {}, restarting in {:.2f}s".format(
+                self.name, code, delay))
+            if self.supervisor.stopping.wait(delay):
+                return
+            with self.supervisor.lock:
+                if self.supervisor.stopping.is_set():
+                    return
+                try:
+                    self.start()
+                except OSError as e:
+                    self.failed = e
+                    self.supervisor.output("{} could not be restarted: {}".format(
+                        self.name, e))
+                    return
+            self.restarts += 1
+            self.respawned_in = time.monotonic() - crashed_at
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+class Supervisor(object):
+    """
+    The processes of one launch. output is called with a line of text
+    whenever a process is respawned or cannot be.
+    """
+
+    def __init__(self, output=print, term_timeout=TERM_TIMEOUT):
+        self.output = output
+        self.term_timeout = term_timeout
+        self.processes = []
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self._on_stop = []
+
+    def spawn(self, name, argv, respawn=False, **popen_args):
+        '''
+        Start argv in a new process group and return its SupervisedProcess.
+        popen_args are passed on to subprocess.Popen.
+        '''
+        with self.lock:
+            if self.stopping.is_set():
+                raise RuntimeError("Supervisor is stopped")
+            process = SupervisedProcess(self, name, argv, respawn, popen_args)
+            process.start()
+            self.processes.append(process)
+        return process
+
+    def on_stop(self, name, action):
+        '''Call action() in parallel with the local teardown in stop()'''
+        self._on_stop.append((name, action))
+
+    def stop(self):
+        '''
+        Stop every process and run the on_stop actions. Returns a dict of
+        name to EXITED, TERMINATED or KILLED for the spawned processes.
+        '''
+        with self.lock:
+            self.stopping.set()
+            processes = list(self.processes)
+
+        actions = []
+        for name, action in self._on_stop:
+            thread = threading.Thread(target=self._run_action, args=(name, action),
+                                      daemon=True, name="stop-" + name)
+            thread.start()
+            actions.append(thread)
+
+        # Everything is looked up once, before anything is signalled: once
+        # a parent is gone its children no longer descend from it.
+        table = proc_stats.scan()
+        result = {}
+        live = {}
+        for process in processes:
+            # A failed process's pid is long gone and may be someone else's.
+            pids = [] if process.failed is not None else proc_stats.running(
+                    proc_stats.family(table, [process.pgid]))
+            if not pids:
+                result[process.name] = EXITED
+                continue
+            signal_group(process.pgid, signal.SIGTERM)
+            signal_pids(pids, signal.SIGTERM)
+            live[process] = pids
+        deadline = time.monotonic() + self.term_timeout
+        while live and time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            for process, pids in list(live.items()):
+                live[process] = proc_stats.running(pids)
+                if not live[process]:
+                    result[process.name] = TERMINATED
+                    del live[process]
+        for process, pids in live.items():
+            signal_group(process.pgid, signal.SIGKILL)
+            signal_pids(pids, signal.SIGKILL)
+            result[process.name] = KILLED
+        for process in processes:
+            process.proc.wait()
+            process.join()
+        for thread in actions:
+            thread.join()
+        return result
+
+    def _run_action(self, name, action):
+        try:
+            action()
+        except Exception as e:
+            self.output("Stopping {} failed: {!r}".format(name, e))
+
+
+def supervise(argv, name=None):
+    '''
+    Run argv, respawning it whenever it crashes, until this process gets
+    SIGTERM, SIGINT or SIGHUP. Returns an exit code: 1 if argv could not be
+    started again after a crash, 0 otherwise.
+    '''
+    supervisor = Supervisor(output=lambda line: print(line, flush=True))
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(sig, lambda signum, frame: stop.set())
+    process = supervisor.spawn(name or os.path.basename(argv[0]), argv, respawn=True)
+    # A clean exit is not restarted, so the supervisor goes with it; nor is
+    # a process that could not be started again.
+    while not stop.wait(0.2):
+        if process.proc.poll() == 0 or process.failed is not None:
+            break
+    supervisor.stop()
+    return 1 if process.failed is not None else 0
+
+
+def benchmark(children=8, crashes=5):
+    '''
+    Time respawn and teardown with fake children: a process that crashes
+    every 50 ms, and shells that leave a grandchild behind, half of them
+    ignoring SIGTERM. Returns a dict of seconds: "respawn", from each crash
+    to the new process less the backoff delay; "first_respawn", the whole
+    of the first one; "teardown" and "teardown_ignoring_term", to stop()
+    children processes that do and do not exit on SIGTERM.
+    '''
+    supervisor = Supervisor(output=lambda line: None)
+    crasher = supervisor.spawn("crasher", [sys.executable, "-c",
+                                           "import time; time.sleep(0.05); raise SystemExit(1)"],
+                               respawn=True)
+    respawns = []
+    while len(respawns) < crashes:
+        restarts = crasher.restarts
+        while crasher.restarts == restarts:
+            time.sleep(0.001)
+        respawns.append((crasher.respawned_in, crasher.delay))
+    supervisor.stop()
+    result = {"first_respawn": respawns[0][0],
+              "respawn": [total - delay for total, delay in respawns]}
+
+    for key, script in (("teardown", "sleep 60 & wait"),
+                        ("teardown_ignoring_term", "trap '' TERM; sleep 60 & wait; wait")):
+        supervisor = Supervisor(output=lambda line: None)
+        for i in range(children):
+            supervisor.spawn("child{}".format(i), ["bash", "-c", script])
+        time.sleep(0.2)
+        start = time.monotonic()
+        supervisor.stop()
+        result[key] = time.monotonic() - start
+    return result
@@ -0,0 +1,76 @@
+"""
+Kernel hotplug (uevent) listener.
+
+Reads device add/remove/change events straight from the kernel over a
+netlink socket, so hotplug changes are seen the moment they happen without
+polling or forking udevadm.
+"""
+import select
+import socket
+
+# From linux/netlink.h
+NETLINK_KOBJECT_UEVENT = 15
+# Multicast group the kernel sends raw uevents to
+KERNEL_GROUP = 1
+
+
+def parse_uevent(data):
+    '''
+    Parse one raw kernel uevent into a dict. The message is a header such
+    as "add@/devices/..." followed by NUL separated KEY=VALUE pairs. Returns
+    None for messages that are not kernel uevents (e.g. from libudev).
+    '''
+    fields = data.split(b"\0")
+    if b"@" not in fields[0]:
+        return None
+    event = {}
+    for field in fields[1:]:
+        key, sep, value = field.partition(b"=")
+        if sep:
+            event[key.decode("ascii", "replace")] = value.decode("utf-8", "replace")
+    if "ACTION" not in event or "DEVPATH" not in event:
+        return None
+    return event
+
+
+class UeventMonitor(object):
+    """
+    A netlink socket subscribed to kernel uevents. Use receive() to wait for
+    the next event, or iterate to get events forever. The socket can also be
+    handed to select() through fileno().
+    """
+
+    def __init__(self, subsystems=None, bufsize=1 << 20):
+        self.subsystems = set(subsystems) if subsystems else None
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM,
+                                  NETLINK_KOBJECT_UEVENT)
+        # A large receive buffer keeps bursts (e.g. a hub being plugged in)
+        # from being dropped.
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, bufsize)
+        self.sock.bind((0, KERNEL_GROUP))
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+    def receive(self, timeout=None):
+        '''
+        Return the next matching event as a dict, or None if timeout seconds
+        pass without one.
+        '''
+        while True:
+            readable, _, _ = select.select([self.sock], [], [], timeout)
+            if not readable:
+                return None
+            event = parse_uevent(self.sock.recv(65536))
+            if event is None:
+                continue
+            if self.subsystems and event.get("SUBSYSTEM") not in self.subsystems:
+                continue
+            return event
+
+    def __iter__(self):
+        while True:
+            yield self.receive()
@@ -0,0 +1,185 @@
+"""
+Live list of plugged in Vive headsets.
+
+A HeadsetMonitor listens to kernel hotplug events for USB and DRM devices.
+It tracks every HTC Vive that is attached, in the order they were attached,
+together with the display connector the headset's panel showed up on. The
+most recently attached headset is always at the end of the list, so finding
+it is O(1) and never needs a rescan or a poll.
+"""
+import collections
+import os
+import threading
+
+from uevent import UeventMonitor
+
+# USB vendor/product ids of the headset itself (the HTC hub inside the HMD)
+VIVE_USB_IDS = {("0bb4", "2c87")}
+# EDID manufacturer id of the Vive panel
+VIVE_EDID_VENDOR = "HVR"
+
+
+class Headset(object):
+    def __init__(self, devpath, vendor, product, busnum=None, devnum=None):
+        self.devpath = devpath
+        self.vendor = vendor
+        self.product = product
+        self.busnum = busnum
+        self.devnum = devnum
+        self.connector = None
+
+    def __repr__(self):
+        return "Headset({}, {}:{}, connector={})".format(
+                self.devpath, self.vendor, self.product, self.connector)
+
+
+def edid_vendor(edid):
+    '''Decode the three letter manufacturer id from an EDID block'''
+    if len(edid) < 10:
+        return None
+    code = (edid[8] << 8) | edid[9]
+    return "".join(chr(((code >> shift) & 0x1f) + ord("A") - 1) for shift in (10, 5, 0))
+
+
+class HeadsetMonitor(object):
+    """
+    Keeps the list of attached headsets current from uevents.
+
+    start() seeds the list from sysfs and listens on a background thread;
+    handle_uevent() can also be fed events directly.
+    """
+
+    def __init__(self, sysfs_root="/sys", usb_ids=VIVE_USB_IDS):
+        self.sysfs_root = sysfs_root
+        self.usb_ids = usb_ids
+        self._headsets = collections.OrderedDict()
+        self._connectors = set()
+        self._lock = threading.Lock()
+        self._monitor = None
+
+    def start(self):
+        self._monitor = UeventMonitor(subsystems=["usb", "drm"])
+        self.scan()
+        thread = threading.Thread(target=self._listen, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        if self._monitor is not None:
+            self._monitor.close()
+            self._monitor = None
+
+    def _listen(self):
+        try:
+            for event in self._monitor:
+                self.handle_uevent(event)
+        except (OSError, ValueError):
+            # The socket was closed by stop().
+            pass
+
+    def scan(self):
+        '''Seed the list with headsets that were attached before we started'''
+        usb_dir = os.path.join(self.sysfs_root, "bus", "usb", "devices")
+        try:
+            entries = sorted(os.listdir(usb_dir))
+        except OSError:
+            entries = []
+        found = []
+        for entry in entries:
+            path = os.path.join(usb_dir, entry)
+            ids = (self._read(path, "idVendor"), self._read(path, "idProduct"))
+            if ids in self.usb_ids:
+                devpath = os.path.realpath(path)[len(os.path.realpath(self.sysfs_root)):]
+                found.append(Headset(devpath, ids[0], ids[1],
+                                     self._read(path, "busnum"),
+                                     self._read(path, "devnum")))
+        with self._lock:
+            for headset in found:
+                self._headsets.setdefault(headset.devpath, headset)
+        self._update_connectors()
+
+    def _read(self, path, name):
+        try:
+            with open(os.path.join(path, name)) as f:
+                return f.read().strip()
+        except OSError:
+            return ""
+
+    def handle_uevent(self, event):
+        subsystem = event.get("SUBSYSTEM")
+        if subsystem == "usb" and event.get("DEVTYPE") == "usb_device":
+            self._handle_usb(event)
+        elif subsystem == "drm":
+            self._update_connectors()
+
+    def _handle_usb(self, event):
+        devpath = event["DEVPATH"]
+        if event["ACTION"] == "remove":
+            with self._lock:
+                headset = self._headsets.pop(devpath, None)
+                if headset is not None and headset.connector:
+                    self._connectors.discard(headset.connector)
+            return
+        if event["ACTION"] != "add":
+            return
+        # PRODUCT is vendor/product/bcdDevice in hex without leading zeros.
+        parts = event.get("PRODUCT", "").split("/")
+        if len(parts) < 2:
+            return
+        ids = (parts[0].zfill(4), parts[1].zfill(4))
+        if ids not in self.usb_ids:
+            return
+        headset = Headset(devpath, ids[0], ids[1],
+                          event.get("BUSNUM"), event.get("DEVNUM"))
+        with self._lock:
+            self._headsets.pop(devpath, None)
+            self._headsets[devpath] = headset
+        self._update_connectors()
+
+    def _update_connectors(self):
+        '''
+        Give newly connected Vive panels to the most recent headsets that do
+        not have a connector yet.
+        '''
+        drm_dir = os.path.join(self.sysfs_root, "class", "drm")
+        try:
+            connectors = sorted(os.listdir(drm_dir))
+        except OSError:
+            return
+        vive_connectors = []
+        for connector in connectors:
+            path = os.path.join(drm_dir, connector)
+            if self._read(path, "status") != "connected":
+                continue
+            try:
+                with open(os.path.join(path, "edid"), "rb") as f:
+                    edid = f.read(128)
+            except OSError:
+                continue
+            if edid_vendor(edid) == VIVE_EDID_VENDOR:
+                vive_connectors.append(connector)
+        with self._lock:
+            self._connectors &= set(vive_connectors)
+            free = [c for c in vive_connectors if c not in self._connectors]
+            for headset in reversed(self._headsets.values()):
+                if headset.connector not in vive_connectors:
+                    headset.connector = None
+                if headset.connector is None and free:
+                    headset.connector = free.pop()
+                    self._connectors.add(headset.connector)
+
+    def headsets(self):
+        '''Return the attached headsets, oldest first'''
+        with self._lock:
+            return list(self._headsets.values())
+
+    def latest(self, exclude=()):
+        '''
+        Return the most recently attached headset whose devpath is not in
+        exclude, or None.
+        '''
+        with self._lock:
+            for headset in reversed(self._headsets.values()):
+                if headset.devpath not in exclude:
+                    return headset
+        return None
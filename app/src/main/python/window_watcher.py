@@ -0,0 +1,106 @@
+"""
+Event-driven placement of the HMD windows.
+
+The rviz OpenHMD plugin opens one window per headset, titled HMD1, HMD2, ...
+Instead of sleeping a fixed amount of time and hoping the windows exist, the
+HMDWindowWatcher subscribes to window creation, mapping and title changes on
+the X11 root window and moves each HMD window onto its headset as soon as it
+shows up. It gives up once the deadline passes.
+"""
+import select
+import time
+
+from Xlib import X, Xatom, display, error
+
+from display_layout import move_window, window_name
+
+
+class HMDWindowWatcher(object):
+    """
+    Watches the X server for windows whose title matches one of the given
+    targets and places them.
+
+    targets maps a window title (e.g. "HMD1") to the (x, y, width, height)
+    geometry the window should be moved to. run() blocks until every target
+    is placed or the deadline (in seconds) expires, and returns a dict of
+    title -> X window id for the windows that were placed.
+    """
+
+    def __init__(self, targets, deadline=60.0, display_name=None):
+        self.targets = dict(targets)
+        self.deadline = deadline
+        self.display_name = display_name
+        self.placed = {}
+
+    def run(self):
+        disp = display.Display(self.display_name)
+        try:
+            return self._watch(disp)
+        finally:
+            disp.close()
+
+    def _watch(self, disp):
+        root = disp.screen().root
+        self._net_client_list = disp.intern_atom("_NET_CLIENT_LIST")
+        self._net_wm_name = disp.intern_atom("_NET_WM_NAME")
+        self._seen = set()
+
+        # Subscribe before scanning so no window can slip between the scan
+        # and the first event.
+        root.change_attributes(
+                event_mask=X.SubstructureNotifyMask | X.PropertyChangeMask)
+        disp.sync()
+        self._scan(disp, root)
+
+        end = time.monotonic() + self.deadline
+        while len(self.placed) < len(self.targets):
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                missing = sorted(set(self.targets) - set(self.placed))
+                print("Gave up waiting for windows: {}".format(", ".join(missing)))
+                break
+            if not disp.pending_events():
+                readable, _, _ = select.select([disp], [], [], remaining)
+                if not readable:
+                    continue
+            while disp.pending_events():
+                self._handle(disp, root, disp.next_event())
+        return self.placed
+
+    def _handle(self, disp, root, ev):
+        if ev.type in (X.CreateNotify, X.MapNotify, X.ReparentNotify):
+            self._check(disp, ev.window)
+        elif ev.type == X.PropertyNotify:
+            if ev.window == root:
+                if ev.atom == self._net_client_list:
+                    self._scan(disp, root)
+            elif ev.atom in (Xatom.WM_NAME, self._net_wm_name):
+                self._check(disp, ev.window)
+
+    def _scan(self, disp, root):
+        '''Look at every existing client window, with or without a WM.'''
+        clients = root.get_full_property(self._net_client_list, Xatom.WINDOW)
+        if clients is not None:
+            windows = [disp.create_resource_object("window", wid)
+                       for wid in clients.value]
+        else:
+            windows = root.query_tree().children
+        for window in windows:
+            self._check(disp, window)
+
+    def _check(self, disp, window):
+        try:
+            # The title is often set or changed after the window is
+            # created, so listen for it on every window we come across.
+            if window.id not in self._seen:
+                self._seen.add(window.id)
+                window.change_attributes(event_mask=X.PropertyChangeMask)
+            name = window_name(disp, window)
+            if name in self.targets and name not in self.placed:
+                move_window(disp, window, *self.targets[name])
+                disp.flush()
+                self.placed[name] = window.id
+                print("Placed {} (window {:#x})".format(name, window.id))
+        except error.BadWindow:
+            # The window went away before we could look at it.
+            pass
@@ -24,6 +24,16 @@ function valid_ip()
 }
 
 
+#####################################################################
+# Read the Project Crunch configuration
+#####################################################################
+# Written by the installer: catkin paths, hostnames and the ROS network
+# settings. The arguments below override it.
+CONFIG="${CRUNCH_CONFIG:-$HOME/.config/project-crunch/config}"
+# shellcheck disable=SC1090
+[ -f "$CONFIG" ] && source "$CONFIG"
+
+
 #####################################################################
 # Parse args
 #####################################################################
@@ -42,13 +52,19 @@ case $key in
     shift # past argument
     shift # past value
     ;;
+    -t|--transport)
+    TRANSPORT="$2"
+    shift # past argument
+    shift # past value
+    ;;
 esac
 done
 
+CATKIN=${CATKIN:-${BASE_CATKIN_PATH%/}}
 if [ -z "${CATKIN}" ];
 then
     echo "ERROR: Must provide path to catkin workspace"
-	echo "Usage: base_launch.sh <-c|--catkin path to catkin workspace> [-l|--logfile logfile]"
+	echo "Usage: base_launch.sh <-c|--catkin path to catkin workspace> [-l|--logfile logfile] [-t|--transport ros|udp]"
     exit 1
     # TODO: Make sure $CATKIN is a valid directory
 fi
@@ -65,6 +81,10 @@ then
     LOGFILE="log$(timestamp)$MYFILENAME.txt"
 fi
 
+# "ros" streams images as ROS topics over TCP, "udp" uses the
+# loss tolerant UDP frame transport.
+TRANSPORT=${TRANSPORT:-${CRUNCH_TRANSPORT:-ros}}
+
 SPHERE_LAUNCH="vive.launch"
 # RVIZ_CONFIG_FILE="rviz_textured_sphere.rviz"
 # RVIZ_CONFIG="rviz_cfg"
@@ -75,6 +95,21 @@ SPHERE_LAUNCH="vive.launch"
 # shellcheck disable=SC1090
 source "$CATKIN"/devel/setup.bash
 
+#####################################################################
+ # Receive camera streams sent over UDP
+#####################################################################
+if [[ "$TRANSPORT" == "udp" ]];
+then
+    SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+    if [ -x "$SCRIPT_DIR/Project-Crunch" ];
+    then
+        "$SCRIPT_DIR/Project-Crunch" receive-cameras &
+    else
+        python3 "$SCRIPT_DIR/../../python/main.py" receive-cameras &
+    fi
+    echo "[INFO: $MYFILENAME $LINENO] Receiving camera streams over UDP" >> "$LOGFILE"
+fi
+
 #####################################################################
  # Launch Rviz and textured sphere
 #####################################################################
@@ -1,28 +1,17 @@
 #!/usr/bin/env bash
-# shellcheck disable=SC2044
-# shellcheck disable=SC2106
+# Prints the cameras found by the launcher's sysfs camera discovery.
 
-function find_cam_names {	
-	for sysdevpath in $(find /sys/bus/usb/devices/usb*/ -name dev); do
-		(
-			syspath="${sysdevpath%/dev}"
-			devname="$(udevadm info -q name -p "$syspath")"
-			[[ "$devname" == "bus/"* ]] && continue
-			eval "$(udevadm info -q property --export -p "$syspath")"
-			[[ -z "$ID_SERIAL" ]] && continue
-			if [[ "$devname" == "video"* ]] 
-				then
-					if [[ "$ID_SERIAL" == *"KODAK"* ]]
-						then
-							echo "/dev/$devname"
-					fi
-			fi
-		)
-	done
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+function crunch {
+    if [ -x "$SCRIPT_DIR/Project-Crunch" ];
+    then
+        "$SCRIPT_DIR/Project-Crunch" "$@"
+    else
+        python3 "$SCRIPT_DIR/../../python/main.py" "$@"
+    fi
 }
 
-
-cams=$(find_cam_names)
+cams=$(crunch find-cameras --paths)
 echo "$cams"
 CAM_ARR=($cams)
 echo "${CAM_ARR[0]}"
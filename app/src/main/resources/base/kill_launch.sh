@@ -1,29 +1,57 @@
 #!/usr/bin/env bash
 # Authors:	Kate Baumli & John Sigmon & Beathan Andersen
 # Date:		November 4, 2018
-# Purpose:	This script kills all launches used in single_node_launch.sh
-#		 	via ros, rviz plugin, and steam vr
+# Purpose:	This script stops everything robot_launch.sh started
 
-STEAM=$(ps -ef | awk '/steam/ {print $2}')
-kill "$STEAM" 2> /dev/null
+# stop_pids PID...
+# SIGTERM first, then SIGKILL for whatever is still running after half a
+# second.
+stop_pids() {
+    [ $# -gt 0 ] || return 0
+    kill -TERM "$@" 2> /dev/null
+    local deadline=$(( $(date +%s%N) + 500000000 ))
+    while [ "$(date +%s%N)" -lt "$deadline" ]; do
+        [ -z "$(ps -o pid=,stat= -p "$(echo "$@" | tr ' ' ,)" | awk '$2 !~ /^Z/')" ] && break
+        sleep 0.01
+    done
+    kill -KILL "$@" 2> /dev/null
+}
 
-OPENCV=$(ps -ef | awk '/opencv/ {print $2}')
-kill "$OPENCV" 2> /dev/null
+# session_current SESSION
+# The recorded session is stale if the file was written before the last
+# boot, or if its leader is now some other program; the id may then belong
+# to an unrelated session.
+session_current() {
+    local boot
+    boot=$(awk '/^btime / {print $2}' /proc/stat)
+    [ "$(stat -c %Y "$SESSION_FILE")" -ge "${boot:-0}" ] || return 1
+    if [ -r "/proc/$1/cmdline" ]; then
+        tr '\0' ' ' < "/proc/$1/cmdline" | grep -q "robot_launch.sh" || return 1
+    fi
+    return 0
+}
 
-ROSCORE=$(ps -ef | awk '/roscore/ {print $2}')
-kill "$ROSCORE" 2> /dev/null
-
-LAUNCHSCRIPT=$(ps -uf | awk '/node_launch.sh/ {print $2}')
-kill -9 "$LAUNCHSCRIPT" 2> /dev/null
-
-ROSLAUNCH=$(ps -uf | awk '/roslaunch/ {print $2}')
-kill -9 "$ROSLAUNCH" 2> /dev/null
-
-RVIZ=$(ps -ef | awk '/rviz/ {print $2}')
-kill -9 "$RVIZ" 2> /dev/null
-
-USB_CAM=$(ps -ef | awk '/usb/ {print $2}')
-kill -9 "$USB_CAM" 2> /dev/null
+# robot_launch.sh runs in a session of its own and records its id, so
+# everything it started, roscore included, is stopped here, and nothing else.
+SESSION_FILE="$HOME/.cache/project-crunch/robot-launch.session"
+if [ -f "$SESSION_FILE" ]; then
+    SESSION=$(cat "$SESSION_FILE")
+    if session_current "$SESSION"; then
+        # roslaunch starts every node in a session of its own, so processes
+        # are found by ancestry as well as by session.
+        PIDS=$(ps -eo pid=,ppid=,sid= | awk -v session="$SESSION" '
+            { parent[$1] = $2; sid[$1] = $3 }
+            END {
+                for (pid in parent)
+                    for (p = pid; p > 1; p = parent[p])
+                        if (sid[p] == session) { print pid; break }
+            }')
+        stop_pids $PIDS
+    else
+        echo "Ignoring stale launch session record $SESSION_FILE"
+    fi
+    rm -f "$SESSION_FILE"
+fi
 
 # Reset network configuration (i.e. replace /etc/hosts, /etc/network/interfaces, 
 # and /etc/hostname with the originals we made backups of in "base_launch.sh")
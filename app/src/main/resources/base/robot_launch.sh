@@ -24,6 +24,30 @@ function valid_ip()
 }
 
 
+#####################################################################
+# Read the Project Crunch configuration
+#####################################################################
+# Written by the installer: catkin paths, hostnames and the ROS network
+# settings. The arguments below override it.
+CONFIG="${CRUNCH_CONFIG:-$HOME/.config/project-crunch/config}"
+# shellcheck disable=SC1090
+[ -f "$CONFIG" ] && source "$CONFIG"
+
+
+#####################################################################
+# Run in a session of our own
+#####################################################################
+# Everything this script starts stays in that session, so kill_launch.sh
+# can stop all of it, and nothing else, by session id.
+SESSION_FILE="$HOME/.cache/project-crunch/robot-launch.session"
+if [ "$(ps -o sid= -p $$ | tr -d ' ')" != "$$" ];
+then
+    exec setsid bash "${BASH_SOURCE[0]}" "$@"
+fi
+mkdir -p "$(dirname "$SESSION_FILE")"
+echo $$ > "$SESSION_FILE"
+
+
 #####################################################################
 # Parse args
 #####################################################################
@@ -43,13 +67,29 @@ case $key in
     shift # past argument
     shift # past value
     ;;
+    -t|--transport)
+    TRANSPORT="$2"
+    shift # past argument
+    shift # past value
+    ;;
+    --base-host)
+    BASE_HOST="$2"
+    shift # past argument
+    shift # past value
+    ;;
+    --capture-mode)
+    CAPTURE_MODE="$2"
+    shift # past argument
+    shift # past value
+    ;;
 esac
 done
 
+CATKIN=${CATKIN:-${ROBOT_CATKIN_PATH%/}}
 if [ -z "${CATKIN}" ];
 then
     echo "ERROR: Must provide path to catkin workspace"
-	echo "Usage: base_launch.sh <-c|--catkin path to catkin workspace> [-l|--logfile logfile] [-b basehostname] [-bip baseip] [-r robohostname] [-rip roboip]"
+	echo "Usage: base_launch.sh <-c|--catkin path to catkin workspace> [-l|--logfile logfile] [-t|--transport ros|udp] [--base-host host] [--capture-mode freshest|queue] [-b basehostname] [-bip baseip] [-r robohostname] [-rip roboip]"
     exit 1
     # TODO: Make sure $CATKIN is a valid directory
 fi
@@ -67,32 +107,35 @@ then
     LOGFILE="log$(timestamp)$MYFILENAME.txt"
 fi
 
+# "ros" streams images as ROS topics over TCP, "udp" uses the
+# loss tolerant UDP frame transport.
+TRANSPORT=${TRANSPORT:-${CRUNCH_TRANSPORT:-ros}}
+# "freshest" always sends the newest camera frame, "queue" sends every
+# frame however far behind it falls.
+CAPTURE_MODE=${CAPTURE_MODE:-${CRUNCH_CAPTURE_MODE:-freshest}}
+# "pinned" or "realtime" give the camera processes cores of their own and a
+# higher priority (see sched_profile.py); "none" leaves scheduling alone.
+SCHED_PROFILE=${SCHED_PROFILE:-${CRUNCH_SCHED_PROFILE:-none}}
+
 # SPHERE_LAUNCH="vive.launch"
-SINGLE_CAM_LAUNCH="single-cam.launch"
-DUAL_CAM_LAUNCH="dual-cam.launch"
-
-#####################################################################
-# Camera parsing function  --- works for Kodaks only
-#####################################################################
-function find_cam_dev_name {
-    # shellcheck disable=SC2044
-    # shellcheck disable=SC2106
-	for sysdevpath in $(find /sys/bus/usb/devices/usb*/ -name dev); do
-		(
-			syspath="${sysdevpath%/dev}"
-			devname="$(udevadm info -q name -p "$syspath")"
-			[[ "$devname" == "bus/"* ]] && continue
-			eval "$(udevadm info -q property --export -p "$syspath")"
-			[[ -z "$ID_SERIAL" ]] && continue
-			if [[ "$devname" == "video"* ]]
-				then
-					if [[ "$ID_SERIAL" == *"KODAK"* ]]
-						then
-							echo "/dev/$devname"
-					fi
-			fi
-		)
-	done
+# Generated for the cameras found, one capture node per camera
+CAMERA_LAUNCH="$HOME/.cache/project-crunch/cameras.launch"
+
+#####################################################################
+# Project Crunch tools
+#####################################################################
+# Runs a command line tool from the launcher. In a release the frozen
+# executable sits next to this script; when running from the repository
+# we fall back to the python sources.
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+if [ -x "$SCRIPT_DIR/Project-Crunch" ];
+then
+    CRUNCH=("$SCRIPT_DIR/Project-Crunch")
+else
+    CRUNCH=(python3 "$SCRIPT_DIR/../../python/main.py")
+fi
+function crunch {
+    "${CRUNCH[@]}" "$@"
 }
 
 
@@ -101,30 +144,45 @@ function find_cam_dev_name {
 #####################################################################
 # shellcheck disable=SC1090
 source "$CATKIN"/devel/setup.bash
-x-terminal-emulator -e roscore
+# Started from here rather than in a terminal window, whose server would run
+# it outside this session, so kill_launch.sh stops this roscore and not one
+# the user runs for something else. Its output goes to the log.
+roscore >> "$LOGFILE" 2>&1 &
 
 #####################################################################
  # Configure and launch cameras
 #####################################################################
-CAMS=$(find_cam_dev_name);
-echo "[INFO: $MYFILENAME $LINENO] Cameras found at $CAMS" >> "$LOGFILE"
+# Scans sysfs once and prints the video device number of each camera
+CAMS=$(crunch find-cameras)
+echo "[INFO: $MYFILENAME $LINENO] Cameras found at video devices $CAMS" >> "$LOGFILE"
 CAM_ARR=($CAMS)
+# More than one camera means the sphere, which wants them all at 1440x1440;
+# a single camera runs at its native size.
+SIZE_ARGS=()
+if [[ ${#CAM_ARR[@]} -gt 1 ]];
+then
+    SIZE_ARGS=(--width 1440 --height 1440)
+fi
 
-# Get the video number of each camera
-i=$((${#CAM_ARR[0]}-1))
-CAM1=${CAM_ARR:$i:1}
-i=$((${#CAM_ARR[1]}-1))
-CAM2=${CAM_ARR[1]:$i:1}
-
-if [[ ${#CAM_ARR[@]} == 1 ]];
+# The camera nodes run under crunch supervise, which restarts them if they
+# crash.
+if [[ "$TRANSPORT" == "udp" && ${#CAM_ARR[@]} -gt 0 ]];
 then
-    roslaunch --wait video_stream_opencv $SINGLE_CAM_LAUNCH video_stream_provider1:="$CAM1" &
-    echo "[INFO: $MYFILENAME $LINENO] One camera launched from ${CAM_ARR[0]}" >> "$LOGFILE"
-elif [[ ${#CAM_ARR[@]} == 2 ]];
+    crunch supervise --name cameras -- "${CRUNCH[@]}" stream-cameras --host "$BASE_HOST" "${SIZE_ARGS[@]}" --capture-mode "$CAPTURE_MODE" "${CAM_ARR[@]}" &
+    echo "[INFO: $MYFILENAME $LINENO] ${#CAM_ARR[@]} cameras streaming over UDP to $BASE_HOST" >> "$LOGFILE"
+elif [[ ${#CAM_ARR[@]} -gt 0 ]];
 then
-    roslaunch --wait video_stream_opencv $DUAL_CAM_LAUNCH video_stream_provider1:="$CAM1" video_stream_provider2:="$CAM2" width:="1440" height:="1440" &
-    echo "[INFO: $MYFILENAME $LINENO] Two cameras launched from ${CAM_ARR[0]} and ${CAM_ARR[1]}" >> "$LOGFILE"
+    crunch camera-launch "${SIZE_ARGS[@]}" --capture-mode "$CAPTURE_MODE" --output "$CAMERA_LAUNCH" "${CAM_ARR[@]}"
+    crunch supervise --name cameras -- roslaunch --wait "$CAMERA_LAUNCH" &
+    echo "[INFO: $MYFILENAME $LINENO] ${#CAM_ARR[@]} cameras launched from ${CAM_ARR[*]}" >> "$LOGFILE"
 else
     echo "[INFO: $MYFILENAME $LINENO] No cameras launched. Devices found at: $CAMS" >> "$LOGFILE"
 fi
 
+# Keeps applying the profile, so respawned camera nodes get it too
+if [[ "$SCHED_PROFILE" != "none" ]];
+then
+    crunch sched-profile --profile "$SCHED_PROFILE" --watch >> "$LOGFILE" 2>&1 &
+    echo "[INFO: $MYFILENAME $LINENO] Scheduling profile $SCHED_PROFILE applied" >> "$LOGFILE"
+fi
+
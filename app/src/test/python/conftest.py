@@ -0,0 +1,40 @@
+"""
+Shared fixtures for the app's tests.
+
+The app's modules import each other by name from app/src/main/python, as
+they do when fbs runs them, so that directory goes on the path here.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "main", "python"))
+
+
+@pytest.fixture
+def xvfb():
+    '''Name of a display served by a fresh Xvfb, with RandR, for the test'''
+    pytest.importorskip("Xlib")
+    if shutil.which("Xvfb") is None:
+        pytest.skip("Xvfb is not installed")
+    for number in range(90, 110):
+        if not os.path.exists("/tmp/.X11-unix/X{}".format(number)):
+            break
+    name = ":{}".format(number)
+    server = subprocess.Popen(["Xvfb", name, "-screen", "0", "4320x1200x24",
+                               "+extension", "RANDR", "-nolisten", "tcp"],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        end = time.monotonic() + 10
+        while not os.path.exists("/tmp/.X11-unix/X{}".format(number)):
+            if server.poll() is not None or time.monotonic() > end:
+                pytest.skip("Xvfb did not start")
+            time.sleep(0.05)
+        yield name
+    finally:
+        server.terminate()
+        server.wait()
@@ -0,0 +1,101 @@
+import threading
+import time
+
+from adaptive_rate import DEFAULT_LADDER, LinkMonitor, RateController
+from frame_transport import FrameReceiver, FrameSender, encode_frame
+from link_emulator import UdpLinkEmulator
+
+# Frame bytes per pixel, small enough for the test to run at full frame rate
+BYTES_PER_PIXEL = 0.005
+# Seconds per link sample
+INTERVAL = 0.2
+
+
+def _frame_size(rung):
+    return int(rung.width * rung.height * BYTES_PER_PIXEL)
+
+
+def _wire_rate(rung):
+    '''Bytes/s a rung puts on the link, datagram headers and parity included'''
+    size = _frame_size(rung)
+    return sum(len(packet) for packet in encode_frame(1, 0, b"x" * size)) * rung.fps
+
+
+def _capacity(index):
+    '''A link bandwidth rung index fits on, and the rung above it does not'''
+    return (_wire_rate(DEFAULT_LADDER[index]) + _wire_rate(DEFAULT_LADDER[index - 1])) / 2
+
+
+class _Loop(object):
+    """
+    Sender -> bandwidth capped link -> receiver, with the controller setting
+    the rung the sender streams at.
+    """
+
+    def __init__(self, bandwidth, controller):
+        self.controller = controller
+        self.monitor = LinkMonitor()
+        self.receiver = FrameReceiver(0, lambda stream, frame_id, data: None,
+                                      host="127.0.0.1", observers=[self.monitor])
+        self.link = UdpLinkEmulator(0, self.receiver.sock.getsockname(),
+                                    bandwidth=bandwidth, seed=1)
+        self.sender = FrameSender("127.0.0.1", self.link.sock.getsockname()[1])
+        self.history = []
+        self._running = True
+        self._threads = [self.receiver.start(), self.link.start(),
+                         threading.Thread(target=self._send, daemon=True)]
+        self._threads[-1].start()
+
+    def _send(self):
+        next_frame = time.monotonic()
+        while self._running:
+            rung = self.controller.rung
+            self.sender.send(b"x" * _frame_size(rung))
+            next_frame = max(next_frame + 1.0 / rung.fps, time.monotonic() - 0.1)
+            time.sleep(max(0.0, next_frame - time.monotonic()))
+
+    def run(self, seconds):
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            time.sleep(INTERVAL)
+            self.controller.update(self.monitor.sample())
+            self.history.append(self.controller.index)
+
+    def stop(self):
+        self._running = False
+        self._threads[-1].join()
+        self.sender.close()
+        self.link.stop()
+        self.receiver.stop()
+        for thread in self._threads[:-1]:
+            thread.join()
+
+
+def _settled_on(history, index):
+    '''
+    True if, once the controller got to index, it never fell below it, only
+    probed the rung above, and spent most of the time on it
+    '''
+    after = history[history.index(index):]
+    return (max(after) == index and min(after) >= index - 1
+            and after.count(index) >= len(after) / 2)
+
+
+def test_settles_on_the_highest_rung_that_fits_and_steps_down_with_the_link():
+    controller = RateController(start=len(DEFAULT_LADDER) - 1, down_after=2, up_after=3)
+    loop = _Loop(_capacity(3), controller)
+    try:
+        # Up from the lowest rung, probing the one above now and then.
+        loop.run(8)
+        assert loop.history.index(3) * INTERVAL < 4
+        assert _settled_on(loop.history, 3)
+
+        loop.link.bandwidth = _capacity(5)
+        start = len(loop.history)
+        loop.run(6)
+        after = loop.history[start:]
+        # Two rungs down, without overshooting while the queue drains.
+        assert after.index(5) * INTERVAL < 3
+        assert _settled_on(after, 5)
+    finally:
+        loop.stop()
@@ -0,0 +1,56 @@
+import time
+
+import camera_stream
+from frame_sync import FRONT, REAR
+from frame_transport import FrameReceiver, encode_frame
+
+WAIT = 0.05
+
+
+class _Clock(object):
+    offset = 0.0
+
+    def __init__(self, receiver, control_port):
+        pass
+
+    def start(self):
+        pass
+
+
+def test_display_latency_includes_the_wait_for_a_partner(monkeypatch, tmp_path):
+    recorders = []
+
+    class Recorder(camera_stream.LatencyRecorder):
+        def __init__(self, *args, **kwargs):
+            super(Recorder, self).__init__(*args, **kwargs)
+            self.displayed = []
+            recorders.append(self)
+
+        def delivered(self, stream, nbytes, stamps):
+            super(Recorder, self).delivered(stream, nbytes, stamps)
+            self.displayed.append((stream, stamps.displayed - stamps.received))
+
+    def run(receiver):
+        now = time.time()
+        # A rear frame first, so the front one has a partner to wait for.
+        for stream, frame_id, captured in ((REAR, 1, now - 1), (FRONT, 1, now),
+                                           (REAR, 2, now)):
+            for packet in encode_frame(frame_id, stream, b"x" * 3000, captured=captured,
+                                       sent=captured):
+                receiver.handle(packet)
+            time.sleep(WAIT)
+        receiver.sock.close()
+
+    monkeypatch.setattr(camera_stream, "LatencyRecorder", Recorder)
+    monkeypatch.setattr(camera_stream, "ClockSync", _Clock)
+    monkeypatch.setattr(camera_stream, "set_name", lambda name: None)
+    monkeypatch.setattr(FrameReceiver, "run", run)
+    published = []
+    camera_stream.receive_cameras(port=0, sink=lambda *frame: published.append(frame[:2]),
+                                  adaptive=False, latency_file=str(tmp_path / "latency.bin"),
+                                  stats_file=str(tmp_path / "stats.json"))
+    assert published == [(REAR, 1), (FRONT, 1), (REAR, 2)]
+    # The front frame was held until its rear partner arrived.
+    _, (front, front_display), (rear, rear_display) = recorders[0].displayed
+    assert (front, rear) == (FRONT, REAR)
+    assert front_display >= WAIT > rear_display
@@ -0,0 +1,114 @@
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pytest
+
+import frame_share
+from frame_share import SharedFrameReader, SharedFrameRing
+
+
+@pytest.fixture(autouse=True)
+def share_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(frame_share, "SHARE_DIR", str(tmp_path))
+
+
+def _image(value, shape=(4, 6, 3)):
+    return np.full(shape, value, dtype=np.uint8)
+
+
+def _attach_and_die(name):
+    reader = SharedFrameReader(name)
+    reader.get(timeout=0)
+    os._exit(0)
+
+
+def test_readers_counts_live_readers_only():
+    ring = SharedFrameRing("test", max_readers=2)
+    assert ring.readers() == 0
+    ring.put(_image(1), 1.0)
+    assert ring.readers() == 0
+
+    reader = SharedFrameReader("test")
+    assert reader.get(timeout=0) is None
+    assert ring.readers() == 1
+
+    # A reader whose process died without closing is not counted, and its
+    # entry goes to the next reader.
+    child = multiprocessing.get_context("fork").Process(target=_attach_and_die, args=("test",))
+    child.start()
+    child.join()
+    assert ring.readers() == 1
+    other = SharedFrameReader("test")
+    assert other.get(timeout=0) is None
+    assert ring.readers() == 2
+
+    reader.close()
+    other.close()
+    assert ring.readers() == 0
+    ring.close()
+
+
+def test_reader_gets_only_frames_put_after_it_attached():
+    ring = SharedFrameRing("test")
+    ring.put(_image(1), 1.0)
+    ring.put(_image(2), 2.0)
+    reader = SharedFrameReader("test")
+    assert reader.get(timeout=0) is None
+
+    ring.put(_image(3), 3.0)
+    frame = reader.get(timeout=0)
+    assert frame.captured == 3.0 and (frame.image == 3).all()
+    assert reader.valid(frame)
+    ring.put(_image(4), 4.0)
+    ring.put(_image(5), 5.0)
+    frame = reader.get(timeout=0)
+    assert frame.captured == 5.0
+    assert reader.stats == {"taken": 2, "missed": 1}
+    del frame
+    reader.close()
+    ring.close()
+
+
+def test_reader_follows_a_ring_made_again():
+    ring = SharedFrameRing("test")
+    ring.put(_image(1), 1.0)
+    reader = SharedFrameReader("test")
+    assert reader.get(timeout=0) is None
+
+    # A new shape makes the ring again; its first frame is not skipped.
+    ring.put(_image(2, shape=(8, 6, 3)), 2.0)
+    frame = reader.get(timeout=0.1)
+    assert frame.captured == 2.0 and frame.image.shape == (8, 6, 3)
+    del frame
+    reader.close()
+    ring.close()
+
+
+def test_sharer_only_decodes_while_a_reader_is_attached():
+    cv2 = pytest.importorskip("cv2")
+    from frame_share import FrameSharer
+
+    jpeg = cv2.imencode(".jpg", _image(128))[1].tobytes()
+    sharer = FrameSharer()
+    reader = SharedFrameReader("camera1")
+
+    def share(frame_id):
+        sharer(0, frame_id, jpeg)
+        deadline = time.monotonic() + 2
+        while sum(sharer.stats.values()) < frame_id and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+    # The first frame makes the ring, so that readers can attach.
+    share(1)
+    share(2)
+    assert sharer.stats == {"shared": 1, "skipped": 1}
+    assert reader.get(timeout=0) is None
+    share(3)
+    assert sharer.stats == {"shared": 2, "skipped": 1}
+    assert reader.get(timeout=0).image.shape == (4, 6, 3)
+    reader.close()
+    share(4)
+    assert sharer.stats == {"shared": 2, "skipped": 2}
+    sharer.close()
@@ -0,0 +1,77 @@
+from frame_sync import FRONT, REAR, STALE_PARTNER, FrameSynchronizer
+
+
+class _Sync(object):
+    '''A synchronizer on a clock the test sets, recording what it passes on'''
+
+    def __init__(self, **kwargs):
+        self.now = 0.0
+        self.out = []
+        self.sync = FrameSynchronizer(lambda stream, frame_id, data, captured:
+                                      self.out.append((stream, frame_id)),
+                                      clock=lambda: self.now, **kwargs)
+
+    def push(self, stream, frame_id, captured, arrived=None):
+        self.now = captured + 0.01 if arrived is None else arrived
+        self.sync.push(stream, frame_id, None, captured)
+        out, self.out = self.out, []
+        return out
+
+
+def _started(**kwargs):
+    '''A synchronizer that has had one frame of each stream'''
+    sync = _Sync(**kwargs)
+    assert sync.push(FRONT, 0, 0.0) == [(FRONT, 0)]
+    assert sync.push(REAR, 0, 0.001) == []
+    return sync
+
+
+def test_pairs_frames_captured_within_the_tolerance():
+    sync = _started(tolerance=0.005)
+    # The rear frame already buffered is too old for this one.
+    assert sync.push(FRONT, 1, 0.033) == []
+    assert sync.push(REAR, 1, 0.035) == [(FRONT, 1), (REAR, 1)]
+    # The front frame comes second; the front is still passed on first.
+    assert sync.push(REAR, 2, 0.067) == []
+    assert sync.push(FRONT, 2, 0.066) == [(FRONT, 2), (REAR, 2)]
+    assert sync.sync.stats == {"paired": 2, "dropped": 1, "unpaired": 1}
+    assert sync.sync.waited.total == 2
+
+
+def test_drops_frames_that_can_no_longer_be_paired():
+    sync = _started(tolerance=0.005)
+    assert sync.sync.stats["dropped"] == 0
+    # Front frames with no rear partner fill the buffer; the oldest goes.
+    for frame_id in range(1, 6):
+        assert sync.push(FRONT, frame_id, frame_id * 0.033) == []
+    assert sync.sync.stats["dropped"] == 1 + 2
+    # A rear frame pairs with the closest front frame; older front frames
+    # are dropped.
+    assert sync.push(REAR, 1, 4 * 0.033 + 0.002) == [(FRONT, 4), (REAR, 1)]
+    assert sync.sync.stats == {"paired": 1, "dropped": 3 + 1, "unpaired": 1}
+    # The front frame left over is newer than the pair and still waits.
+    assert sync.push(REAR, 2, 5 * 0.033 + 0.001) == [(FRONT, 5), (REAR, 2)]
+
+
+def test_passes_frames_on_alone_when_the_partner_stops():
+    sync = _Sync(tolerance=0.005)
+    assert sync.push(FRONT, 0, 0.0) == [(FRONT, 0)]
+    # A rear frame captured ahead of the front ones waits for its partner.
+    assert sync.push(REAR, 0, 0.05) == []
+    assert sync.push(FRONT, 1, 0.01) == []
+    assert sync.push(FRONT, 2, 0.02) == []
+    # Nothing from the rear for longer than STALE_PARTNER: what was buffered
+    # goes on alone, oldest first, then the new frame.
+    assert sync.push(FRONT, 3, 0.03, arrived=0.06 + STALE_PARTNER + 0.1) == \
+        [(REAR, 0), (FRONT, 1), (FRONT, 2), (FRONT, 3)]
+    assert sync.sync.stats == {"paired": 0, "dropped": 0, "unpaired": 5}
+    # Once the rear is back, pairing starts again.
+    later = STALE_PARTNER + 0.2
+    assert sync.push(REAR, 1, later) == []
+    assert sync.push(FRONT, 4, later + 0.001) == [(FRONT, 4), (REAR, 1)]
+
+
+def test_passes_other_streams_straight_on():
+    sync = _Sync()
+    assert sync.push(2, 0, 0.0) == [(2, 0)]
+    assert sync.sync.stats == {"paired": 0, "dropped": 0, "unpaired": 0}
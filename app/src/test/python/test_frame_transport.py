@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+from frame_transport import RESTART_GAP, FrameReceiver, FrameSender, encode_frame
+
+ROBOT = ("10.0.0.2", 40000)
+RESPAWNED = ("10.0.0.2", 40001)
+
+
+@pytest.fixture
+def receiver():
+    delivered = []
+    receiver = FrameReceiver(0, lambda stream, frame_id, data: delivered.append(
+        (stream, frame_id, data)), host="127.0.0.1")
+    receiver.delivered = delivered
+    yield receiver
+    receiver.sock.close()
+
+
+def _send(receiver, frame_ids, peer=ROBOT, stream=0, drop=()):
+    for frame_id in frame_ids:
+        data = "frame {}".format(frame_id).encode() * 500
+        for index, packet in enumerate(encode_frame(frame_id, stream, data)):
+            if index not in drop:
+                receiver.handle(packet, peer)
+
+
+def test_frames_roundtrip_with_a_lost_datagram(receiver):
+    _send(receiver, [1], drop={2})
+    assert receiver.delivered == [(0, 1, b"frame 1" * 500)]
+
+
+def test_late_frames_are_dropped(receiver):
+    _send(receiver, range(1, 11))
+    _send(receiver, [8, 10])
+    assert [frame_id for _, frame_id, _ in receiver.delivered] == list(range(1, 11))
+
+
+def test_sender_restart_from_the_same_address(receiver):
+    # The ids start over, e.g. a replay through the same port.
+    _send(receiver, range(1, 1001))
+    _send(receiver, range(1, 500))
+    assert len(receiver.delivered) == 1000 + 499
+    assert receiver.delivered[-1][1] == 499
+    assert receiver.stats["restarts"] == 1
+
+
+def test_sender_restart_from_a_new_address(receiver):
+    # Restarted soon after starting, its ids are not far enough behind to
+    # tell by them alone.
+    _send(receiver, range(1, RESTART_GAP // 2))
+    _send(receiver, range(1, 6), peer=RESPAWNED)
+    assert [frame_id for _, frame_id, _ in receiver.delivered][-5:] == [1, 2, 3, 4, 5]
+    assert receiver.stats["restarts"] == 1
+
+
+def test_restart_only_affects_its_stream(receiver):
+    _send(receiver, range(1, 201), stream=0)
+    _send(receiver, range(1, 201), stream=1, peer=RESPAWNED)
+    # A datagram of stream 0 left over from the old sender, then the new one.
+    _send(receiver, [201], stream=0, drop={1, 2, 3, 4})
+    _send(receiver, range(1, 4), stream=0)
+    stream1 = [frame_id for stream, frame_id, _ in receiver.delivered if stream == 1]
+    assert stream1 == list(range(1, 201))
+    assert receiver.delivered[-1][:2] == (0, 3)
+    # The old sender's unfinished frame was given up on.
+    assert receiver.stats["dropped"] == 1
+
+
+def test_respawned_sender_over_udp():
+    delivered = []
+    receiver = FrameReceiver(0, lambda stream, frame_id, data: delivered.append(frame_id),
+                             host="127.0.0.1")
+    port = receiver.sock.getsockname()[1]
+    thread = receiver.start()
+    try:
+        for _ in range(2):
+            sender = FrameSender("127.0.0.1", port)
+            for _ in range(100):
+                sender.send(b"x" * 3000)
+                time.sleep(0.001)
+            sender.close()
+        end = time.monotonic() + 5
+        while len(delivered) < 200 and time.monotonic() < end:
+            time.sleep(0.01)
+    finally:
+        receiver.stop()
+        thread.join()
+    assert delivered == list(range(1, 101)) * 2
@@ -0,0 +1,102 @@
+import os
+import signal
+import time
+
+import pytest
+
+import supervisor
+from supervisor import BACKOFF_FIRST, EXITED, KILLED, TERMINATED, Supervisor
+
+# Seconds a respawn may take on top of its backoff
+RESPAWN_SLACK = 0.1
+
+
+def _wait_for(condition, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.001)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # A zombie is as good as gone; its parent just has not reaped it.
+    with open("/proc/{}/stat".format(pid)) as f:
+        return f.read().rpartition(")")[2].split()[0] != "Z"
+
+
+def _grandchild(tmp_path, name):
+    pidfile = tmp_path / name
+    _wait_for(lambda: pidfile.exists() and pidfile.read_text().strip())
+    return int(pidfile.read_text())
+
+
+@pytest.fixture
+def lines():
+    return []
+
+
+@pytest.fixture
+def supervised(lines):
+    each = Supervisor(output=lines.append)
+    yield each
+    each.stop()
+
+
+def test_crashed_child_is_respawned_within_the_backoff(supervised):
+    process = supervised.spawn("crasher", ["sh", "-c", "sleep 0.05; exit 1"], respawn=True)
+    _wait_for(lambda: process.restarts >= 1)
+    assert process.delay == BACKOFF_FIRST
+    assert process.respawned_in < BACKOFF_FIRST + RESPAWN_SLACK
+    # It keeps crashing, so the backoff doubles.
+    _wait_for(lambda: process.restarts >= 2)
+    assert process.delay == 2 * BACKOFF_FIRST
+    assert process.respawned_in < 2 * BACKOFF_FIRST + RESPAWN_SLACK
+
+
+def test_clean_exit_is_not_respawned(supervised):
+    process = supervised.spawn("done", ["sh", "-c", "exit 0"], respawn=True)
+    process.join(5)
+    assert process.restarts == 0
+
+
+def test_stop_tears_down_the_whole_group_in_under_a_second(supervised, tmp_path):
+    supervised.spawn("polite", ["sh", "-c", "sleep 60 & echo $! > {}/polite; wait".format(
+            tmp_path)])
+    # A shell that ignores SIGTERM, with a child in a session of its own.
+    supervised.spawn("stubborn", ["sh", "-c",
+                                  "trap '' TERM; setsid sleep 60 & echo $! > {}/stubborn; "
+                                  "while :; do wait; done".format(tmp_path)])
+    grandchildren = [_grandchild(tmp_path, name) for name in ("polite", "stubborn")]
+    start = time.monotonic()
+    result = supervised.stop()
+    assert time.monotonic() - start < 1.0
+    assert result == {"polite": TERMINATED, "stubborn": KILLED}
+    assert not any(_alive(pid) for pid in grandchildren)
+
+
+def test_child_that_cannot_be_restarted_is_marked_failed(supervised, lines, tmp_path):
+    script = tmp_path / "once.sh"
+    script.write_text("#!/bin/sh\nrm -f \"$0\"\nexit 1\n")
+    script.chmod(0o755)
+    process = supervised.spawn("once", [str(script)], respawn=True)
+    process.join(5)
+    assert isinstance(process.failed, FileNotFoundError)
+    assert "once could not be restarted" in lines[-1]
+    assert supervised.stop() == {"once": EXITED}
+
+
+def test_supervise_returns_once_its_command_cannot_be_restarted(tmp_path):
+    script = tmp_path / "once.sh"
+    script.write_text("#!/bin/sh\nrm -f \"$0\"\nexit 1\n")
+    script.chmod(0o755)
+    handlers = {sig: signal.getsignal(sig)
+                for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP)}
+    try:
+        assert supervisor.supervise([str(script)]) == 1
+    finally:
+        for sig, handler in handlers.items():
+            signal.signal(sig, handler)
@@ -0,0 +1,129 @@
+import os
+
+import pytest
+
+from vive_monitor import HeadsetMonitor, edid_vendor
+
+VIVE = "PRODUCT=bb4/2c87/100"
+
+
+def _edid(vendor):
+    code = 0
+    for letter in vendor:
+        code = (code << 5) | (ord(letter) - ord("A") + 1)
+    return bytes(8) + bytes([code >> 8, code & 0xff]) + bytes(118)
+
+
+@pytest.fixture
+def sysfs(tmp_path):
+    (tmp_path / "class" / "drm").mkdir(parents=True)
+    return tmp_path
+
+
+def _connect(sysfs, connector, vendor="HVR"):
+    path = sysfs / "class" / "drm" / connector
+    path.mkdir(exist_ok=True)
+    (path / "status").write_text("connected\n")
+    (path / "edid").write_bytes(_edid(vendor))
+
+
+def _disconnect(sysfs, connector):
+    (sysfs / "class" / "drm" / connector / "status").write_text("disconnected\n")
+
+
+def _usb(action, port, product=VIVE, devtype="usb_device"):
+    event = {
+        "ACTION": action,
+        "SUBSYSTEM": "usb",
+        "DEVTYPE": devtype,
+        "DEVPATH": "/devices/pci0000:00/usb1/{}".format(port),
+        "BUSNUM": "001",
+        "DEVNUM": "00{}".format(port[-1]),
+    }
+    if product is not None:
+        event["PRODUCT"] = product.partition("=")[2]
+    return event
+
+
+def _drm():
+    return {"ACTION": "change", "SUBSYSTEM": "drm",
+            "DEVPATH": "/devices/pci0000:00/0000:00:02.0/drm/card0"}
+
+
+def _ports(monitor):
+    return [os.path.basename(headset.devpath) for headset in monitor.headsets()]
+
+
+def test_edid_vendor():
+    assert edid_vendor(_edid("HVR")) == "HVR"
+    assert edid_vendor(b"short") is None
+
+
+def test_plug_and_unplug_in_order(sysfs):
+    monitor = HeadsetMonitor(sysfs_root=str(sysfs))
+    monitor.handle_uevent(_usb("add", "1-1"))
+    # The hub's interfaces and other devices come with it and are ignored.
+    monitor.handle_uevent(_usb("add", "1-1", devtype="usb_interface"))
+    monitor.handle_uevent(_usb("add", "1-2", product="PRODUCT=46d/825/10"))
+    monitor.handle_uevent(_usb("add", "1-3"))
+    assert _ports(monitor) == ["1-1", "1-3"]
+    assert os.path.basename(monitor.latest().devpath) == "1-3"
+
+    monitor.handle_uevent(_usb("remove", "1-1", product=None))
+    assert _ports(monitor) == ["1-3"]
+
+    # Plugged back in, it is the newest headset.
+    monitor.handle_uevent(_usb("add", "1-1"))
+    assert _ports(monitor) == ["1-3", "1-1"]
+    assert os.path.basename(monitor.latest().devpath) == "1-1"
+    assert os.path.basename(monitor.latest(exclude={monitor.latest().devpath}).devpath) == "1-3"
+
+    monitor.handle_uevent(_usb("remove", "1-3", product=None))
+    monitor.handle_uevent(_usb("remove", "1-1", product=None))
+    assert monitor.headsets() == []
+    assert monitor.latest() is None
+
+
+def test_connectors_follow_panels(sysfs):
+    monitor = HeadsetMonitor(sysfs_root=str(sysfs))
+    _connect(sysfs, "card0-eDP-1", vendor="LGD")
+    monitor.handle_uevent(_usb("add", "1-1"))
+    assert monitor.headsets()[0].connector is None
+
+    # The panel shows up a moment after the USB device.
+    _connect(sysfs, "card0-HDMI-A-1")
+    monitor.handle_uevent(_drm())
+    assert monitor.headsets()[0].connector == "card0-HDMI-A-1"
+
+    monitor.handle_uevent(_usb("add", "1-2"))
+    _connect(sysfs, "card0-DP-1")
+    monitor.handle_uevent(_drm())
+    assert [h.connector for h in monitor.headsets()] == ["card0-HDMI-A-1", "card0-DP-1"]
+
+    # Unplugging the first frees its connector; the second keeps its own.
+    _disconnect(sysfs, "card0-HDMI-A-1")
+    monitor.handle_uevent(_usb("remove", "1-1", product=None))
+    monitor.handle_uevent(_drm())
+    assert [h.connector for h in monitor.headsets()] == ["card0-DP-1"]
+
+
+def test_scan_finds_headsets_already_plugged_in(sysfs):
+    devices = sysfs / "bus" / "usb" / "devices"
+    devices.mkdir(parents=True)
+    for port, ids in (("1-1", ("0bb4", "2c87")), ("1-2", ("046d", "0825"))):
+        device = sysfs / "devices" / "pci0000:00" / "usb1" / port
+        device.mkdir(parents=True)
+        (device / "idVendor").write_text(ids[0] + "\n")
+        (device / "idProduct").write_text(ids[1] + "\n")
+        (devices / port).symlink_to(device)
+    _connect(sysfs, "card0-HDMI-A-1")
+
+    monitor = HeadsetMonitor(sysfs_root=str(sysfs))
+    monitor.scan()
+    headsets = monitor.headsets()
+    assert [h.devpath for h in headsets] == ["/devices/pci0000:00/usb1/1-1"]
+    assert headsets[0].connector == "card0-HDMI-A-1"
+
+    # The uevent for a headset that was found by the scan does not add it twice.
+    monitor.handle_uevent(_usb("add", "1-1"))
+    assert _ports(monitor) == ["1-1"]
@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+Xlib = pytest.importorskip("Xlib")
+from Xlib import display  # noqa: E402
+
+from window_watcher import HMDWindowWatcher  # noqa: E402
+
+TARGETS = {
+    "HMD1": (0, 0, 2160, 1200),
+    "HMD2": (2160, 0, 2160, 1200),
+}
+
+
+def _window(disp, title=None):
+    root = disp.screen().root
+    window = root.create_window(10, 10, 320, 240, 0, disp.screen().root_depth)
+    if title is not None:
+        window.set_wm_name(title)
+    window.map()
+    disp.sync()
+    return window
+
+
+def _geometry(disp, window_id):
+    geometry = disp.create_resource_object("window", window_id).get_geometry()
+    return geometry.x, geometry.y, geometry.width, geometry.height
+
+
+def test_places_existing_and_later_windows(xvfb):
+    disp = display.Display(xvfb)
+    try:
+        # HMD1 is already there when the watcher starts; HMD2 is opened
+        # later and only gets its title after it is mapped, as rviz does.
+        _window(disp, "HMD1")
+        _window(disp, "rviz")
+
+        def open_later():
+            other = display.Display(xvfb)
+            time.sleep(0.3)
+            window = _window(other)
+            time.sleep(0.1)
+            window.set_wm_name("HMD2")
+            other.sync()
+            # Keep the window until the watcher is done with it.
+            placed_event.wait(10)
+            other.close()
+
+        placed_event = threading.Event()
+
+        opener = threading.Thread(target=open_later)
+        opener.start()
+        start = time.monotonic()
+        placed = HMDWindowWatcher(TARGETS, deadline=10, display_name=xvfb).run()
+        elapsed = time.monotonic() - start
+        placed_event.set()
+        opener.join()
+
+        assert sorted(placed) == ["HMD1", "HMD2"]
+        assert elapsed < 5
+        assert _geometry(disp, placed["HMD1"]) == TARGETS["HMD1"]
+    finally:
+        disp.close()
+
+
+def test_gives_up_at_deadline(xvfb):
+    disp = display.Display(xvfb)
+    try:
+        _window(disp, "HMD1")
+        start = time.monotonic()
+        placed = HMDWindowWatcher(TARGETS, deadline=0.5, display_name=xvfb).run()
+        assert list(placed) == ["HMD1"]
+        assert 0.5 <= time.monotonic() - start < 3
+    finally:
+        disp.close()
+
@@ -0,0 +1,56 @@
+#!/usr/bin/env bash
+
+# Times a robot install from an offline bundle, in a container with no
+# network at all, against the same install over the network. Both start
+# from the same clean Ubuntu 16.04 image and run the installer's steps
+# without the GUI (installer/src/main/python/install_steps.py). Steps that
+# need real hardware or a kernel the container does not have (udev, ufw,
+# the nvidia driver) may fail in both runs; the per step timings are
+# printed so they can be compared step by step.
+#
+# Needs docker. Build the bundle first, e.g. with
+# bash release.sh --version X --offline
+
+if [ $# -lt 1 ];
+then
+    echo "Usage:"
+    echo "\tbash bench_install.sh <bundle directory>"
+    exit 1
+fi
+
+BUNDLE=$(realpath "$1")
+REPO=$(cd "$(dirname "$0")" && pwd)
+IMAGE=project-crunch-install-bench
+
+# What a fresh desktop install has and the installer expects to be there
+docker build -t $IMAGE - <<'EOF' || exit 1
+FROM ubuntu:16.04
+RUN apt-get update \
+    && apt-get install -y --no-install-recommends python3 sudo lsb-release \
+       software-properties-common dirmngr gnupg ubuntu-drivers-common udev ufw \
+    && rm -rf /var/lib/apt/lists/*
+EOF
+
+# run_install NAME [docker options] -- [installer options]
+run_install() {
+    local name="$1"
+    shift
+    local docker_opts=()
+    while [ "$1" != "--" ];
+    do
+        docker_opts+=("$1")
+        shift
+    done
+    shift
+    echo "== $name"
+    local start=$(date +%s.%N)
+    docker run --rm "${docker_opts[@]}" -v "$REPO":/src:ro $IMAGE \
+        python3 /src/installer/src/main/python/install_steps.py \
+        --catkin /root/catkin_ws --install /root --robot "$@" \
+        | sed -n '/^$/,$p'
+    local end=$(date +%s.%N)
+    echo "$name: $(echo "$end - $start" | bc) seconds in total"
+}
+
+run_install "network" --
+run_install "offline bundle" --network none -v "$BUNDLE":/bundle:ro -- --bundle /bundle
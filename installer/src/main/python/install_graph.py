@@ -0,0 +1,391 @@
+"""
+Dependency graph install engine.
+
+The install is a set of steps, each naming the steps it needs first. A step
+starts as soon as everything it depends on has finished, so apt, the git
+clones and the builds overlap instead of running one after another. If a
+step fails, every step that depends on it is skipped, and the rest of the
+graph carries on.
+
+Commands are run through a runner: CommandRunner runs them for real,
+feeding the sudo password where needed and passing their output on a line
+at a time, and StubRunner only records them.
+Pass a StubRunner to check what an install would do, and in what order,
+without touching the machine.
+
+Given an InstallManifest, the graph also remembers what it has done. Each
+step that finishes is recorded with a fingerprint of its inputs (its
+commands, or whatever it declares as inputs, plus the fingerprints of the
+steps it depends on) and checksums of the files it produces. On the next
+run, a step whose fingerprint and outputs still match is skipped without
+running anything, so a re-run only does the steps that failed, never ran,
+or are stale because something they depend on changed.
+"""
+import concurrent.futures
+import hashlib
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+# Step states passed to the progress callback
+STARTED = "started"
+DONE = "done"
+FAILED = "failed"
+# Already done, so not run
+SKIPPED = "skipped"
+# Not run because a step it depends on failed
+BLOCKED = "blocked"
+# Stopped, or never started, because the install was cancelled
+CANCELLED = "cancelled"
+
+STATE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "project-crunch",
+                          "install-state.json")
+# Bumped when the manifest layout changes; older manifests are ignored.
+STATE_VERSION = 1
+
+
+class InstallError(Exception):
+    pass
+
+
+class Step(object):
+    """
+    One unit of the install. commands is a list of argv lists run in order;
+    a command may also be a callable, which is called with the runner.
+    With sudo, every argv command runs as root. If done is given and
+    returns True before the step starts, the step is skipped as already
+    done.
+
+    inputs is anything json can write that describes what the step does;
+    it defaults to the argv commands, so steps made of callables, or whose
+    commands carry a password, should give it. outputs are paths the step
+    produces, checked on every run. With record=False the step is never
+    remembered and always runs.
+    """
+
+    def __init__(self, name, commands, depends=(), sudo=False, cwd=None, done=None,
+                 inputs=None, outputs=(), record=True):
+        self.name = name
+        self.commands = list(commands)
+        self.depends = tuple(depends)
+        self.sudo = sudo
+        self.cwd = cwd
+        self.done = done
+        self.inputs = inputs
+        self.outputs = tuple(outputs)
+        self.record = record
+
+    def own_inputs(self):
+        if self.inputs is not None:
+            return self.inputs
+        return [command for command in self.commands if not callable(command)]
+
+
+def file_digest(path):
+    '''
+    sha1 of the file at path, "dir" for a directory, or None if there is
+    nothing there
+    '''
+    if os.path.isdir(path):
+        return "dir"
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class InstallManifest(object):
+    """
+    The record of finished steps, kept as json at path. Every change is
+    written straight away (to a temporary file, then renamed over the old
+    one), so an install that is interrupted or fails part way resumes from
+    where it stopped.
+    """
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.steps = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                state = json.load(f)
+            if state.get("version") == STATE_VERSION:
+                self.steps = state["steps"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def satisfied(self, step, fingerprint):
+        '''
+        True if step was finished with fingerprint and its outputs are still
+        there and unchanged
+        '''
+        entry = self.steps.get(step.name)
+        if entry is None or entry["fingerprint"] != fingerprint:
+            return False
+        # An output that was missing when the step finished does not show
+        # the step's work is in place.
+        return all(digest is not None and file_digest(path) == digest
+                   for path, digest in entry["outputs"].items())
+
+    def record(self, step, fingerprint):
+        with self._lock:
+            self.steps[step.name] = {
+                "fingerprint": fingerprint,
+                "outputs": {path: file_digest(path) for path in step.outputs},
+                "finished": time.time(),
+            }
+            self._write()
+
+    def forget(self, name):
+        with self._lock:
+            if self.steps.pop(name, None) is not None:
+                self._write()
+
+    def _write(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp = self.path + ".tmp"
+        with open(temp, "w") as f:
+            json.dump({"version": STATE_VERSION, "steps": self.steps}, f,
+                      indent=1, sort_keys=True)
+        os.replace(temp, self.path)
+
+
+class CommandRunner(object):
+    """
+    Runs step commands with subprocess. Every line a command prints, on
+    stdout or stderr, is passed to output (by default written to the
+    installer's own stdout) as it arrives. password, if given, is passed to
+    sudo on stdin. Run as root, commands are run directly, without sudo.
+
+    cancel() stops the commands that are running and makes any later run()
+    fail straight away.
+    """
+
+    def __init__(self, password=None, output=None):
+        self.password = password
+        self.output = output or sys.stdout.write
+        self._processes = set()
+        self._cancelled = False
+        self._lock = threading.Lock()
+
+    def run(self, argv, sudo=False, cwd=None):
+        sudo = sudo and os.geteuid() != 0
+        if sudo:
+            # -p '' keeps sudo from printing a prompt for every command.
+            argv = ["sudo", "-S", "-p", ""] + list(argv)
+        with self._lock:
+            if self._cancelled:
+                raise InstallError("Cancelled")
+            # A session of its own, so cancel() reaches everything it starts.
+            process = subprocess.Popen(argv, cwd=cwd, stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                       universal_newlines=True, bufsize=1,
+                                       start_new_session=True)
+            self._processes.add(process)
+        try:
+            if sudo and self.password is not None:
+                process.stdin.write(self.password + "\n")
+            process.stdin.close()
+            for line in process.stdout:
+                self.output(line)
+            process.wait()
+        finally:
+            with self._lock:
+                self._processes.discard(process)
+        if self._cancelled:
+            raise InstallError("Cancelled")
+        if process.returncode != 0:
+            raise InstallError("{} exited with {}".format(" ".join(argv), process.returncode))
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled = True
+            processes = list(self._processes)
+        for process in processes:
+            try:
+                os.killpg(process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                # sudo runs as root, so only root can signal it.
+                subprocess.run(["sudo", "-S", "-p", "", "kill", "-TERM", "--",
+                                "-{}".format(process.pid)],
+                               input=(self.password or "") + "\n",
+                               universal_newlines=True, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+
+
+class StubRunner(object):
+    """
+    Records commands instead of running them. durations maps a command's
+    first word (e.g. "git") to how long to pretend it takes, and failures
+    is a set of command strings that should fail.
+    """
+
+    def __init__(self, durations=None, failures=(), output=None):
+        self.durations = durations or {}
+        self.failures = set(failures)
+        self.output = output
+        self.commands = []
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+
+    def run(self, argv, sudo=False, cwd=None):
+        text = " ".join(argv)
+        with self._lock:
+            self.commands.append(("sudo " if sudo else "") + text)
+        if self.output is not None:
+            self.output(text + "\n")
+        if self._cancelled.wait(self.durations.get(argv[0], 0.0)):
+            raise InstallError("Cancelled")
+        if text in self.failures:
+            raise InstallError("{} failed".format(text))
+
+    def cancel(self):
+        self._cancelled.set()
+
+
+class InstallGraph(object):
+    """
+    Runs steps on up to jobs worker threads, each step once all of its
+    dependencies are done. progress, if given, is called as
+    progress(step name, state, seconds) whenever a step changes state.
+    With a manifest, steps it has already recorded are skipped and steps
+    that finish are added to it. cancel(), from any thread, stops the
+    running steps through the runner and starts no more.
+    """
+
+    def __init__(self, steps, runner=None, jobs=None, progress=None, manifest=None):
+        self.steps = {step.name: step for step in steps}
+        self.runner = runner if runner is not None else CommandRunner()
+        self.jobs = jobs or max(4, os.cpu_count() or 1)
+        self.progress = progress
+        self.manifest = manifest
+        self.states = {}
+        self.timings = {}
+        self.errors = {}
+        self._cancelled = threading.Event()
+        self._check()
+        self.fingerprints = {}
+        for name in self.steps:
+            self._fingerprint(name)
+
+    def _check(self):
+        for step in self.steps.values():
+            for dep in step.depends:
+                if dep not in self.steps:
+                    raise InstallError("Step {} depends on unknown step {}".format(
+                        step.name, dep))
+        # Depth first search for cycles
+        visiting, visited = set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise InstallError("Install steps form a cycle through {}".format(name))
+            visiting.add(name)
+            for dep in self.steps[name].depends:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self.steps:
+            visit(name)
+
+    def _fingerprint(self, name):
+        if name not in self.fingerprints:
+            step = self.steps[name]
+            text = json.dumps([name, step.own_inputs(), sorted(step.outputs),
+                               [self._fingerprint(dep) for dep in step.depends]],
+                              sort_keys=True)
+            self.fingerprints[name] = hashlib.sha1(text.encode()).hexdigest()
+        return self.fingerprints[name]
+
+    def _report(self, name, state, elapsed=0.0):
+        self.states[name] = state
+        if self.progress is not None:
+            self.progress(name, state, elapsed)
+
+    def _run_step(self, step):
+        '''Returns (state, seconds taken, error or None)'''
+        start = time.monotonic()
+        fingerprint = self.fingerprints[step.name]
+        remember = self.manifest is not None and step.record
+        if remember and self.manifest.satisfied(step, fingerprint):
+            return SKIPPED, time.monotonic() - start, None
+        if step.done is not None and step.done():
+            if remember:
+                self.manifest.record(step, fingerprint)
+            return SKIPPED, time.monotonic() - start, None
+        self._report(step.name, STARTED)
+        try:
+            for command in step.commands:
+                if callable(command):
+                    command(self.runner)
+                else:
+                    self.runner.run(command, sudo=step.sudo, cwd=step.cwd)
+        except Exception as e:
+            if self.manifest is not None:
+                self.manifest.forget(step.name)
+            if self._cancelled.is_set():
+                return CANCELLED, time.monotonic() - start, None
+            return FAILED, time.monotonic() - start, e
+        if remember:
+            self.manifest.record(step, fingerprint)
+        return DONE, time.monotonic() - start, None
+
+    def run(self):
+        '''Run the whole graph; returns True if no step failed'''
+        pending = dict(self.steps)
+        running = {}
+        with concurrent.futures.ThreadPoolExecutor(self.jobs) as pool:
+            while pending or running:
+                if self._cancelled.is_set():
+                    for name in pending:
+                        self._report(name, CANCELLED)
+                    pending.clear()
+                for name, step in list(pending.items()):
+                    deps = [self.states.get(dep) for dep in step.depends]
+                    if any(state in (FAILED, BLOCKED, CANCELLED) for state in deps):
+                        # Something this step needs did not happen.
+                        del pending[name]
+                        self._report(name, BLOCKED)
+                    elif all(state in (DONE, SKIPPED) for state in deps):
+                        del pending[name]
+                        running[pool.submit(self._run_step, step)] = step
+                if not running:
+                    continue
+                finished, _ = concurrent.futures.wait(
+                        running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    step = running.pop(future)
+                    state, elapsed, error = future.result()
+                    if error is not None:
+                        self.errors[step.name] = error
+                    self.timings[step.name] = elapsed
+                    self._report(step.name, state, elapsed)
+        return not self.errors and not self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        if hasattr(self.runner, "cancel"):
+            self.runner.cancel()
+
+    def report(self):
+        '''Per step timing lines, slowest first'''
+        lines = []
+        for name in sorted(self.steps, key=lambda n: -self.timings.get(n, 0.0)):
+            state = self.states.get(name)
+            line = "{:<28} {:<10} {:7.1f}s".format(name, state, self.timings.get(name, 0.0))
+            if name in self.errors:
+                line += "  {}".format(self.errors[name])
+            lines.append(line)
+        return lines
@@ -0,0 +1,428 @@
+"""
+The Project Crunch install, as a graph of steps for install_graph.
+
+Apt sources are added first so that one `apt-get update` and one
+`apt-get install` cover every package. The git clones do not need apt (if
+git is already there), so they run alongside it, and OpenHMD is built with
+one make job per core as soon as both its source and its build tools are
+in place. Hardware and network configuration have no dependencies at all.
+
+Given an offline bundle (see offline_bundle), apt installs from the
+bundle's local repository only and the sources are cloned from its git
+bundles, so nothing is downloaded.
+
+Every step says what it depends on and what it produces, so with an
+InstallManifest a second install skips everything that is still in place
+and only does what is missing or out of date. Settings go to one
+configuration file (config_store), and the shell startup files only get a
+line that includes it.
+
+Run this file directly to see what an install would do without running
+anything:
+
+    python install_steps.py --catkin ~/catkin_ws --robot --dry-run
+
+Without --dry-run it runs the install for real, without the GUI.
+"""
+import argparse
+import getpass
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+# config_store is the launcher's module, shared rather than copied: from the
+# sources it is imported from the launcher's tree, and release.sh puts that
+# tree on the path when it freezes the installer.
+if not getattr(sys, "frozen", False):
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..",
+                                 "..", "..", "app", "src", "main", "python"))
+import config_store
+from install_graph import (CommandRunner, InstallGraph, InstallManifest, Step, StubRunner,
+                           file_digest)
+
+ROS_PACKAGE = "ros-kinetic-desktop-full"
+ROS_SOURCE = "deb http://packages.ros.org/ros/ubuntu xenial main"
+ROS_SOURCE_LIST = "/etc/apt/sources.list.d/ros-latest.list"
+ROS_KEY = "421C365BD9FF1F717815A3895523BAEEB01FA116"
+ROS_KEYSERVER = "hkp://ha.pool.sks-keyservers.net:80"
+GRAPHICS_PPA = "ppa:graphics-drivers/ppa"
+
+APT_PACKAGES = [
+    # Build tools and robot utilities
+    "build-essential=12.1ubuntu2",
+    "cmake=3.5.1-1ubuntu3",
+    "git",
+    "libgtest-dev=1.7.0-4ubuntu1",
+    "openssh-server",
+    "sshpass",
+    "v4l-utils=1.10.0-1",
+    # OpenHMD and its rviz plugin
+    "libglu1-mesa-dev",
+    "mesa-common-dev",
+    "libogre-1.9-dev",
+    "libudev-dev",
+    "libusb-1.0-0-dev",
+    "libfox-1.6-dev",
+    "autotools-dev",
+    "autoconf",
+    "automake",
+    "libtool",
+    "libsdl2-dev",
+    "libxmu-dev",
+    "libxi-dev",
+    "libgl-dev",
+    "libglew1.5-dev",
+    "libglew-dev",
+    "libglewmx1.5-dev",
+    "libglewmx-dev",
+    "libhidapi-dev",
+    "freeglut3-dev",
+]
+
+# (destination under the catkin src directory, repository)
+CATKIN_SOURCES = [
+    ("video_stream_opencv", "https://github.com/ros-drivers/video_stream_opencv.git"),
+    ("rviz_textured_sphere", "https://github.com/UTNuclearRoboticsPublic/rviz_textured_sphere.git"),
+    ("rviz_openhmd", "https://github.com/UTNuclearRoboticsPublic/rviz_openhmd.git"),
+]
+OPENHMD_REPO = "https://github.com/OpenHMD/OpenHMD.git"
+OPENHMD_COMMIT = "4ca169b49ab4ea4bee2a8ea519d9ba8dcf662bd5"
+
+UDEV_RULES_DEST = "/etc/udev/rules.d/"
+XORG_CONF_DEST = "/usr/share/X11/xorg.conf.d/"
+
+# Offline bundles: the apt repository and git bundles under the bundle
+# directory, and the apt source list that points at them. The list is kept
+# out of sources.list.d and only given to apt by the install's own commands.
+BUNDLE_APT = "apt"
+BUNDLE_GIT = "git"
+OFFLINE_SOURCE_LIST = "/etc/apt/project-crunch-offline.list"
+
+# (launch file, catkin package it is copied into)
+LAUNCH_FILES = [
+    ("single-cam.launch", "video_stream_opencv"),
+    ("dual-cam.launch", "video_stream_opencv"),
+    ("vive.launch", "rviz_textured_sphere"),
+]
+
+
+def package_installed(name):
+    '''True if dpkg has name installed'''
+    return subprocess.run(["dpkg", "-s", name], stdout=subprocess.DEVNULL,
+                          stderr=subprocess.DEVNULL).returncode == 0
+
+
+def set_line(path, line, key=None):
+    '''
+    Make line the only line of path that starts with key (by default, line
+    itself), creating path if needed. The file is left alone if it already
+    reads that way.
+    '''
+    key = key or line
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        lines = []
+    kept = [l for l in lines if not l.startswith(key)]
+    if kept + [line] == lines:
+        return
+    with open(path + ".tmp", "w") as f:
+        f.write("\n".join(kept + [line]) + "\n")
+    os.replace(path + ".tmp", path)
+
+
+def remove_lines(path, prefixes):
+    '''
+    Remove every line of path that starts with one of prefixes; returns
+    the removed lines
+    '''
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return []
+    kept = [l for l in lines if not l.startswith(prefixes)]
+    if kept != lines:
+        with open(path + ".tmp", "w") as f:
+            f.write("\n".join(kept) + "\n")
+        os.replace(path + ".tmp", path)
+    return [l for l in lines if l.startswith(prefixes)]
+
+
+def bundle_repo(bundle, name):
+    '''Path of the git bundle of source name in the offline bundle'''
+    return os.path.join(bundle, BUNDLE_GIT, name + ".bundle")
+
+
+def offline_apt_options():
+    '''apt options that make it see only the offline bundle's repository'''
+    return ["-o", "Dir::Etc::SourceList=" + OFFLINE_SOURCE_LIST,
+            "-o", "Dir::Etc::SourceParts=-",
+            "-o", "APT::Get::List-Cleanup=0"]
+
+
+def make_dirs(*paths):
+    for path in paths:
+        os.makedirs(path, exist_ok=True)
+
+
+def replace_line(path, number, text):
+    '''Replace line number (counting from 1) of path with text'''
+    with open(path) as f:
+        lines = f.readlines()
+    print("{} line {} changed from {!r} to {!r}".format(
+        path, number, lines[number - 1].rstrip("\n"), text))
+    lines[number - 1] = text + "\n"
+    with open(path, "w") as f:
+        f.writelines(lines)
+
+
+def build_steps(catkin_dir, install_dir, resource, is_robot, ip_configs, password,
+                bundle=None):
+    '''
+    Return the install steps. resource(name) gives the path of one of the
+    installer's resource files. bundle, if given, is an offline bundle
+    directory to install from instead of the network.
+    '''
+    src = os.path.join(catkin_dir, "src")
+    # The base is not asked for an install directory, so OpenHMD goes next
+    # to the catkin workspace's sources there.
+    openhmd_dir = os.path.join(install_dir or catkin_dir, "OpenHMD")
+    home = os.path.expanduser("~")
+    bashrc = os.path.join(home, ".bashrc")
+    xsessionrc = os.path.join(home, ".xsessionrc")
+    jobs = str(os.cpu_count() or 1)
+    ros_installed = package_installed(ROS_PACKAGE)
+    # Cloning only has to wait for apt if git itself is missing.
+    git_deps = ["catkin_workspace"] + ([] if shutil.which("git") else ["apt_install"])
+
+    # Settings go to the Project Crunch configuration (see config_store),
+    # which the launcher reads directly. The bashrc, for shell scripts, and
+    # the xsessionrc, for GNOME/Unity (X11 sessions), only include it. The
+    # other machine's settings are added by the ssh key configuration.
+    if is_robot:
+        settings = {"ROBOT_CATKIN_PATH": catkin_dir,
+                    "ROBOT_PROJECT_CRUNCH_PATH": install_dir}
+    else:
+        settings = {"BASE_CATKIN_PATH": catkin_dir}
+    settings["OPENHMD_INSTALL_DEST"] = openhmd_dir
+    bashrc_lines = [config_store.INCLUDE_LINE]
+    if not ros_installed:
+        bashrc_lines.insert(0, "source /opt/ros/kinetic/setup.bash")
+
+    def write_env(runner):
+        # Earlier installs exported every setting straight from these
+        # files; settings the configuration does not have yet move there.
+        managed = tuple("export {}=".format(key) for key in config_store.KEYS)
+        old = []
+        for path in (xsessionrc, bashrc):
+            old += remove_lines(path, managed)
+        current = config_store.load()
+        moved = {name: value for name, value in config_store.parse("\n".join(old)).items()
+                 if name not in current}
+        moved.update(settings)
+        config_store.update(moved)
+        for path, lines in ((bashrc, bashrc_lines), (xsessionrc, [config_store.INCLUDE_LINE])):
+            for line in lines:
+                set_line(path, line)
+
+    steps = [
+        Step("catkin_workspace", [lambda runner: make_dirs(
+                os.path.join(catkin_dir, "build"), src)],
+             inputs=[catkin_dir], outputs=[os.path.join(catkin_dir, "build"), src]),
+        # Cheap and safe to repeat, so never remembered; one step writes both
+        # files so no two steps edit them at once.
+        Step("shell_env", [write_env], record=False),
+    ]
+    if bundle is None:
+        apt_options = []
+        steps += [
+            Step("ros_apt_source", [
+                    ["sh", "-c", "echo '{}' > {}".format(ROS_SOURCE, ROS_SOURCE_LIST)],
+                    ["apt-key", "adv", "--keyserver", ROS_KEYSERVER, "--recv-key", ROS_KEY],
+                 ], sudo=True, done=lambda: ros_installed, outputs=[ROS_SOURCE_LIST]),
+            Step("graphics_ppa", [["add-apt-repository", "-y", GRAPHICS_PPA]], sudo=True,
+                 done=lambda: bool(glob.glob("/etc/apt/sources.list.d/graphics-drivers-*.list"))),
+            Step("apt_update", [["apt-get", "update"]], sudo=True,
+                 depends=["ros_apt_source", "graphics_ppa"]),
+        ]
+    else:
+        apt_options = offline_apt_options()
+        steps += [
+            Step("offline_apt_source", [["sh", "-c", "echo '{}' > {}".format(
+                    "deb [trusted=yes] file:{} ./".format(
+                        os.path.join(os.path.abspath(bundle), BUNDLE_APT)),
+                    OFFLINE_SOURCE_LIST)]],
+                 sudo=True, outputs=[OFFLINE_SOURCE_LIST]),
+            Step("apt_update", [["apt-get", "update"] + apt_options], sudo=True,
+                 depends=["offline_apt_source"]),
+        ]
+    options = " ".join(apt_options)
+    steps += [
+        Step("apt_install", [["apt-get", "-y", "install"] + apt_options + APT_PACKAGES
+                             + ([] if ros_installed else [ROS_PACKAGE])],
+             sudo=True, depends=["apt_update"]),
+        # Driver detection is slow, so it runs once and is remembered. A
+        # bundle only has the drivers it was built with.
+        Step("nvidia_driver", [[
+                "bash", "-c",
+                "DRIVER=$(ubuntu-drivers devices | grep recommended | awk '{print $3}'); "
+                "[ -n \"$DRIVER\" ] || exit 0; "
+                "dpkg -s \"$DRIVER\" > /dev/null 2>&1 && exit 0; "
+                "apt-cache " + options + " show \"$DRIVER\" > /dev/null 2>&1 "
+                "|| { echo \"$DRIVER is not available, install it by hand\"; exit 0; }; "
+                "apt-get -y install " + options + " \"$DRIVER\""]],
+             sudo=True, depends=["apt_install"]),
+    ]
+    # rosdep update reads its sources from GitHub, so an offline install
+    # leaves it for later.
+    if not ros_installed and bundle is None:
+        steps += [
+            Step("rosdep_init", [["rosdep", "init"]], sudo=True, depends=["apt_install"],
+                 done=lambda: os.path.exists("/etc/ros/rosdep/sources.list.d/20-default.list")),
+            Step("rosdep_update", [["rosdep", "update"]], depends=["rosdep_init"]),
+        ]
+
+    def clone(name, repo, dest):
+        if bundle is None:
+            return [["git", "clone", repo, dest]]
+        # Clone the bundle, then point origin back at the real repository
+        # for later pulls.
+        return [["git", "clone", bundle_repo(bundle, name), dest],
+                ["git", "-C", dest, "remote", "set-url", "origin", repo]]
+
+    for name, repo in CATKIN_SOURCES:
+        dest = os.path.join(src, name)
+        steps.append(Step("clone_" + name, clone(name, repo, dest), depends=git_deps,
+                          done=lambda dest=dest: os.path.isdir(dest), outputs=[dest]))
+    steps += [
+        Step("clone_openhmd", clone("OpenHMD", OPENHMD_REPO, openhmd_dir)
+                              + [["git", "-C", openhmd_dir, "checkout", OPENHMD_COMMIT]],
+             depends=git_deps, done=lambda: os.path.isdir(openhmd_dir),
+             outputs=[openhmd_dir]),
+        # Built both ways, as before: cmake, then autotools, in the source
+        # tree. Done once the library is there, not once the source is.
+        Step("build_openhmd", [["cmake", "."], ["make", "-j", jobs],
+                               ["./autogen.sh"], ["./configure"], ["make", "-j", jobs]],
+             cwd=openhmd_dir, depends=["clone_openhmd", "apt_install"],
+             outputs=[openhmd_library(openhmd_dir)]),
+        Step("patch_rviz_openhmd", [lambda runner: patch_rviz_openhmd(catkin_dir)],
+             depends=["clone_rviz_openhmd"], inputs=[catkin_dir],
+             outputs=rviz_openhmd_patched(catkin_dir)),
+        Step("launch_files", [lambda runner: copy_launch_files(catkin_dir, resource)],
+             depends=["clone_video_stream_opencv", "clone_rviz_textured_sphere"],
+             inputs=[[launch, file_digest(resource(launch))] for launch, _ in LAUNCH_FILES],
+             outputs=[launch_file_dest(catkin_dir, launch, package)
+                      for launch, package in LAUNCH_FILES]),
+        # HMD access: udev rules, an X config that treats the HMD as a
+        # monitor, and raw USB access for the plugin.
+        Step("udev_rules", [["cp", resource("50-openhmd.rules"), UDEV_RULES_DEST],
+                            ["udevadm", "control", "--reload-rules"]], sudo=True,
+             inputs=[file_digest(resource("50-openhmd.rules"))],
+             outputs=[os.path.join(UDEV_RULES_DEST, "50-openhmd.rules")]),
+        Step("vive_xorg_conf", [["cp", resource("50-Vive.conf"), XORG_CONF_DEST]], sudo=True,
+             inputs=[file_digest(resource("50-Vive.conf"))],
+             outputs=[os.path.join(XORG_CONF_DEST, "50-Vive.conf")]),
+        # Device nodes get their permissions back whenever the HMD is
+        # plugged in again, so this always runs.
+        Step("hidraw_permissions", [["bash", "-c", "chmod a+rw /dev/hidraw* || true"]],
+             sudo=True, record=False),
+        Step("firewall_ssh", [["ufw", "allow", "22"]], sudo=True),
+        # The fingerprint leaves out the password.
+        Step("network", [[
+                "bash", resource("configure_network.sh"),
+                "--is_base", "n" if is_robot else "y",
+                "--robot_ip", ip_configs["robot_ip"],
+                "--base_ip", ip_configs["base_ip"],
+                "--robot_hostname", ip_configs["robot_hostname"],
+                "--base_hostname", ip_configs["base_hostname"],
+                "--password", password or ""]],
+             depends=["shell_env"],
+             inputs=[is_robot, sorted(ip_configs.items()),
+                     file_digest(resource("configure_network.sh")),
+                     file_digest(resource("config_lines.sh"))],
+             outputs=["/etc/hosts", "/etc/hostname"]),
+    ]
+    return steps
+
+
+def openhmd_library(openhmd_dir):
+    '''The shared library the autotools build of OpenHMD leaves in its tree'''
+    return os.path.join(openhmd_dir, "src", ".libs", "libopenhmd.so")
+
+
+def rviz_openhmd_patched(catkin_dir):
+    '''The two plugin files patch_rviz_openhmd changes'''
+    plugin_src = os.path.join(catkin_dir, "src", "rviz_openhmd", "src")
+    return [os.path.join(plugin_src, "openhmd_display.cpp"),
+            os.path.join(plugin_src, "resources.cfg")]
+
+
+def patch_rviz_openhmd(catkin_dir):
+    '''
+    The plugin hard codes absolute paths to its resources; point them into
+    this catkin workspace.
+    '''
+    display, resources_cfg = rviz_openhmd_patched(catkin_dir)
+    replace_line(display, 73,
+                 '    mResourcesCfg = "{}/src/rviz_openhmd/src/resources.cfg";'.format(catkin_dir))
+    replace_line(resources_cfg, 3,
+                 "FileSystem={}/src/rviz_openhmd/src/resources/".format(catkin_dir))
+
+
+def launch_file_dest(catkin_dir, launch, package):
+    return os.path.join(catkin_dir, "src", package, "launch", launch)
+
+
+def copy_launch_files(catkin_dir, resource):
+    for launch, package in LAUNCH_FILES:
+        dest = launch_file_dest(catkin_dir, launch, package)
+        if file_digest(dest) != file_digest(resource(launch)):
+            shutil.copyfile(resource(launch), dest)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--catkin", required=True)
+    parser.add_argument("--install")
+    parser.add_argument("--robot", action="store_true")
+    parser.add_argument("--bundle", help="offline bundle directory to install from")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="record the commands instead of running them")
+    args = parser.parse_args(argv)
+    resources = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir, "resources", "base")
+    ip_configs = {"robot_ip": "10.0.0.2", "base_ip": "10.0.0.1",
+                  "robot_hostname": "robot", "base_hostname": "base"}
+    password = None
+    if not args.dry_run and os.geteuid() != 0:
+        password = getpass.getpass("sudo password: ")
+    steps = build_steps(args.catkin, args.install,
+                        lambda name: os.path.join(resources, name),
+                        args.robot, ip_configs, password, bundle=args.bundle)
+    progress = lambda name, state, elapsed: print(name, state)
+    if args.dry_run:
+        runner = StubRunner()
+        # Python steps edit files, so a dry run leaves them out.
+        for step in steps:
+            step.commands = [c for c in step.commands if not callable(c)]
+        InstallGraph(steps, runner, progress=progress).run()
+        print()
+        print("\n".join(runner.commands))
+        return 0
+    graph = InstallGraph(steps, CommandRunner(password), progress=progress,
+                         manifest=InstallManifest())
+    started = time.monotonic()
+    succeeded = graph.run()
+    print()
+    print("\n".join(graph.report()))
+    print("Install took {:.1f}s".format(time.monotonic() - started))
+    return 0 if succeeded else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,77 @@
+"""
+Runs an install graph off the Qt GUI thread.
+
+InstallWorker is a QThread that runs an InstallGraph and reports back with
+signals, so the window keeps redrawing and the cancel button keeps working
+through a 20 minute install. Command output does not go through a signal
+per line: apt alone prints thousands of lines. The runner writes them into
+an OutputBuffer, which keeps only the newest lines, and the window drains it
+on a timer.
+
+installer/src/test/python/test_install_worker.py checks that the GUI thread
+keeps its frame time while a long, noisy fake install runs.
+"""
+import collections
+import threading
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+# Lines of command output kept for the window
+OUTPUT_LINES = 2000
+# Milliseconds between output buffer drains
+DRAIN_INTERVAL = 100
+
+
+class OutputBuffer(object):
+    """
+    Thread safe buffer of the newest maxlen output lines. write() takes
+    text from any thread; drain() returns the lines written since the last
+    drain and how many older ones were dropped to stay in bounds.
+    """
+
+    def __init__(self, maxlen=OUTPUT_LINES):
+        self._lines = collections.deque(maxlen=maxlen)
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        with self._lock:
+            for line in text.splitlines():
+                if len(self._lines) == self._lines.maxlen:
+                    self._dropped += 1
+                self._lines.append(line)
+
+    def drain(self):
+        with self._lock:
+            lines, dropped = list(self._lines), self._dropped
+            self._lines.clear()
+            self._dropped = 0
+        return lines, dropped
+
+
+class InstallWorker(QThread):
+    """
+    Runs graph.run() on its own thread. step_changed(name, state, seconds)
+    is emitted for every step state change and finished_install(succeeded)
+    once the graph is done. cancel() may be called from the GUI thread.
+    """
+
+    step_changed = pyqtSignal(str, str, float)
+    finished_install = pyqtSignal(bool)
+
+    def __init__(self, graph, parent=None):
+        super().__init__(parent)
+        self.graph = graph
+        self.graph.progress = self.step_changed.emit
+
+    def run(self):
+        try:
+            succeeded = self.graph.run()
+        except Exception as e:
+            print("Install stopped: {}".format(e))
+            succeeded = False
+        self.finished_install.emit(succeeded)
+
+    def cancel(self):
+        self.graph.cancel()
+
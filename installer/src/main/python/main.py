@@ -1,12 +1,16 @@
-import os
 import sys
-from shutil import copyfile
 import subprocess
 from fbs_runtime.application_context import ApplicationContext
 from PyQt5.QtWidgets import (QApplication, QWidget, QPushButton, QVBoxLayout,
                             QMessageBox, QInputDialog, QLineEdit, QFileDialog,
-                           QDialogButtonBox, QMainWindow, QLabel)
-from PyQt5.QtCore import QObjectCleanupHandler
+                           QDialogButtonBox, QMainWindow, QLabel, QProgressBar,
+                           QPlainTextEdit)
+from PyQt5.QtCore import QObjectCleanupHandler, QTimer
+from install_graph import (CANCELLED, DONE, FAILED, SKIPPED, STARTED, BLOCKED,
+                           CommandRunner, InstallGraph, InstallManifest, Step)
+from install_steps import build_steps
+from offline_bundle import find_bundle
+from install_worker import DRAIN_INTERVAL, OUTPUT_LINES, InstallWorker, OutputBuffer
 
 class AppContext(ApplicationContext):
     """
@@ -34,8 +38,13 @@ class AppContext(ApplicationContext):
     robot_username = None
     robot_password = None
     robot_hostname = None
+    bundle = None
     
     def run(self):
+        # An offline bundle shipped with the release means nothing has to be
+        # downloaded.
+        self.bundle = find_bundle()
+
         # Set up window
         self.window = QWidget()
         self.window.setLayout(self.first_page())
@@ -57,6 +66,8 @@ class AppContext(ApplicationContext):
         Create layout of the first page.
         """
         layout = QVBoxLayout()
+        if self.bundle is not None:
+            layout.addWidget(QLabel('Installing offline from {}'.format(self.bundle)))
         install_button = QPushButton('Install Project Crunch')
         install_button.clicked.connect(self.on_install_push)
         ssh_config_button = QPushButton('Configure SSH Keys')
@@ -301,127 +312,108 @@ class AppContext(ApplicationContext):
         """
         Install process on press of install button.
         
-        This executes the core functionality of the install process. In a
-        nutshell, the steps are as follows:
-
-          1. Export necessary environment variables to bashrc that are 
-             needed for the main app.
-          2. Run a bash script to set up a catkin workspace, install 
-             dependencies via apt, and set up all the source code for the 
-             catkin workspace.
-          3. Copy over any necessary configuration and launch files into
-             the catkin workspace.
-          4. Run a bash script to set up the network configurations.
+        This executes the core functionality of the install process. It runs
+        the install graph: export the environment variables the main app
+        needs, set up a catkin workspace, install dependencies via apt, set
+        up all the source code for the catkin workspace, copy over the
+        launch files, configure the HMD hardware and set up the network
+        configurations.
 
         """
         
-        # Tell the user not to worry about the program appearing to crash.
-        # Note: this will halt the code here until the 'OK' button in the message box is clicked.
-        # This will solve the problem for now but should have a better solution in the future.
-        QMessageBox.about(self.window, "Installing", "This process can take up to 20 min. The window may appear" +
-            "to stop responding, but we are installing in the background. Click 'OK' to begin.")
-
-        # Export environment variables no matter what machine we are on (robot
-        # or base.) We collect the envs from the opposite machine when the
-        # user runs ssh config. Envs are written to the bashrc for shell scripts,
-        # and xsessionrc for GNOME/Unity (X11 sessions). Ideally they
-        # are pruned at some point, but for now they just add new ones. This 
-        # is OK because the new var is written to the end of the bashrc and
-        # xsessionrc so the definition overwrites any previous one.
-        # We need to check the current computer because the catkin workspace
-        # could be different.
-        path_to_bashrc = os.path.join(os.path.expanduser('~'), '.bashrc')
-        path_to_xsessionrc = os.path.join(os.path.expanduser('~'), '.xsessionrc')
-        if self.current_computer_is_robot is True:
-            with open(path_to_bashrc, "a") as f:
-                f.write("export ROBOT_CATKIN_PATH={}\n".format(self.catkin_dir))
-                f.write("export ROBOT_PROJECT_CRUNCH_PATH={}\n"\
-                    .format(self.install_dir)) 
-            with open(path_to_xsessionrc, "a") as f:
-                f.write("export ROBOT_CATKIN_PATH={}\n".format(self.catkin_dir))
-                f.write("export ROBOT_PROJECT_CRUNCH_PATH={}\n"\
-                    .format(self.install_dir)) 
-        else:        
-            with open(path_to_bashrc, "a") as f:
-                f.write("export BASE_CATKIN_PATH={}\n".format(self.catkin_dir)) 
-            with open(path_to_xsessionrc, "a") as f:
-                f.write("export BASE_CATKIN_PATH={}\n".format(self.catkin_dir)) 
-
-
-        # Set up catkin workspace and install dependencies.
-        # Script also sets up local hardware configurations for
-        # Vive and OpenHMD.
-        # Bash arguments are passed in via a dictionary and must match the
-        # command line arguments of the script.
-        install_args = [
-            '-c', '{}'.format(self.catkin_dir), 
-            '-i', '{}'.format(self.install_dir), 
-            '-p', '{}'.format(self.password),
-            '--openhmdrules', '{}'.format(self.get_resource('50-openhmd.rules')),
-            '--viveconf', '{}'.format(self.get_resource('50-Vive.conf'))
-        ]
-        subprocess.run(
-                [
-                    'bash', 
-                    self.get_resource('install.sh'), 
-                    *install_args
-                ], 
-                check=True
-        )
-
-        # Copy over necessary configuration files
-        # Still need openhmd file ## TODO fix last launch file #TODO 4/4/19 are these comments still accurate?
-        single_cam_launch = 'single-cam.launch'
-        dual_cam_launch = 'dual-cam.launch'
-        vive_launch = 'vive.launch'
-        opencv_dir = 'video_stream_opencv'
-        txtsphere_dir = 'rviz_textured_sphere'
-
-        txtsphere_dest_dir = os.path.join(self.catkin_dir, 'src', txtsphere_dir, 'launch')
-        opencv_dest_dir = os.path.join(self.catkin_dir, 'src', opencv_dir, 'launch')
-
-        # Copy single cam launch
-        file_dest = os.path.join(opencv_dest_dir, single_cam_launch)
-        if not os.path.isfile(file_dest):
-            copyfile(self.get_resource(single_cam_launch), file_dest) 
-        
-        # Copy dual cam launch
-        file_dest = os.path.join(opencv_dest_dir, dual_cam_launch)
-        if not os.path.isfile(file_dest):
-            copyfile(self.get_resource(dual_cam_launch), file_dest)
-        
-        # Copy rviz launch file
-        file_dest = os.path.join(txtsphere_dest_dir, vive_launch)
-        if not os.path.isfile(file_dest):
-            copyfile(self.get_resource(vive_launch), file_dest)
-
-        # Set up network configurations via /etc/hostnames
-        if self.current_computer_is_robot == True:
-            is_base = "n"
+        # Set up the catkin workspace, install dependencies, configure the
+        # Vive and OpenHMD hardware and the network. The steps form a graph
+        # (see install_steps) and independent ones run at the same time.
+        # Steps a previous install finished are remembered in the manifest
+        # and skipped, so running the install again only does what is left.
+        steps = build_steps(self.catkin_dir, self.install_dir, self.get_resource,
+                            self.current_computer_is_robot, self.ip_configs,
+                            self.password, bundle=self.bundle)
+        self.run_steps("Installing Project Crunch", steps, self.password,
+                       InstallManifest(), self.install_finished)
+
+    def run_steps(self, title, steps, password, manifest, on_success):
+        """
+        Run steps on an InstallWorker thread and show their progress, output
+        and a cancel button in a window of their own. The GUI thread only
+        updates that window, so it stays responsive however long the steps
+        take. on_success is called if every step finished.
+        """
+        self.output = OutputBuffer()
+        graph = InstallGraph(steps, CommandRunner(password, output=self.output.write),
+                             manifest=manifest)
+        self.worker = InstallWorker(graph)
+        self.worker.step_changed.connect(self.on_step_progress)
+        self.worker.finished_install.connect(
+                lambda succeeded: self.on_steps_finished(graph, succeeded, on_success))
+
+        self.progress_window = QWidget()
+        self.progress_window.setWindowTitle(title)
+        layout = QVBoxLayout()
+        self.progress_label = QLabel("Starting")
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, len(steps))
+        self.output_view = QPlainTextEdit()
+        self.output_view.setReadOnly(True)
+        # Old lines are dropped so a long install cannot fill memory.
+        self.output_view.setMaximumBlockCount(OUTPUT_LINES)
+        self.cancel_button = QPushButton('Cancel')
+        self.cancel_button.clicked.connect(self.on_cancel_push)
+        layout.addWidget(self.progress_label)
+        layout.addWidget(self.progress_bar)
+        layout.addWidget(self.output_view)
+        layout.addWidget(self.cancel_button)
+        self.progress_window.setLayout(layout)
+        self.progress_window.resize(700, 450)
+        self.progress_window.show()
+
+        self.running_steps = set()
+        self.output_timer = QTimer()
+        self.output_timer.timeout.connect(self.drain_output)
+        self.output_timer.start(DRAIN_INTERVAL)
+        self.worker.start()
+
+    def drain_output(self):
+        lines, dropped = self.output.drain()
+        if dropped:
+            self.output_view.appendPlainText("... {} lines not shown ...".format(dropped))
+        if lines:
+            self.output_view.appendPlainText("\n".join(lines))
+
+    def on_step_progress(self, name, state, elapsed):
+        if state == STARTED:
+            print("[install] {} started".format(name))
+            self.running_steps.add(name)
         else:
-            is_base = "y"
-
-        ip_args = [
-            '--is_base', is_base,
-            '--robot_ip', self.ip_configs['robot_ip'], 
-            '--base_ip', self.ip_configs['base_ip'], 
-            '--robot_hostname', self.ip_configs['robot_hostname'],
-            '--base_hostname', self.ip_configs['base_hostname'], 
-            '--password', '{}'.format(self.password)
-        ]
-        subprocess.run(
-                [
-                    'bash', 
-                    self.get_resource('configure_network.sh'), 
-                    *ip_args
-                ], 
-                check=True
-        )
-        
-        # TODO catkin build /make
-        # Set up icons?
-
-        self.install_finished()
+            print("[install] {} {} ({:.1f}s)".format(name, state, elapsed))
+            self.running_steps.discard(name)
+            if state in (DONE, SKIPPED, FAILED, BLOCKED, CANCELLED):
+                self.progress_bar.setValue(self.progress_bar.value() + 1)
+        self.progress_label.setText("{}/{} steps finished. Running: {}".format(
+                self.progress_bar.value(), self.progress_bar.maximum(),
+                ", ".join(sorted(self.running_steps)) or "-"))
+
+    def on_cancel_push(self):
+        self.cancel_button.setEnabled(False)
+        self.progress_label.setText("Cancelling")
+        self.worker.cancel()
+
+    def on_steps_finished(self, graph, succeeded, on_success):
+        self.output_timer.stop()
+        self.drain_output()
+        self.cancel_button.setEnabled(False)
+        print("\n".join(graph.report()))
+        if succeeded:
+            self.progress_window.close()
+            on_success()
+        elif CANCELLED in graph.states.values():
+            QMessageBox.about(self.progress_window, "Cancelled",
+                    "Stopped. Finished steps are kept; run this again to carry on.")
+        else:
+            QMessageBox.about(self.progress_window, "Failed",
+                    "These steps failed:\n" +
+                    "\n".join("{}: {}".format(name, error)
+                              for name, error in graph.errors.items()))
 
     def install_finished(self):
         """
@@ -567,14 +559,15 @@ class AppContext(ApplicationContext):
             '--username', '{}'.format(self.robot_username),
             '--hostname', '{}'.format(self.robot_hostname)
         ]
-        subprocess.run(
-                [
-                    'bash', 
-                    self.get_resource('configure_ssh_keys.sh'), 
-                    *ssh_config_args
-                ], 
-                check=True
-        )
+        # Runs like an install step, so the window stays responsive while
+        # ssh waits on the robot.
+        steps = [Step("ssh_keys", [['bash', self.get_resource('configure_ssh_keys.sh'),
+                                    *ssh_config_args]], record=False)]
+        self.run_steps("Configuring SSH Keys", steps, None, None, self.ssh_config_finished)
+
+    def ssh_config_finished(self):
+        QMessageBox.about(self.window, "SSH Keys Configured",
+                "The robot now accepts this computer's ssh key.")
         
 
 if __name__ == "__main__":
@@ -0,0 +1,151 @@
+"""
+Offline install bundle: everything the install downloads, on local disk.
+
+A bundle is a directory next to the release's Install and Project-Crunch
+directories:
+
+    bundle/
+        manifest.json   what is in it, for find_bundle() and the install
+        apt/            every .deb the install needs, with their
+                        dependencies, and a Packages.gz index so apt can use
+                        the directory as a repository
+        git/            a git bundle of each source repository the install
+                        clones, OpenHMD's holding its pinned commit
+
+Build one with `bash release.sh --version X --offline`, or directly, on an
+Ubuntu 16.04 machine that already has the ROS and graphics driver apt
+sources (any machine the installer has run on):
+
+    python offline_bundle.py build/Project-Crunch/bundle
+
+The installer looks for a bundle when it starts (see find_bundle) and, if it
+finds one, installs from it without touching the network.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from install_steps import (APT_PACKAGES, BUNDLE_APT, BUNDLE_GIT, CATKIN_SOURCES,
+                           OPENHMD_COMMIT, OPENHMD_REPO, ROS_PACKAGE, bundle_repo)
+
+MANIFEST = "manifest.json"
+# Bumped when the bundle layout changes; the installer ignores other versions.
+BUNDLE_VERSION = 1
+# Set to a bundle directory to use it wherever the installer was started from
+BUNDLE_ENV = "CRUNCH_BUNDLE"
+
+
+def git_sources():
+    '''(name, repository) of every repository the install clones'''
+    return list(CATKIN_SOURCES) + [("OpenHMD", OPENHMD_REPO)]
+
+
+def apt_closure(packages):
+    '''
+    The packages and everything they depend on, by name. Versions pinned
+    as name=version are resolved by name.
+    '''
+    names = [package.split("=")[0] for package in packages]
+    output = subprocess.check_output(
+            ["apt-cache", "depends", "--recurse", "--no-recommends", "--no-suggests",
+             "--no-conflicts", "--no-breaks", "--no-replaces", "--no-enhances"] + names,
+            universal_newlines=True)
+    # Indented lines are the dependency relations; <name> is a virtual
+    # package, which something real in the list provides.
+    closure = {line for line in output.splitlines()
+               if line and not line[0].isspace() and not line.startswith("<")}
+    return sorted(closure)
+
+
+def build_bundle(dest, drivers=()):
+    '''
+    Download everything the install needs into dest. drivers are extra
+    packages to carry, e.g. the nvidia driver the target machines need.
+    '''
+    apt_dir = os.path.join(dest, BUNDLE_APT)
+    git_dir = os.path.join(dest, BUNDLE_GIT)
+    os.makedirs(apt_dir, exist_ok=True)
+    os.makedirs(git_dir, exist_ok=True)
+
+    roots = APT_PACKAGES + [ROS_PACKAGE] + list(drivers)
+    pinned = {package.split("=")[0]: package for package in roots}
+    packages = [pinned.get(name, name) for name in apt_closure(roots)]
+    print("Downloading {} packages".format(len(packages)))
+    subprocess.check_call(["apt-get", "download"] + packages, cwd=apt_dir)
+    with open(os.path.join(apt_dir, "Packages.gz"), "wb") as index:
+        scan = subprocess.Popen(["dpkg-scanpackages", ".", "/dev/null"], cwd=apt_dir,
+                                stdout=subprocess.PIPE)
+        subprocess.check_call(["gzip", "-9c"], stdin=scan.stdout, stdout=index)
+        if scan.wait() != 0:
+            raise subprocess.CalledProcessError(scan.returncode, "dpkg-scanpackages")
+
+    repos = {}
+    work = tempfile.mkdtemp(prefix="crunch-bundle-")
+    try:
+        for name, repo in git_sources():
+            clone = os.path.join(work, name)
+            subprocess.check_call(["git", "clone", "--quiet", repo, clone])
+            bundle = bundle_repo(dest, name)
+            subprocess.check_call(["git", "-C", clone, "bundle", "create", bundle, "--all"])
+            repos[name] = {"repository": repo, "bundle": os.path.relpath(bundle, dest)}
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    with open(os.path.join(dest, MANIFEST), "w") as f:
+        json.dump({"version": BUNDLE_VERSION, "apt": packages, "git": repos,
+                   "openhmd_commit": OPENHMD_COMMIT, "drivers": list(drivers)},
+                  f, indent=1, sort_keys=True)
+    return dest
+
+
+def read_manifest(path):
+    '''The manifest of the bundle at path, or None if it is not a usable bundle'''
+    try:
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != BUNDLE_VERSION:
+        return None
+    return manifest
+
+
+def find_bundle(start=None):
+    '''
+    The bundle directory to install from, or None: $CRUNCH_BUNDLE if set,
+    otherwise a "bundle" directory in start (by default the directory of
+    the running program) or any directory above it.
+    '''
+    if os.environ.get(BUNDLE_ENV):
+        path = os.path.abspath(os.environ[BUNDLE_ENV])
+        return path if read_manifest(path) is not None else None
+    directory = os.path.abspath(start or os.path.dirname(sys.executable
+                                                         if getattr(sys, "frozen", False)
+                                                         else __file__))
+    while True:
+        candidate = os.path.join(directory, "bundle")
+        if read_manifest(candidate) is not None:
+            return candidate
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Build an offline install bundle")
+    parser.add_argument("dest")
+    parser.add_argument("--driver", action="append", default=[],
+                        help="extra package to include, e.g. nvidia-410; repeatable")
+    args = parser.parse_args(argv)
+    build_bundle(args.dest, args.driver)
+    print("Bundle written to {}".format(args.dest))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,57 @@
+#!/usr/bin/env bash
+#
+# Helpers for writing the Project Crunch configuration, sourced by
+# configure_network.sh and configure_ssh_keys.sh so both edit it the same
+# way. Every edit replaces the line it wrote last time instead of appending
+# another, so running a script again leaves the files as they were.
+
+# set_line FILE KEY LINE
+# Make LINE the only line of FILE that starts with KEY. FILE is left alone
+# if it already reads that way, and is otherwise replaced in one rename.
+set_line() {
+    local file="$1" key="$2" line="$3"
+    local temp
+    mkdir -p "$(dirname "$file")"
+    touch "$file"
+    temp=$(mktemp "$file.XXXXXX")
+    chmod --reference="$file" "$temp"
+    awk -v key="$key" 'index($0, key) != 1' "$file" > "$temp"
+    echo "$line" >> "$temp"
+    if cmp -s "$temp" "$file";
+    then
+        rm -f "$temp"
+    else
+        mv "$temp" "$file"
+    fi
+}
+
+# The Project Crunch configuration (see config_store.py), and the one line
+# that .bashrc and .xsessionrc need to read it
+CONFIG="${CRUNCH_CONFIG:-$HOME/.config/project-crunch/config}"
+[[ "$CONFIG" == /* ]] || CONFIG="$PWD/$CONFIG"
+# Built from the config file's path, as config_store.include_line builds it:
+# from $HOME when it is in the home directory, quoted otherwise.
+SAFE='^[A-Za-z0-9_@%+=:,./-]+$'
+CONFIG_REST="${CONFIG#"$HOME"/}"
+if [[ "$CONFIG_REST" != "$CONFIG" && "$CONFIG_REST" =~ $SAFE ]];
+then
+    CONFIG_REF="\"\$HOME/$CONFIG_REST\""
+elif [[ "$CONFIG" =~ $SAFE ]];
+then
+    CONFIG_REF="$CONFIG"
+else
+    # Single quoted, with any single quote closed, escaped and reopened
+    CONFIG_REF="'${CONFIG//\'/\'\"\'\"\'}'"
+fi
+INCLUDE_LINE="[ -f $CONFIG_REF ] && . $CONFIG_REF"
+
+# set_config NAME VALUE
+set_config() {
+    if [ ! -s "$CONFIG" ];
+    then
+        mkdir -p "$(dirname "$CONFIG")"
+        printf '%s\n' "# Project Crunch configuration, written by the installer." \
+            "export CRUNCH_CONFIG_VERSION=1" > "$CONFIG"
+    fi
+    set_line "$CONFIG" "export $1=" "export $1=$(printf '%q' "$2")"
+}
@@ -43,16 +43,27 @@ done
 
 ####################################################################
 # Set ROS environment variables and set up network files
+#
+# The ROS variables go to the Project Crunch configuration, which .bashrc
+# includes.
 ####################################################################
-echo "export ROS_MASTER_URI=http://$ROBOT_IP:11311" >> ~/.bashrc
 
-# Append ROS_IP to bashrc depending on which computer you are
+# set_line, set_config, CONFIG and INCLUDE_LINE
+source "$(dirname "${BASH_SOURCE[0]}")/config_lines.sh"
+
+set_config ROS_MASTER_URI "http://$ROBOT_IP:11311"
+set_config ROBOT_IP "$ROBOT_IP"
+set_config BASE_IP "$BASE_IP"
+set_config ROBOT_HOSTNAME "$ROBOT_NAME"
+set_config BASE_HOSTNAME "$BASE_NAME"
+
+# Set ROS_IP depending on which computer you are
 if [ "$IS_BASE" == "y" ];
 then
-    echo "export ROS_IP=$BASE_IP" >> ~/.bashrc
+    set_config ROS_IP "$BASE_IP"
 elif [ "$IS_BASE" == "n" ];
 then
-    echo "export ROS_IP=$ROBOT_IP" >> ~/.bashrc
+    set_config ROS_IP "$ROBOT_IP"
 else
     echo "Unknown runtime error."
     exit 1
@@ -61,19 +72,31 @@ fi
 # Get sudo privileges with the password arg
 # Use it to add IPs and hostnames to files
 echo "$PASSWORD" | sudo -S touch /etc/hosts
+if ! grep -qE "^127\.0\.0\.1[[:space:]]+localhost([[:space:]]|$)" /etc/hosts;
+then
+    echo "127.0.0.1       localhost" | sudo tee -a /etc/hosts
+fi
+# Drop any earlier entry for either hostname before adding the current one.
+TEMP_HOSTS=$(mktemp)
+awk -v base="$BASE_NAME" -v robot="$ROBOT_NAME" \
+    '$2 != base && $2 != robot' /etc/hosts > "$TEMP_HOSTS"
 {
-  echo "127.0.0.1       localhost"
   echo "$BASE_IP        $BASE_NAME"
   echo "$ROBOT_IP        $ROBOT_NAME"
-} | sudo tee -a /etc/hosts
+} >> "$TEMP_HOSTS"
+if ! cmp -s "$TEMP_HOSTS" /etc/hosts;
+then
+    sudo cp "$TEMP_HOSTS" /etc/hosts
+fi
+rm -f "$TEMP_HOSTS"
 
-sudo touch /etc/hostname
+# /etc/hostname holds exactly one name, so it is written, not appended to.
 if [ "$IS_BASE" == "y" ];
 then
-    echo "$BASE_NAME" | sudo tee -a /etc/hostname
+    echo "$BASE_NAME" | sudo tee /etc/hostname
 elif [ "$IS_BASE" == "n" ];
 then
-    echo "$ROBOT_NAME" | sudo tee -a /etc/hostname
+    echo "$ROBOT_NAME" | sudo tee /etc/hostname
 else
     echo "Unknown runtime error."
     exit 1
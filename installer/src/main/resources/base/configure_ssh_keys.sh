@@ -22,6 +22,9 @@
 #	We useIdentitiesOnly=yes to tell the host to only use the available
 #	authentication identity file configured in ssh_config files, even if
 #	ssh-agent offers more identities.
+#
+#	Every ssh call shares one master connection (ControlMaster), so only
+#	the first one pays for the handshake with the robot.
 
 # Parse args
 while [[ $# -gt 0 ]]
@@ -47,15 +50,24 @@ case $key in
 esac
 done
 
+# set_line, set_config, CONFIG and INCLUDE_LINE
+source "$(dirname "${BASH_SOURCE[0]}")/config_lines.sh"
+
+CONTROL_OPTS=(-o ControlMaster=auto
+              -o ControlPath="$HOME/.ssh/crunch-%r@%h:%p"
+              -o ControlPersist=60)
+
 # Check for network connectivity
 #ping $ROBOT_HOSTNAME -c 4
 # TODO grab output and use to provide feedback
 
-# First export robot username and hostname to bashrc
-echo "export ROBOT_HOSTNAME=${ROBOT_HOSTNAME}" >> ~/.bashrc
-echo "export ROBOT_USERNAME=${ROBOT_USERNAME}" >> ~/.bashrc
-echo "export ROBOT_HOSTNAME=${ROBOT_HOSTNAME}" >> ~/.xsessionrc
-echo "export ROBOT_USERNAME=${ROBOT_USERNAME}" >> ~/.xsessionrc
+# First save the robot username and hostname in the configuration
+set_config ROBOT_HOSTNAME "$ROBOT_HOSTNAME"
+set_config ROBOT_USERNAME "$ROBOT_USERNAME"
+for rc in ~/.bashrc ~/.xsessionrc
+do
+    set_line "$rc" "$INCLUDE_LINE" "$INCLUDE_LINE"
+done
 
 # If both files are present don't generate keys, use existing.
 if [[ -f ~/.ssh/id_rsa && -f ~/.ssh/id_rsa.pub ]]; 
@@ -64,7 +76,7 @@ then
         && cat ~/.ssh/id_rsa.pub | \
         sshpass -p "$ROBOT_PASSWORD" \
         ssh -vvv -o StrictHostKeyChecking=no \
-        -o IdentitiesOnly=yes \
+        -o IdentitiesOnly=yes "${CONTROL_OPTS[@]}" \
         $ROBOT_USERNAME@$ROBOT_HOSTNAME \
         "mkdir -p ~/.ssh && chmod 700 ~/.ssh && cat >> ~/.ssh/authorized_keys"
 
@@ -76,7 +88,7 @@ then
         && cat ~/.ssh/id_rsa.pub | \
         sshpass -p "$ROBOT_PASSWORD" \
         ssh -vvv -o StrictHostKeyChecking=no \
-        -o IdentitiesOnly=yes \
+        -o IdentitiesOnly=yes "${CONTROL_OPTS[@]}" \
         $ROBOT_USERNAME@$ROBOT_HOSTNAME \
         "mkdir -p ~/.ssh && chmod 700 ~/.ssh && cat >> ~/.ssh/authorized_keys"
 
@@ -91,18 +103,23 @@ fi
 
 # You can delete these keys via ssh-add -D
     
-# Search through remote's .bashrc file for catkin workspace filepath.
+# Copy the robot's install paths from its configuration.
 # Note:
 #	Vanilla ssh login only allows us to see a subset of the remote's
-#	environment variables. Specifically, we can only see variables listed
-#	under the remote's /.ssh/environment file. To bypass this problem,
-#	we search through the remote's /.bashrc file for the 'export' command
-#	associated with the environment variable of interest. We copy the
-#	complete export command into our very own /bashrc file.
-ROBOT_CATKIN=$(ssh -o StrictHostKeyChecking=no -o IdentitiesOnly=yes $ROBOT_USERNAME@$ROBOT_HOSTNAME 'cat ~/.bashrc | grep ROBOT_CATKIN')
-ROBOT_PROJECT_CRUNCH_PATH=$(ssh -o StrictHostKeyChecking=no -o IdentitiesOnly=yes $ROBOT_USERNAME@$ROBOT_HOSTNAME 'cat ~/.bashrc | grep ROBOT_PROJECT_CRUNCH_PATH')
+#	environment variables, so we read the robot's configuration file
+#	instead, and its .bashrc for robots installed before there was one.
+#	The configuration is read last so its settings win. Both files are
+#	read in a single round trip.
+ROBOT_EXPORTS=$(ssh -o StrictHostKeyChecking=no -o IdentitiesOnly=yes "${CONTROL_OPTS[@]}" \
+    "$ROBOT_USERNAME@$ROBOT_HOSTNAME" \
+    "cat ~/.bashrc ~/.config/project-crunch/config 2> /dev/null \
+        | grep -E '^export (ROBOT_CATKIN_PATH|ROBOT_PROJECT_CRUNCH_PATH)='")
+
+while read -r export_line
+do
+    [ -n "$export_line" ] || continue
+    set_line "$CONFIG" "${export_line%%=*}=" "$export_line"
+done <<< "$ROBOT_EXPORTS"
 
-echo "$ROBOT_CATKIN_PATH" >> ~/.bashrc
-echo "$ROBOT_PROJECT_CRUNCH_PATH" >> ~/.bashrc
-echo "$ROBOT_CATKIN_PATH" >> ~/.xsessionrc
-echo "$ROBOT_PROJECT_CRUNCH_PATH" >> ~/.xsessionrc
+# Close the shared connection now that we are done with the robot.
+ssh "${CONTROL_OPTS[@]}" -O exit "$ROBOT_USERNAME@$ROBOT_HOSTNAME" 2> /dev/null
@@ -0,0 +1,33 @@
+"""
+Shared fixtures for the installer's tests.
+
+The installer's modules import each other by name from
+installer/src/main/python, as they do when fbs runs them, so that directory
+goes on the path here.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "main", "python"))
+
+
+@pytest.fixture(scope="session")
+def qt_app():
+    '''
+    The QApplication for the tests: on the X display if there is one, else
+    on Qt's offscreen platform
+    '''
+    pytest.importorskip("PyQt5.QtWidgets")
+    from PyQt5.QtCore import QLibraryInfo
+    from PyQt5.QtWidgets import QApplication
+
+    if not os.environ.get("DISPLAY") and "QT_QPA_PLATFORM" not in os.environ:
+        # Qt aborts the whole process if the platform plugin is missing.
+        plugin = os.path.join(QLibraryInfo.location(QLibraryInfo.PluginsPath),
+                              "platforms", "libqoffscreen.so")
+        if not os.path.exists(plugin):
+            pytest.skip("No display and no offscreen Qt platform")
+        os.environ["QT_QPA_PLATFORM"] = "offscreen"
+    return QApplication.instance() or QApplication([sys.argv[0]])
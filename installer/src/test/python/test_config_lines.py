@@ -0,0 +1,44 @@
+import os
+import subprocess
+
+import pytest
+
+from install_steps import config_store
+
+HELPERS = os.path.join(os.path.dirname(__file__), "..", "..", "main", "resources", "base",
+                       "config_lines.sh")
+
+
+def _shell(script, home, config=None):
+    env = dict(os.environ, HOME=str(home))
+    env.pop("CRUNCH_CONFIG", None)
+    if config is not None:
+        env["CRUNCH_CONFIG"] = str(config)
+    return subprocess.run(["bash", "-c", 'source "$0"; ' + script, HELPERS], env=env,
+                          stdout=subprocess.PIPE, universal_newlines=True,
+                          check=True).stdout
+
+
+@pytest.mark.parametrize("config", [
+    None,
+    "{home}/.config/project-crunch/config",
+    "/{tmp}/crunch/config",
+    "/{tmp}/it's a config/config",
+])
+def test_include_line_reads_the_config_that_is_written(tmp_path, monkeypatch, config):
+    home = tmp_path / "home"
+    home.mkdir()
+    monkeypatch.setenv("HOME", str(home))
+    if config is not None:
+        config = config.format(home=home, tmp=tmp_path)
+    path = config or os.path.join(str(home), ".config", "project-crunch", "config")
+
+    line = _shell('echo "$INCLUDE_LINE"', home, config).strip()
+    assert line == config_store.include_line(path)
+
+    _shell("set_config ROBOT_HOSTNAME robot", home, config)
+    assert config_store.parse(open(path).read())["ROBOT_HOSTNAME"] == "robot"
+    sourced = subprocess.run(["bash", "-c", line + '; echo "$ROBOT_HOSTNAME"'],
+                             env=dict(os.environ, HOME=str(home)),
+                             stdout=subprocess.PIPE, universal_newlines=True)
+    assert sourced.stdout.strip() == "robot"
@@ -0,0 +1,128 @@
+import time
+
+import pytest
+
+from install_graph import (BLOCKED, DONE, FAILED, SKIPPED, STARTED, InstallError,
+                           InstallGraph, InstallManifest, Step, StubRunner)
+
+STEP_TIME = 0.2
+
+
+def _events(graph):
+    events = []
+    graph.progress = lambda name, state, elapsed: events.append((name, state))
+    return events
+
+
+def test_steps_run_after_their_dependencies():
+    steps = [Step("build", [["make"]], depends=["clone", "apt"]),
+             Step("clone", [["git", "clone", "openhmd"]], depends=["apt"]),
+             Step("apt", [["apt-get", "update"]], sudo=True)]
+    runner = StubRunner()
+    graph = InstallGraph(steps, runner=runner)
+    events = _events(graph)
+    assert graph.run()
+    assert runner.commands == ["sudo apt-get update", "git clone openhmd", "make"]
+    started = [name for name, state in events if state == STARTED]
+    assert started == ["apt", "clone", "build"]
+    assert all(graph.states[name] == DONE for name in graph.steps)
+
+
+def test_independent_steps_overlap():
+    steps = [Step("apt", [["apt-get", "update"]])]
+    steps += [Step("clone{}".format(i), [["git", "clone", str(i)]], depends=["apt"])
+              for i in range(4)]
+    runner = StubRunner(durations={"git": STEP_TIME})
+    graph = InstallGraph(steps, runner=runner, jobs=4)
+    start = time.monotonic()
+    assert graph.run()
+    # One after another they would take four times as long.
+    assert time.monotonic() - start < 2 * STEP_TIME
+    assert all(graph.timings["clone{}".format(i)] >= STEP_TIME for i in range(4))
+
+
+def test_failed_step_blocks_its_dependents_only():
+    steps = [Step("clone", [["git", "clone", "openhmd"]]),
+             Step("build", [["make"]], depends=["clone"]),
+             Step("install", [["make", "install"]], depends=["build"]),
+             Step("network", [["bash", "configure_network.sh"]])]
+    runner = StubRunner(failures={"git clone openhmd"})
+    graph = InstallGraph(steps, runner=runner)
+    assert not graph.run()
+    assert graph.states == {"clone": FAILED, "build": BLOCKED, "install": BLOCKED,
+                            "network": DONE}
+    assert isinstance(graph.errors["clone"], InstallError)
+    assert "make" not in runner.commands
+
+
+def test_unchanged_steps_are_skipped_on_the_next_run(tmp_path):
+    library = tmp_path / "libopenhmd.so"
+
+    def build(runner):
+        runner.run(["make"])
+        library.write_bytes(b"built")
+
+    def steps(clone_url):
+        return [Step("clone", [["git", "clone", clone_url]]),
+                Step("build", [build], depends=["clone"], inputs="make",
+                     outputs=[str(library)])]
+
+    manifest_path = str(tmp_path / "install-state.json")
+    runner = StubRunner()
+    assert InstallGraph(steps("openhmd"), runner=runner,
+                        manifest=InstallManifest(manifest_path)).run()
+    assert runner.commands == ["git clone openhmd", "make"]
+
+    # Nothing changed, so nothing runs; the manifest is read back from disk.
+    runner = StubRunner()
+    graph = InstallGraph(steps("openhmd"), runner=runner,
+                         manifest=InstallManifest(manifest_path))
+    assert graph.run()
+    assert runner.commands == []
+    assert graph.states == {"clone": SKIPPED, "build": SKIPPED}
+
+    # An output that went missing runs its step again.
+    library.unlink()
+    runner = StubRunner()
+    assert InstallGraph(steps("openhmd"), runner=runner,
+                        manifest=InstallManifest(manifest_path)).run()
+    assert runner.commands == ["make"]
+
+    # A changed step runs again, and so does everything after it.
+    runner = StubRunner()
+    assert InstallGraph(steps("openhmd-fork"), runner=runner,
+                        manifest=InstallManifest(manifest_path)).run()
+    assert runner.commands == ["git clone openhmd-fork", "make"]
+
+
+def test_failed_step_runs_again_on_the_next_run(tmp_path):
+    manifest = InstallManifest(str(tmp_path / "install-state.json"))
+    steps = [Step("clone", [["git", "clone", "openhmd"]])]
+    assert not InstallGraph(steps, runner=StubRunner(failures={"git clone openhmd"}),
+                            manifest=manifest).run()
+    runner = StubRunner()
+    assert InstallGraph(steps, runner=runner, manifest=manifest).run()
+    assert runner.commands == ["git clone openhmd"]
+
+
+def test_report_lists_steps_slowest_first():
+    steps = [Step("apt", [["apt-get", "update"]]),
+             Step("clone", [["git", "clone", "openhmd"]]),
+             Step("build", [["make"]], depends=["clone"])]
+    runner = StubRunner(durations={"git": STEP_TIME}, failures={"make"})
+    graph = InstallGraph(steps, runner=runner)
+    graph.run()
+    lines = {line.split()[0]: line for line in graph.report()}
+    assert list(lines)[0] == "clone"
+    assert [lines[name].split()[1] for name in ("clone", "build", "apt")] == [
+            DONE, FAILED, DONE]
+    assert float(lines["clone"].split()[2].rstrip("s")) >= STEP_TIME - 0.05
+    assert lines["build"].endswith("make failed")
+
+
+def test_bad_graphs_are_refused():
+    with pytest.raises(InstallError):
+        InstallGraph([Step("build", [["make"]], depends=["clone"])], runner=StubRunner())
+    with pytest.raises(InstallError):
+        InstallGraph([Step("a", [], depends=["b"]), Step("b", [], depends=["a"])],
+                     runner=StubRunner())
@@ -0,0 +1,91 @@
+import time
+
+import pytest
+
+pytest.importorskip("PyQt5")
+
+from PyQt5.QtCore import QEventLoop, QTimer  # noqa: E402
+
+from install_graph import CANCELLED, InstallGraph, Step, StubRunner  # noqa: E402
+from install_worker import InstallWorker, OutputBuffer  # noqa: E402
+
+# Seconds the fake install takes
+INSTALL_TIME = 2.0
+# Seconds between timer ticks, about a frame at 60 Hz
+TICK = 0.016
+# Milliseconds a tick may ever be late by
+MAX_LATE = 50.0
+
+
+def _noisy_step(output, seconds):
+    '''A step that prints as fast as apt does for seconds'''
+    def run(runner):
+        deadline = time.monotonic() + seconds
+        count = 0
+        while time.monotonic() < deadline:
+            count += 1
+            output.write("Unpacking fake-package-{} ...\n".format(count))
+            time.sleep(0.0005)
+    return run
+
+
+def _run(worker, timeout):
+    '''Run the event loop until worker finishes; returns what it emitted'''
+    loop = QEventLoop()
+    finished = []
+    worker.finished_install.connect(finished.append)
+    worker.finished_install.connect(loop.quit)
+    QTimer.singleShot(int(timeout * 1000), loop.quit)
+    worker.start()
+    loop.exec_()
+    worker.wait()
+    return finished
+
+
+def test_event_loop_keeps_ticking_during_a_long_install(qt_app):
+    output = OutputBuffer()
+    runner = StubRunner(durations={"sleep": INSTALL_TIME}, output=output.write)
+    steps = [Step("noisy", [_noisy_step(output, INSTALL_TIME)]),
+             Step("quiet", [["sleep", str(INSTALL_TIME)]])]
+    worker = InstallWorker(InstallGraph(steps, runner))
+    lateness = []
+    lines = []
+    expected = [time.monotonic() + TICK]
+
+    def on_tick():
+        # Drains the output like the window does.
+        now = time.monotonic()
+        lateness.append(max(0.0, now - expected[0]) * 1000)
+        expected[0] = now + TICK
+        lines.extend(output.drain()[0])
+
+    timer = QTimer()
+    timer.timeout.connect(on_tick)
+    timer.start(int(TICK * 1000))
+    try:
+        assert _run(worker, INSTALL_TIME + 5) == [True]
+    finally:
+        timer.stop()
+    assert len(lateness) > INSTALL_TIME / TICK / 2
+    assert max(lateness) < MAX_LATE
+    assert lines
+
+
+def test_cancel_stops_the_install(qt_app):
+    runner = StubRunner(durations={"sleep": 60})
+    graph = InstallGraph([Step("slow", [["sleep", "60"]]),
+                          Step("after", [["true"]], depends=["slow"])], runner)
+    worker = InstallWorker(graph)
+    QTimer.singleShot(100, worker.cancel)
+    start = time.monotonic()
+    assert _run(worker, 5) == [False]
+    assert time.monotonic() - start < 1.0
+    assert graph.states == {"slow": CANCELLED, "after": CANCELLED}
+
+
+def test_output_buffer_keeps_the_newest_lines():
+    output = OutputBuffer(maxlen=3)
+    output.write("1\n2\n3\n4\n")
+    output.write("5\n")
+    assert output.drain() == (["3", "4", "5"], 2)
+    assert output.drain() == ([], 0)
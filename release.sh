@@ -9,7 +9,7 @@
 if [ $# -lt 2 ];
 then
     echo "Usage:"
-    echo "\tbash release.sh <-v|--version version number of release>"
+    echo "\tbash release.sh <-v|--version version number of release> [--offline]"
     exit 1
 fi
 
@@ -23,6 +23,10 @@ case $key in
     shift # past argument
     shift # past value
     ;;
+    --offline)
+    OFFLINE=y
+    shift # past argument
+    ;;
 esac
 done
 
@@ -45,13 +49,22 @@ ln -s target/Project-Crunch/Project-Crunch Project-Crunch.run
 cd ../../../
 
 cd installer
-fbs freeze
+# The installer shares config_store.py with the launcher; PyInstaller finds
+# it on the path.
+PYTHONPATH="$(cd ../app/src/main/python && pwd)${PYTHONPATH:+:$PYTHONPATH}" fbs freeze
 cd ..
 mv installer/target/ build/Project-Crunch/Install/target
 cd build/Project-Crunch
 ln -s Install/target/Install/Install Install.run
 cd ../../
 
+# The installer finds a bundle directory next to its own
+if [ "$OFFLINE" == "y" ];
+then
+    python installer/src/main/python/offline_bundle.py build/Project-Crunch/bundle || exit 1
+    RELEASE_NAME=$RELEASE_NAME-offline
+fi
+
 # Create zip and tar in build folder
 cd build
 zip -r $RELEASE_NAME.zip Project-Crunch